@@ -0,0 +1,42 @@
+"""
+Configuration gunicorn (chargée automatiquement depuis le dossier du projet).
+Les options de la ligne de commande du Procfile restent prioritaires.
+
+Deux profils, choisis par GUNICORN_PROFIL :
+- « wsgi » (défaut) : workers gthread, WEB_CONCURRENCY processus de
+  GUNICORN_THREADS threads. Une génération de PDF ou un export n'immobilise
+  qu'un thread, et chaque processus partage un pool de DB_POOL_MAX connexions.
+- « asgi » : workers uvicorn sur monquestionnaire.asgi (écriture différée des
+  formulaires avec SOUMISSION_ASYNC=True).
+
+Connexions PostgreSQL au plus : WEB_CONCURRENCY × DB_POOL_MAX (+ run_workers).
+"""
+import os
+
+PROFILS = {
+    "wsgi": ("monquestionnaire.wsgi:application", "gthread"),
+    "asgi": ("monquestionnaire.asgi:application", "uvicorn.workers.UvicornWorker"),
+}
+
+profil = os.getenv("GUNICORN_PROFIL", "wsgi")
+if profil not in PROFILS:
+    raise RuntimeError(f"GUNICORN_PROFIL inconnu : {profil} (attendu : {', '.join(PROFILS)})")
+wsgi_app, worker_class = PROFILS[profil]
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "3"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    # Métriques : un fichier par worker, additionnés par /metrics ; on repart de zéro à chaque démarrage
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "monquestionnaire.settings")
+    import django
+
+    django.setup()
+    from questionnaire import metriques
+
+    metriques.vider()
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Mode asynchrone des formulaires (SOUMISSION_ASYNC=True), par exemple :
+    gunicorn monquestionnaire.asgi:application -k uvicorn.workers.UvicornWorker
+Le fil d'écriture différée démarre avec le worker et la file est vidée à son
+arrêt (événements « lifespan »), en plus du filet atexit.
 """
 
 import os
@@ -13,4 +18,25 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "monquestionnaire.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    if scope["type"] != "lifespan":
+        return await django_application(scope, receive, send)
+
+    from asgiref.sync import sync_to_async
+    from django.conf import settings
+
+    from questionnaire import ecriture_differee
+
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if settings.SOUMISSION_ASYNC:
+                ecriture_differee.demarrer()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await sync_to_async(ecriture_differee.arreter, thread_sensitive=False)()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
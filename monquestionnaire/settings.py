@@ -10,7 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -24,6 +28,9 @@ load_dotenv(dotenv_path=BASE_DIR / '.env')
 SECRET_KEY = os.environ.get('SECRET_KEY', 'changeme')
 DEBUG = os.environ.get('DEBUG', 'False') == 'True'
 
+# « manage.py test » : journaux hors du dépôt et de la sortie standard
+EN_TEST = sys.argv[1:2] == ['test']
+
 
 # --- ALLOWED_HOSTS ---
 if DEBUG:
@@ -54,11 +61,16 @@ INSTALLED_APPS = [
 
 # --- Middleware ---
 MIDDLEWARE = [
+    # En premier : mesure aussi le temps passé dans les autres middlewares
+    "questionnaire.metriques.MetriquesMiddleware",
+    "questionnaire.requetes_lentes.RequetesLentesMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Après l'authentification : ?profiler=1 est réservé au staff
+    "questionnaire.profiler.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -126,10 +138,39 @@ DATABASE_URL_MOD = urlunparse(
     (parsed.scheme, new_netloc, parsed.path, parsed.params, new_query, parsed.fragment)
 )
 
+# sslmode et l'hôte interne ne concernent que PostgreSQL : SQLite (dev, tests) garde son URL telle quelle
+if not parsed.scheme.startswith("postgres"):
+    DATABASE_URL_MOD = DATABASE_URL
+
+# --- Pool de connexions PostgreSQL (psycopg 3, voir gunicorn.conf.py) ---
+# Un pool par processus : au plus DB_POOL_MAX connexions par worker, donc
+# WEB_CONCURRENCY × DB_POOL_MAX au total, à garder sous max_connections de PostgreSQL.
+# Par défaut, une connexion par thread de worker (GUNICORN_THREADS).
+DB_POOL = os.getenv("DB_POOL", "True").lower() in ("1", "true", "yes")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", os.getenv("GUNICORN_THREADS", "4")))
+# Attente maximale (secondes) d'une connexion libre avant erreur
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connexions inutilisées fermées après DB_POOL_MAX_IDLE s, toutes renouvelées après DB_POOL_MAX_LIFETIME s
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+
 # --- Configuration finale ---
-DATABASES = {
-    "default": dj_database_url.parse(DATABASE_URL_MOD, conn_max_age=600)
-}
+if DB_POOL and parsed.scheme.startswith("postgres"):
+    # Avec le pool, Django rend la connexion à la fin de chaque requête (conn_max_age=0) ;
+    # conn_health_checks : chaque connexion est vérifiée avant d'être prêtée (coupure, redémarrage de PostgreSQL)
+    DATABASES = {"default": dj_database_url.parse(DATABASE_URL_MOD, conn_max_age=0, conn_health_checks=True)}
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": DB_POOL_MIN,
+        "max_size": DB_POOL_MAX,
+        "timeout": DB_POOL_TIMEOUT,
+        "max_idle": DB_POOL_MAX_IDLE,
+        "max_lifetime": DB_POOL_MAX_LIFETIME,
+    }
+else:
+    DATABASES = {
+        "default": dj_database_url.parse(DATABASE_URL_MOD, conn_max_age=600, conn_health_checks=True)
+    }
 
 
         # --- Validation des mots de passe ---
@@ -155,41 +196,159 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # --- Sécurité HTTPS pour prod ---
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SECURE_SSL_REDIRECT = not DEBUG
+# Prometheus interroge /metrics en HTTP simple depuis la machine
+SECURE_REDIRECT_EXEMPT = [r"^metrics$"]
 SESSION_COOKIE_SECURE = not DEBUG
 CSRF_COOKIE_SECURE = not DEBUG
 
 # --- Clé primaire par défaut ---
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
-import logging
+# --- Cache ---
+# Redis partagé entre les workers gunicorn si REDIS_URL est défini ; sinon cache
+# mémoire local (propre à chaque processus : une invalidation n'atteint alors que
+# le worker qui l'a faite, les autres attendent l'expiration du TTL).
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "monquestionnaire",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "monquestionnaire",
+        }
+    }
+
+# Durée de vie (secondes) des vues mises en cache : tableau de bord, listes, PDF vierge
+CACHE_TTL_VUES = int(os.getenv("CACHE_TTL_VUES", "60"))
+
+# --- API de synchronisation des tablettes hors ligne ---
+# Les tablettes doivent envoyer « Authorization: Bearer <jeton> » ; sans jeton l'API est fermée (503)
+API_SYNC_TOKEN = os.getenv("API_SYNC_TOKEN")
+# Développement local uniquement : API ouverte sans jeton
+API_SYNC_OUVERTE = os.getenv("API_SYNC_OUVERTE", "False").lower() in ("1", "true", "yes")
+API_LOT_MAX = int(os.getenv("API_LOT_MAX", "1000"))
+# Taille maximale du JSON une fois décompressé (octets)
+API_LOT_TAILLE_MAX = int(os.getenv("API_LOT_TAILLE_MAX", str(10 * 1024 * 1024)))
+
+# --- Liste des réponses (pagination par curseur) ---
+LISTE_REPONSES_TAILLE_PAGE = int(os.getenv("LISTE_REPONSES_TAILLE_PAGE", "50"))
+LISTE_REPONSES_TAILLE_MAX = int(os.getenv("LISTE_REPONSES_TAILLE_MAX", "500"))
+
+# --- Archive ZIP des fiches PDF : processus de rendu par worker, partagés par tous ses exports ---
+# Au plus WEB_CONCURRENCY × PDF_PROCESSUS processus de rendu (+ run_workers), quel que soit le nombre d'exports
+PDF_PROCESSUS = int(os.getenv("PDF_PROCESSUS", "2"))
+
+# --- Cache disque des fiches PDF (LRU, voir questionnaire.cache_pdf) ---
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "questionnaire_pdf"))
+PDF_CACHE_TAILLE_MAX = int(os.getenv("PDF_CACHE_TAILLE_MAX", str(500 * 1024 * 1024)))
+
+# --- Questionnaire PDF interactif, construit au déploiement (manage.py build_formulaire_pdf) ---
+FORMULAIRE_PDF_DIR = os.getenv("FORMULAIRE_PDF_DIR", os.path.join(BASE_DIR, "build"))
+
+# --- Tâches en arrière-plan (manage.py run_workers, voir questionnaire.taches) ---
+# Le dossier des résultats doit être partagé entre les workers et le serveur web.
+TACHES_DIR = os.getenv("TACHES_DIR", os.path.join(tempfile.gettempdir(), "questionnaire_taches"))
+TACHES_CONCURRENCE = int(os.getenv("TACHES_CONCURRENCE", "2"))
+TACHES_INTERVALLE = float(os.getenv("TACHES_INTERVALLE", "2"))
+TACHES_DELAI_ABANDON = int(os.getenv("TACHES_DELAI_ABANDON", "300"))
+TACHES_TENTATIVES_MAX = int(os.getenv("TACHES_TENTATIVES_MAX", "3"))
+TACHES_CONSERVATION_JOURS = int(os.getenv("TACHES_CONSERVATION_JOURS", "7"))
+
+# --- Métriques des requêtes (/metrics, voir questionnaire.metriques) ---
+METRIQUES_ACTIVES = os.getenv("METRIQUES_ACTIVES", "True").lower() in ("1", "true", "yes")
+# Un fichier par processus, additionnés à la lecture : dossier commun à tous les workers
+METRIQUES_DIR = os.getenv("METRIQUES_DIR", os.path.join(tempfile.gettempdir(), "questionnaire_metriques"))
+METRIQUES_INTERVALLE = float(os.getenv("METRIQUES_INTERVALLE", "1"))
+# Si défini, /metrics est aussi accessible à distance avec « Authorization: Bearer <jeton> »
+METRIQUES_TOKEN = os.getenv("METRIQUES_TOKEN")
+
+# --- Journal des requêtes SQL lentes (voir questionnaire.requetes_lentes) ---
+# Seuil en millisecondes ; 0 = désactivé (aucun coût)
+REQUETES_LENTES_SEUIL_MS = float(os.getenv("REQUETES_LENTES_SEUIL_MS", "0"))
+# Ajoute le plan EXPLAIN des SELECT lents (PostgreSQL)
+REQUETES_LENTES_EXPLAIN = os.getenv("REQUETES_LENTES_EXPLAIN", "False").lower() in ("1", "true", "yes")
+# Un fichier par processus (<REQUETES_LENTES_FICHIER>.<pid>), tous lus par manage.py requetes_lentes
+REQUETES_LENTES_FICHIER = os.getenv("REQUETES_LENTES_FICHIER", "requetes-lentes.log")
+
+# --- Profilage à la demande (voir questionnaire.profiler) ---
+# Désactivé par défaut : à activer le temps d'une investigation (PROFILER_ACTIF=1)
+PROFILER_ACTIF = os.getenv("PROFILER_ACTIF", "False").lower() in ("1", "true", "yes")
+PROFILER_DIR = os.getenv("PROFILER_DIR", os.path.join(tempfile.gettempdir(), "questionnaire_profils"))
+# Validité (secondes) des jetons de l'en-tête X-Profiler : courte, un jeton intercepté expire vite
+PROFILER_JETON_DUREE = int(os.getenv("PROFILER_JETON_DUREE", "300"))
+PROFILER_MAX_FICHIERS = int(os.getenv("PROFILER_MAX_FICHIERS", "50"))
+
+# --- Journalisation (voir questionnaire.journalisation) ---
+# Les threads des requêtes ne font que déposer les enregistrements dans une file ;
+# un thread par processus les écrit en JSON sur la sortie standard et dans LOG_FICHIER.<pid>.
+LOG_NIVEAU = os.getenv("LOG_NIVEAU", "INFO")
+# Un fichier à rotation par processus (<LOG_FICHIER>.<pid>) ; vide = sortie standard seulement
+LOG_FICHIER = os.getenv("LOG_FICHIER", "questionnaire.log")
+# Copie des journaux sur la sortie standard
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "True").lower() in ("1", "true", "yes")
+# Fraction des enregistrements INFO gardés (avertissements et erreurs : toujours)
+LOG_ECHANTILLON_INFO = float(os.getenv("LOG_ECHANTILLON_INFO", "1"))
+# Enregistrements en attente au plus ; au-delà ils sont abandonnés plutôt que de bloquer
+LOG_FILE_TAILLE = int(os.getenv("LOG_FILE_TAILLE", "10000"))
+
+if EN_TEST:
+    _journaux_tests = tempfile.mkdtemp(prefix="questionnaire_tests_journaux_")
+    atexit.register(shutil.rmtree, _journaux_tests, ignore_errors=True)
+    LOG_FICHIER = os.path.join(_journaux_tests, "questionnaire.log")
+    REQUETES_LENTES_FICHIER = os.path.join(_journaux_tests, "requetes-lentes.log")
+    LOG_CONSOLE = False
 
 LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {
+        "echantillon": {
+            "()": "questionnaire.journalisation.FiltreEchantillon",
+            "taux": LOG_ECHANTILLON_INFO,
         },
-        'file': {
-            'level': 'ERROR',
-            'class': 'logging.FileHandler',
-            'filename': 'django-error.log',
+    },
+    "handlers": {
+        "file": {
+            "()": "questionnaire.journalisation.GestionnaireFile",
+            "fichier": LOG_FICHIER,
+            "console": LOG_CONSOLE,
+            "taille_file": LOG_FILE_TAILLE,
+            "filters": ["echantillon"],
+        },
+        # Une entrée JSON par ligne, lue par manage.py requetes_lentes
+        "requetes_lentes": {
+            "()": "questionnaire.journalisation.GestionnaireFile",
+            "fichier": REQUETES_LENTES_FICHIER,
+            "console": False,
+            "format": "brut",
+            "taille_file": LOG_FILE_TAILLE,
         },
     },
-    'root': {
-        'handlers': ['console', 'file'],
-        'level': 'ERROR',
+    "root": {
+        "handlers": ["file"],
+        "level": "WARNING",
     },
-    'loggers': {
-        'django': {
-            'handlers': ['console', 'file'],
-            'level': 'ERROR',
-            'propagate': True,
+    "loggers": {
+        "django": {
+            "level": "WARNING",
+            "propagate": True,
         },
-        'questionnaire': {
-            'handlers': ['console', 'file'],
-            'level': 'ERROR',
-            'propagate': False,
+        "questionnaire": {
+            "handlers": ["file"],
+            "level": LOG_NIVEAU,
+            "propagate": False,
+        },
+        "questionnaire.requetes_lentes": {
+            "handlers": ["requetes_lentes"],
+            "level": "WARNING",
+            "propagate": False,
         },
     },
 }
@@ -203,3 +362,10 @@ LOGGING = {
 
 
 
+
+# --- Écriture différée des formulaires (mode ASGI, voir questionnaire.ecriture_differee) ---
+# Désactivée par défaut : les réponses en file sont perdues si le processus est tué brutalement.
+SOUMISSION_ASYNC = os.getenv("SOUMISSION_ASYNC", "False").lower() in ("1", "true", "yes")
+SOUMISSION_LOT = int(os.getenv("SOUMISSION_LOT", "100"))
+SOUMISSION_DELAI_MS = int(os.getenv("SOUMISSION_DELAI_MS", "200"))
+SOUMISSION_FILE_MAX = int(os.getenv("SOUMISSION_FILE_MAX", "10000"))
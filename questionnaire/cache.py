@@ -0,0 +1,127 @@
+"""
+Cache des vues en lecture (tableau de bord, liste des réponses, PDF vierge).
+
+- Les clés des vues qui dépendent des réponses incluent une « génération »
+  stockée dans le cache ; enregistrer une réponse change la génération, ce
+  qui invalide d'un coup toutes ces entrées (voir questionnaire.signals).
+- Protection contre l'effet de meute : chaque entrée porte sa propre date
+  d'expiration et reste en cache un peu plus longtemps. Quand elle expire,
+  un seul processus (verrou ``cache.add``) la recalcule pendant que les
+  autres continuent de servir l'ancienne valeur.
+- La clé d'une vue ne retient que les paramètres GET qu'elle lit : une
+  chaîne de requête arbitraire (``?x=1``, ``?x=2``...) retombe sur la même
+  entrée au lieu d'en créer une nouvelle et de forcer un calcul.
+"""
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+CLE_GENERATION = 'questionnaire:generation'
+
+# Durée pendant laquelle une valeur expirée peut encore être servie
+DELAI_GRACE = 30
+
+# Durée maximale d'un recalcul avant que le verrou ne soit libéré d'office
+DUREE_VERROU = 30
+
+# Attente maximale (secondes) quand aucune valeur n'est disponible et qu'un autre processus calcule
+ATTENTE_MAX = 2.0
+
+
+def generation():
+    """Génération courante des données (change à chaque nouvelle réponse)"""
+    valeur = cache.get(CLE_GENERATION)
+    if valeur is None:
+        valeur = time.time_ns()
+        cache.add(CLE_GENERATION, valeur, None)
+        valeur = cache.get(CLE_GENERATION, valeur)
+    return valeur
+
+
+def invalider():
+    """Invalide toutes les entrées qui dépendent des réponses"""
+    cache.set(CLE_GENERATION, time.time_ns(), None)
+
+
+def obtenir_ou_calculer(cle, calcul, ttl):
+    """
+    Retourne la valeur en cache pour ``cle`` ou la calcule avec ``calcul()``.
+    Un seul appelant recalcule une entrée expirée ; les autres servent
+    l'ancienne valeur (ou attendent brièvement s'il n'y en a pas).
+    """
+    entree = cache.get(cle)
+    if entree is not None and entree[0] > time.time():
+        return entree[1]
+
+    verrou = f'{cle}:verrou'
+    if cache.add(verrou, 1, DUREE_VERROU):
+        try:
+            valeur = calcul()
+            cache.set(cle, (time.time() + ttl, valeur), ttl + DELAI_GRACE)
+            return valeur
+        finally:
+            cache.delete(verrou)
+
+    if entree is not None:
+        return entree[1]
+
+    fin = time.monotonic() + ATTENTE_MAX
+    while time.monotonic() < fin:
+        time.sleep(0.05)
+        entree = cache.get(cle)
+        if entree is not None:
+            return entree[1]
+    return calcul()
+
+
+class _NonCachable(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def cle_vue(request, parametres):
+    """Chemin et paramètres retenus de la requête, dans l'ordre de ``parametres``"""
+    retenus = [(nom, request.GET[nom]) for nom in parametres if nom in request.GET]
+    return f"{request.path}?{urlencode(retenus)}" if retenus else request.path
+
+
+def cache_vue(prefixe, ttl=None, depend_des_reponses=True, parametres=()):
+    """
+    Met en cache la réponse d'une vue GET (contenu et en-têtes).
+    Seules les réponses 200 non streamées et sans cookie sont conservées.
+    ``parametres`` : noms des paramètres GET que lit la vue, seuls pris en
+    compte dans la clé.
+    """
+    def decorateur(vue):
+        @wraps(vue)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return vue(request, *args, **kwargs)
+
+            duree = ttl if ttl is not None else settings.CACHE_TTL_VUES
+            morceaux = ['questionnaire', prefixe, cle_vue(request, parametres)]
+            if depend_des_reponses:
+                morceaux.insert(1, str(generation()))
+            cle = ':'.join(morceaux)
+
+            def calcul():
+                response = vue(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming or response.cookies:
+                    raise _NonCachable(response)
+                return response.content, dict(response.items())
+
+            try:
+                contenu, entetes = obtenir_ou_calculer(cle, calcul, duree)
+            except _NonCachable as e:
+                return e.response
+
+            response = HttpResponse(contenu)
+            for nom, valeur in entetes.items():
+                response[nom] = valeur
+            return response
+        return wrapper
+    return decorateur
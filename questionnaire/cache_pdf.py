@@ -0,0 +1,202 @@
+"""
+Cache disque des fiches PDF des réponses.
+
+Une réponse n'est pas modifiée après soumission : sa fiche est rendue une
+fois puis servie depuis ``PDF_CACHE_DIR``. Le nom du fichier contient l'id et
+la version de la fiche (``<id>-<version>.pdf``) ; changer la mise en page ou
+les champs imprimés change la version, les anciens fichiers ne sont plus lus
+et partent à l'éviction.
+
+Éviction LRU bornée par ``PDF_CACHE_TAILLE_MAX`` : la date de modification
+d'un fichier est remise à jour à chaque lecture, et les fichiers les plus
+anciens sont supprimés quand la taille estimée dépasse la limite.
+Les succès / échecs sont comptés dans les métriques par processus
+(``questionnaire_cache_pdf_total{resultat=...}`` sur ``/metrics``, voir
+questionnaire.metriques), additionnées sur tous les workers. Les fichiers
+temporaires laissés par un rendu interrompu sont supprimés à l'éviction.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from questionnaire import exports, metriques, pdf
+
+METRIQUE = 'questionnaire_cache_pdf_total'
+SUCCES = 'succes'
+ECHEC = 'echec'
+
+# Après éviction, le cache est ramené à cette fraction de la taille maximale
+FRACTION_APRES_EVICTION = 0.9
+# Âge (secondes) au-delà duquel un fichier temporaire est orphelin (rendu interrompu)
+AGE_TEMPORAIRE_ORPHELIN = 3600
+
+_verrou = threading.Lock()
+_taille_estimee = None
+
+
+def version():
+    """Version des fiches : change avec la mise en page ou les champs imprimés"""
+    definition = json.dumps([pdf.VERSION_FICHE, exports.CHAMPS_PDF], ensure_ascii=False)
+    return hashlib.sha256(definition.encode()).hexdigest()[:12]
+
+
+def chemin(id):
+    return os.path.join(settings.PDF_CACHE_DIR, f'{id}-{version()}.pdf')
+
+
+def _compter(resultat):
+    metriques.compter(METRIQUE, (('resultat', resultat),))
+
+
+def obtenir(reponse):
+    """
+    Chemin de la fiche PDF de ``reponse`` dans le cache, rendue si absente.
+    """
+    fichier = chemin(reponse.pk)
+    try:
+        os.utime(fichier)
+        _compter(SUCCES)
+        return fichier
+    except FileNotFoundError:
+        pass
+
+    _compter(ECHEC)
+    valeurs = [getattr(reponse, nom) for nom, _ in exports.CHAMPS_PDF]
+    contenu = pdf.rendre_reponse(exports.lignes_pdf(valeurs))
+
+    os.makedirs(settings.PDF_CACHE_DIR, exist_ok=True)
+    # Écriture dans un fichier temporaire puis renommage : jamais de fiche à moitié écrite
+    descripteur, temporaire = tempfile.mkstemp(dir=settings.PDF_CACHE_DIR, suffix='.tmp')
+    with os.fdopen(descripteur, 'wb') as sortie:
+        sortie.write(contenu)
+    os.replace(temporaire, fichier)
+
+    _ajouter(len(contenu))
+    return fichier
+
+
+def ouvrir(reponse):
+    """Fiche PDF de ``reponse`` ouverte en lecture binaire (à fermer par l'appelant)"""
+    try:
+        return open(obtenir(reponse), 'rb')
+    except FileNotFoundError:
+        # Évincée entre-temps par un autre worker
+        return open(obtenir(reponse), 'rb')
+
+
+def supprimer(id):
+    """Retire du cache la fiche d'une réponse (modifiée ou supprimée)"""
+    try:
+        os.remove(chemin(id))
+    except FileNotFoundError:
+        pass
+
+
+def _fichiers():
+    """Liste (date de modification, taille, chemin) des fiches en cache"""
+    try:
+        entrees = list(os.scandir(settings.PDF_CACHE_DIR))
+    except FileNotFoundError:
+        return []
+    fichiers = []
+    for entree in entrees:
+        if not entree.name.endswith('.pdf'):
+            continue
+        try:
+            info = entree.stat()
+        except FileNotFoundError:
+            continue
+        fichiers.append((info.st_mtime, info.st_size, entree.path))
+    return fichiers
+
+
+def _supprimer_temporaires():
+    """Supprime les fichiers temporaires orphelins (worker tué pendant l'écriture d'une fiche)"""
+    limite = time.time() - AGE_TEMPORAIRE_ORPHELIN
+    try:
+        entrees = list(os.scandir(settings.PDF_CACHE_DIR))
+    except FileNotFoundError:
+        return
+    for entree in entrees:
+        if not entree.name.endswith('.tmp'):
+            continue
+        try:
+            if entree.stat().st_mtime < limite:
+                os.remove(entree.path)
+        except FileNotFoundError:
+            pass
+
+
+def _ajouter(taille):
+    """Compte une fiche écrite et évince si la taille estimée dépasse la limite"""
+    global _taille_estimee
+    with _verrou:
+        if _taille_estimee is None:
+            _taille_estimee = sum(t for _, t, _ in _fichiers())
+        else:
+            _taille_estimee += taille
+        if _taille_estimee > settings.PDF_CACHE_TAILLE_MAX:
+            # Rescan : l'estimation ne voit pas les écritures des autres workers
+            _taille_estimee = evincer()
+
+
+def evincer(taille_max=None):
+    """
+    Supprime les fiches les moins récemment utilisées jusqu'à repasser sous
+    ``FRACTION_APRES_EVICTION`` de la taille maximale, ainsi que les fichiers
+    temporaires orphelins. Retourne la taille restante.
+    """
+    if taille_max is None:
+        taille_max = settings.PDF_CACHE_TAILLE_MAX
+    _supprimer_temporaires()
+    fichiers = sorted(_fichiers())
+    total = sum(t for _, t, _ in fichiers)
+    if total <= taille_max:
+        return total
+
+    cible = taille_max * FRACTION_APRES_EVICTION
+    for _, taille, fichier in fichiers:
+        if total <= cible:
+            break
+        try:
+            os.remove(fichier)
+        except FileNotFoundError:
+            pass
+        total -= taille
+    return total
+
+
+def vider():
+    """Supprime toutes les fiches en cache ; retourne le nombre de fichiers supprimés"""
+    fichiers = _fichiers()
+    for _, _, fichier in fichiers:
+        try:
+            os.remove(fichier)
+        except FileNotFoundError:
+            pass
+    return len(fichiers)
+
+
+def statistiques():
+    """
+    Succès, échecs (depuis le démarrage du serveur, tous workers confondus),
+    taux de succès, nombre et taille des fiches en cache
+    """
+    compteurs = metriques.agreger()[METRIQUE]
+    succes = compteurs.get((('resultat', SUCCES),), 0)
+    echecs = compteurs.get((('resultat', ECHEC),), 0)
+    fichiers = _fichiers()
+    return {
+        'succes': succes,
+        'echecs': echecs,
+        'taux_succes': succes / (succes + echecs) if succes + echecs else 0,
+        'fichiers': len(fichiers),
+        'taille': sum(t for _, t, _ in fichiers),
+        'taille_max': settings.PDF_CACHE_TAILLE_MAX,
+        'version': version(),
+    }
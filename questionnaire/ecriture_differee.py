@@ -0,0 +1,141 @@
+"""
+Écriture différée (write-behind) des questionnaires soumis.
+
+En mode asynchrone (``SOUMISSION_ASYNC``), la vue valide le formulaire puis
+dépose la réponse dans une file en mémoire et répond tout de suite. Un fil
+d'écriture vide la file par lots : dès ``SOUMISSION_LOT`` réponses, ou au
+plus tard ``SOUMISSION_DELAI_MS`` millisecondes après la première réponse en
+attente. Une transaction et quelques INSERT par lot remplacent une
+transaction par réponse.
+
+La date de la réponse est celle de la soumission, pas celle de l'écriture
+du lot. Si la file est pleine, ``soumettre`` renvoie False et la vue enregistre de
+façon synchrone. À l'arrêt (lifespan ASGI ou fin du processus), la file est
+vidée avant de rendre la main.
+
+Les réponses en file sont perdues si le processus est tué brutalement
+(SIGKILL, OOM) : c'est le prix de la latence gagnée.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from questionnaire import ingestion
+
+logger = logging.getLogger(__name__)
+
+_FIN = object()
+
+_file = None
+_fil = None
+_verrou = threading.Lock()
+
+
+def demarrer():
+    """Démarre le fil d'écriture (idempotent)"""
+    global _file, _fil
+    with _verrou:
+        if _fil is not None and _fil.is_alive():
+            return
+        _file = queue.Queue(maxsize=settings.SOUMISSION_FILE_MAX)
+        _fil = threading.Thread(target=_boucle, args=(_file,), name='ecriture-differee', daemon=True)
+        _fil.start()
+
+
+def soumettre(reponse):
+    """
+    Dépose une réponse validée (non enregistrée) dans la file.
+    Retourne False si la file est pleine : l'appelant doit enregistrer lui-même.
+    """
+    if _fil is None or not _fil.is_alive():
+        demarrer()
+    if reponse.created_at is None:
+        reponse.created_at = timezone.now()
+    try:
+        _file.put_nowait(reponse)
+        return True
+    except queue.Full:
+        logger.warning("File d'écriture pleine : enregistrement synchrone")
+        return False
+
+
+def arreter(delai=30):
+    """Vide la file puis arrête le fil d'écriture"""
+    global _fil
+    with _verrou:
+        fil, _fil = _fil, None
+    if fil is None or not fil.is_alive():
+        return
+    _file.put(_FIN)
+    fil.join(delai)
+
+
+def en_attente():
+    """Nombre de réponses en attente d'écriture"""
+    return _file.qsize() if _file is not None else 0
+
+
+def _boucle(file):
+    taille_lot = settings.SOUMISSION_LOT
+    delai = settings.SOUMISSION_DELAI_MS / 1000
+    fin = False
+
+    while not fin:
+        premiere = file.get()
+        if premiere is _FIN:
+            break
+        lot = [premiere]
+        echeance = time.monotonic() + delai
+        while len(lot) < taille_lot:
+            restant = echeance - time.monotonic()
+            if restant <= 0:
+                break
+            try:
+                element = file.get(timeout=restant)
+            except queue.Empty:
+                break
+            if element is _FIN:
+                fin = True
+                break
+            lot.append(element)
+        _ecrire(lot)
+        # Avec le pool (CONN_MAX_AGE=0), la connexion y retourne pendant l'attente du lot suivant
+        close_old_connections()
+
+    # Arrêt : tout ce qui reste dans la file est écrit
+    restants = []
+    while True:
+        try:
+            element = file.get_nowait()
+        except queue.Empty:
+            break
+        if element is not _FIN:
+            restants.append(element)
+    if restants:
+        _ecrire(restants)
+
+
+def _ecrire(lot):
+    close_old_connections()
+    try:
+        ingestion.enregistrer(lot)
+        return
+    except Exception:
+        logger.exception("Échec de l'écriture d'un lot de %d réponse(s), nouvelle tentative une par une", len(lot))
+
+    # Une réponse fautive ne doit pas faire perdre tout le lot
+    for reponse in lot:
+        reponse.pk = None
+        try:
+            ingestion.enregistrer([reponse])
+        except Exception:
+            logger.exception("Réponse perdue : %s", reponse)
+
+
+atexit.register(arreter)
@@ -0,0 +1,512 @@
+"""
+Moteurs d'export des réponses au questionnaire.
+
+Les exports sont produits sous forme de générateurs : les lignes sont lues
+par lots via un curseur côté serveur et écrites par morceaux, de sorte que la
+mémoire reste constante quel que soit le nombre de réponses.
+
+Sur PostgreSQL (psycopg 3), le CSV est produit directement par le serveur avec
+``COPY ... TO STDOUT`` ; sur les autres bases (SQLite en local), on passe par
+l'ORM. Les deux chemins écrivent les mêmes octets : booléens ``True`` /
+``False``, dates-heures ISO 8601 en UTC à la microseconde, valeur absente ou
+texte vide en champ vide, fins de ligne ``\n``.
+
+Les formats colonnaires (Parquet, Arrow IPC) sont écrits par lots de lignes
+avec pyarrow, les champs à choix étant encodés en dictionnaire.
+
+L'archive ZIP des fiches PDF est rendue par un pool de processus (reportlab
+est limité par le GIL) et écrite au fil des PDF terminés. Le pool est unique
+par processus (``PDF_PROCESSUS`` processus, partagés par les exports
+simultanés) et démarré avec ``forkserver`` : pas de fork d'un worker dont les
+threads (requêtes, journalisation, métriques) tiennent des verrous.
+"""
+import csv
+import datetime
+import io
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import connections, models
+from django.db.models import Case, CharField, F, Func, Value, When
+from django.db.models.functions import NullIf
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from questionnaire import metriques, pdf
+from questionnaire.models import ReponseQuestionnaire
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # dépendance optionnelle : seuls les exports colonnaires en ont besoin
+    pyarrow = None
+
+# Colonnes exportées par défaut (toutes les colonnes de la table, hors colonnes techniques)
+CHAMPS_EXPORT = [f.name for f in ReponseQuestionnaire._meta.concrete_fields if f.name != 'cle_idempotence']
+
+# Nombre de lignes lues à chaque aller-retour avec la base
+TAILLE_LOT = 2000
+
+# Taille (en caractères) à partir de laquelle un morceau est envoyé au client
+TAILLE_MORCEAU = 64 * 1024
+
+# Nombre de lignes par lot (row group) dans les exports colonnaires
+TAILLE_LOT_COLONNAIRE = 50_000
+
+# Fiches PDF rendues par tâche envoyée au pool de processus
+TAILLE_LOT_PDF = 25
+
+# Formats colonnaires : (type MIME, extension du fichier)
+FORMATS_COLONNAIRES = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow'),
+}
+
+
+def champs_demandes(valeur):
+    """
+    Valide une projection de colonnes (ex. ``?fields=nom,ville,age``).
+    Retourne toutes les colonnes si aucune projection n'est demandée.
+    """
+    if not valeur:
+        return list(CHAMPS_EXPORT)
+
+    champs = [c.strip() for c in valeur.split(',') if c.strip()]
+    inconnus = [c for c in champs if c not in CHAMPS_EXPORT]
+    if inconnus:
+        raise ValueError(f"Colonnes inconnues : {', '.join(inconnus)}")
+    if not champs:
+        raise ValueError("Aucune colonne demandée")
+    return champs
+
+
+def parse_moment(valeur):
+    """Accepte une date (AAAA-MM-JJ) ou une date-heure ISO 8601 ; retourne une date-heure aware"""
+    moment = parse_datetime(valeur)
+    if moment is None:
+        jour = parse_date(valeur)
+        if jour is None:
+            raise ValueError(f"Date invalide : {valeur}")
+        moment = datetime.datetime.combine(jour, datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.get_default_timezone())
+    return moment
+
+
+def filtrer(parametres, queryset=None):
+    """
+    Filtre les réponses selon des paramètres de requête : ``depuis``,
+    ``jusqua`` (dates), ``ville``, ``sexe`` et ``ids`` (liste séparée par des virgules).
+    """
+    if queryset is None:
+        queryset = ReponseQuestionnaire.objects.all()
+    if parametres.get('depuis'):
+        queryset = queryset.filter(created_at__gte=parse_moment(parametres['depuis']))
+    if parametres.get('jusqua'):
+        queryset = queryset.filter(created_at__lt=parse_moment(parametres['jusqua']))
+    for champ in ('ville', 'sexe'):
+        if parametres.get(champ):
+            queryset = queryset.filter(**{champ: parametres[champ]})
+    if parametres.get('ids'):
+        try:
+            ids = [int(i) for i in parametres['ids'].split(',') if i.strip()]
+        except ValueError:
+            raise ValueError("ids doit être une liste d'entiers séparés par des virgules")
+        queryset = queryset.filter(id__in=ids)
+    return queryset
+
+
+def _format_csv(champ):
+    """Conversion d'une valeur de la colonne ``champ`` pour le CSV de l'ORM (identique au COPY)"""
+    if isinstance(champ, models.DateTimeField):
+        return lambda v: v.astimezone(datetime.timezone.utc).isoformat(timespec='microseconds') if v else v
+    return None
+
+
+def _ecrire_ligne(writer, tampon, ligne):
+    """
+    Écrit une ligne CSV terminée par ``\n``, avec les règles de guillemets de
+    COPY : ``writer`` termine ses lignes par ``\r\n`` pour mettre entre
+    guillemets tout champ contenant ``\r`` ou ``\n`` ; la fin de ligne est
+    ensuite remplacée.
+    """
+    if len(ligne) == 1 and ligne[0] in (None, ''):
+        # csv écrirait "" pour une ligne d'un seul champ vide ; COPY écrit une ligne vide
+        tampon.write('\n')
+        return
+    writer.writerow(ligne)
+    tampon.seek(tampon.tell() - 2)
+    tampon.truncate()
+    tampon.write('\n')
+
+
+def lignes_csv(champs, queryset=None):
+    """
+    Génère le CSV par morceaux de texte.
+    L'en-tête est émis avant la première requête SQL pour que le client
+    reçoive le premier octet immédiatement.
+    """
+    if queryset is None:
+        queryset = ReponseQuestionnaire.objects.all()
+
+    meta = ReponseQuestionnaire._meta
+    formats = [(i, f) for i, f in enumerate(_format_csv(meta.get_field(nom)) for nom in champs) if f]
+
+    tampon = io.StringIO()
+    writer = csv.writer(tampon, lineterminator='\r\n')
+    _ecrire_ligne(writer, tampon, champs)
+    yield tampon.getvalue()
+    tampon.seek(0)
+    tampon.truncate()
+
+    lignes = queryset.order_by('id').values_list(*champs).iterator(chunk_size=TAILLE_LOT)
+    for ligne in lignes:
+        if formats:
+            ligne = list(ligne)
+            for i, format in formats:
+                ligne[i] = format(ligne[i])
+        _ecrire_ligne(writer, tampon, ligne)
+        if tampon.tell() >= TAILLE_MORCEAU:
+            yield tampon.getvalue()
+            tampon.seek(0)
+            tampon.truncate()
+
+    if tampon.tell():
+        yield tampon.getvalue()
+
+
+class _IsoUtc(Func):
+    """Date-heure en texte ISO 8601 UTC à la microseconde, comme ``datetime.isoformat`` (PostgreSQL)"""
+    template = "to_char(%(expressions)s AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS.US\"+00:00\"')"
+    output_field = CharField()
+
+
+def _expression_copy(champ):
+    """Expression SELECT d'une colonne pour COPY, au format du CSV de l'ORM"""
+    if isinstance(champ, models.BooleanField):
+        return Case(
+            When(**{champ.name: True}, then=Value('True')),
+            When(**{champ.name: False}, then=Value('False')),
+            output_field=CharField(),
+        )
+    if isinstance(champ, models.DateTimeField):
+        return _IsoUtc(F(champ.name))
+    if isinstance(champ, (models.CharField, models.TextField)):
+        # COPY écrit "" pour un texte vide et rien pour NULL ; l'ORM écrit rien dans les deux cas
+        return NullIf(F(champ.name), Value(''), output_field=CharField())
+    return F(champ.name)
+
+
+def copie_disponible(queryset=None):
+    """Indique si la base utilisée permet l'export par COPY (PostgreSQL + psycopg 3)"""
+    if queryset is None:
+        queryset = ReponseQuestionnaire.objects.all()
+    connexion = connections[queryset.db]
+    if connexion.vendor != 'postgresql':
+        return False
+
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+
+def lignes_csv_copy(champs, queryset=None):
+    """
+    Génère le CSV (en octets) avec ``COPY (SELECT ...) TO STDOUT``, octet pour
+    octet identique à ``lignes_csv``. La requête est construite par l'ORM, les
+    filtres du queryset sont donc conservés.
+    """
+    if queryset is None:
+        queryset = ReponseQuestionnaire.objects.all()
+
+    meta = ReponseQuestionnaire._meta
+    # Alias distincts des noms de champs (interdits en annotation) ; l'en-tête est écrit ici
+    colonnes = {f'csv_{i}': _expression_copy(meta.get_field(nom)) for i, nom in enumerate(champs)}
+    sql, params = queryset.order_by('id').annotate(**colonnes).values_list(*colonnes).query.sql_with_params()
+    commande = f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, ENCODING 'UTF8')"
+
+    tampon = io.StringIO()
+    _ecrire_ligne(csv.writer(tampon, lineterminator='\r\n'), tampon, champs)
+    yield tampon.getvalue().encode()
+
+    # cursor.cursor.copy contourne execute_wrappers : la durée du COPY (lecture
+    # du flux par le client comprise) leur est transmise à la fin
+    connexion = connections[queryset.db]
+    with connexion.cursor() as cursor:
+        debut = time.perf_counter()
+        reussie = False
+        try:
+            with cursor.cursor.copy(commande, params or None) as copie:
+                for donnees in copie:
+                    yield bytes(donnees)
+            reussie = True
+        finally:
+            metriques.signaler_requete(connexion, commande, params, debut, time.perf_counter(), reussie)
+
+
+def encoder(morceaux, encoding='utf-8'):
+    """Encode des morceaux de texte en octets"""
+    for morceau in morceaux:
+        yield morceau.encode(encoding)
+
+
+def compresser_gzip(morceaux):
+    """Compresse à la volée des morceaux d'octets au format gzip"""
+    compresseur = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    premier = True
+    for morceau in morceaux:
+        donnees = compresseur.compress(morceau)
+        if premier:
+            # On vide le compresseur une fois pour envoyer l'en-tête sans attendre
+            donnees += compresseur.flush(zlib.Z_SYNC_FLUSH)
+            premier = False
+        if donnees:
+            yield donnees
+    yield compresseur.flush()
+
+
+def flux_csv(champs, compresse=False, queryset=None):
+    """Flux d'octets CSV, éventuellement compressé en gzip"""
+    if copie_disponible(queryset):
+        flux = lignes_csv_copy(champs, queryset)
+    else:
+        flux = encoder(lignes_csv(champs, queryset))
+    if compresse:
+        flux = compresser_gzip(flux)
+    return flux
+
+
+# --------------------------------------------------------------------
+# Exports colonnaires (Parquet / Arrow IPC)
+# --------------------------------------------------------------------
+class ExportIndisponible(Exception):
+    """Levée quand pyarrow n'est pas installé"""
+
+
+def type_arrow(champ):
+    """Type Arrow d'une colonne du modèle"""
+    if champ.choices:
+        # Peu de modalités distinctes : dictionnaire à index sur 8 bits
+        return pyarrow.dictionary(pyarrow.int8(), pyarrow.string())
+    if isinstance(champ, models.BooleanField):
+        return pyarrow.bool_()
+    if isinstance(champ, models.DateTimeField):
+        return pyarrow.timestamp('us', tz='UTC')
+    if isinstance(champ, (models.BigIntegerField, models.BigAutoField)):
+        return pyarrow.int64()
+    if isinstance(champ, models.IntegerField):
+        return pyarrow.int32()
+    return pyarrow.string()
+
+
+def schema_arrow(champs):
+    """Schéma Arrow correspondant aux colonnes demandées"""
+    if pyarrow is None:
+        raise ExportIndisponible("pyarrow n'est pas installé : export colonnaire indisponible")
+    meta = ReponseQuestionnaire._meta
+    return pyarrow.schema([(nom, type_arrow(meta.get_field(nom))) for nom in champs])
+
+
+def lots_arrow(champs, queryset=None, taille_lot=TAILLE_LOT_COLONNAIRE):
+    """
+    Génère des RecordBatch Arrow de ``taille_lot`` lignes au plus.
+    Les dictionnaires des champs à choix démarrent avec les modalités du
+    modèle et ne font que s'étendre d'un lot à l'autre (deltas), ce qui
+    garde des codes stables sur tout le fichier.
+    """
+    if queryset is None:
+        queryset = ReponseQuestionnaire.objects.all()
+
+    schema = schema_arrow(champs)
+    meta = ReponseQuestionnaire._meta
+    dictionnaires = {
+        nom: {valeur: index for index, (valeur, _) in enumerate(meta.get_field(nom).choices)}
+        for nom in champs if meta.get_field(nom).choices
+    }
+    lignes = queryset.order_by('id').values_list(*champs).iterator(chunk_size=TAILLE_LOT)
+
+    lot = []
+    for ligne in lignes:
+        lot.append(ligne)
+        if len(lot) >= taille_lot:
+            yield _lot_vers_arrow(lot, schema, dictionnaires)
+            lot = []
+    if lot:
+        yield _lot_vers_arrow(lot, schema, dictionnaires)
+
+
+def _lot_vers_arrow(lot, schema, dictionnaires):
+    colonnes = []
+    for valeurs, champ in zip(zip(*lot), schema):
+        codes = dictionnaires.get(champ.name)
+        if codes is None:
+            colonnes.append(pyarrow.array(valeurs, type=champ.type))
+            continue
+        indices = [None if v is None else codes.setdefault(v, len(codes)) for v in valeurs]
+        colonnes.append(pyarrow.DictionaryArray.from_arrays(
+            pyarrow.array(indices, type=champ.type.index_type),
+            pyarrow.array(list(codes), type=champ.type.value_type),
+        ))
+    return pyarrow.record_batch(colonnes, schema=schema)
+
+
+class _SortieFlux:
+    """Fichier en écriture seule dont le contenu est vidé au fur et à mesure"""
+
+    def __init__(self):
+        self.tampon = bytearray()
+        self.position = 0
+        self.closed = False
+
+    def write(self, donnees):
+        self.tampon += donnees
+        self.position += len(donnees)
+        return len(donnees)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vider(self):
+        donnees = bytes(self.tampon)
+        self.tampon.clear()
+        return donnees
+
+
+def flux_colonnaire(format, champs, queryset=None, avancer=None):
+    """
+    Flux d'octets Parquet ou Arrow IPC, produit lot par lot.
+    Les erreurs (pyarrow absent, format inconnu) sont levées dès l'appel.
+    ``avancer(n)`` est appelé avec le nombre de lignes de chaque lot écrit.
+    """
+    if format not in FORMATS_COLONNAIRES:
+        raise ValueError(f"Format colonnaire inconnu : {format}")
+    schema = schema_arrow(champs)
+    return _ecrire_colonnaire(format, schema, champs, queryset, avancer)
+
+
+def _ecrire_colonnaire(format, schema, champs, queryset, avancer=None):
+    sortie = _SortieFlux()
+    if format == 'parquet':
+        dictionnaires = [champ.name for champ in schema if pyarrow.types.is_dictionary(champ.type)]
+        writer = pyarrow.parquet.ParquetWriter(sortie, schema, compression='zstd', use_dictionary=dictionnaires)
+    else:
+        options = pyarrow.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+        writer = pyarrow.ipc.new_file(sortie, schema, options=options)
+
+    for lot in lots_arrow(champs, queryset):
+        writer.write_batch(lot)
+        if avancer:
+            avancer(lot.num_rows)
+        donnees = sortie.vider()
+        if donnees:
+            yield donnees
+
+    writer.close()
+    yield sortie.vider()
+
+
+# Champs imprimés sur la fiche PDF d'une réponse : (nom, libellé)
+CHAMPS_PDF = [(f.name, str(f.verbose_name)) for f in ReponseQuestionnaire._meta.fields if f.name != 'cle_idempotence']
+
+
+def lignes_pdf(valeurs):
+    """Lignes « libellé: valeur » de la fiche, dans l'ordre de CHAMPS_PDF"""
+    return [f"{libelle}: {valeur}" for (_, libelle), valeur in zip(CHAMPS_PDF, valeurs)]
+
+
+_verrou_pool = threading.Lock()
+# (pid, pool) : un pool hérité d'un fork (gunicorn --preload) n'est pas réutilisé
+_pool = None
+
+
+def pool_pdf():
+    """Pool de rendu des fiches PDF du processus, créé au premier usage"""
+    global _pool
+    with _verrou_pool:
+        if _pool is None or _pool[0] != os.getpid():
+            methode = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            contexte = multiprocessing.get_context(methode)
+            if methode == 'forkserver':
+                # reportlab importé une fois dans le serveur, pas dans chaque processus du pool
+                contexte.set_forkserver_preload(['questionnaire.pdf'])
+            _pool = (os.getpid(), ProcessPoolExecutor(settings.PDF_PROCESSUS, mp_context=contexte))
+        return _pool[1]
+
+
+def _abandonner_pool(pool):
+    """Oublie un pool cassé (processus tué) : le prochain export en recrée un"""
+    global _pool
+    with _verrou_pool:
+        if _pool is not None and _pool[1] is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def flux_zip_pdf(queryset=None, processus=None, avancer=None):
+    """
+    Archive ZIP des fiches PDF (``reponse_<id>.pdf``), produite en flux.
+    Les fiches sont rendues par lots dans le pool du processus (``pool_pdf()``) ;
+    au plus ``2 × processus`` lots de cet export sont en attente, la mémoire
+    reste donc bornée. Les fiches entrent dans l'archive dans l'ordre où elles
+    sont terminées. ``avancer(n)`` est appelé avec le nombre de fiches ajoutées.
+    """
+    if queryset is None:
+        queryset = ReponseQuestionnaire.objects.all()
+    processus = processus or settings.PDF_PROCESSUS
+
+    lignes = queryset.order_by('id').values_list('id', *(nom for nom, _ in CHAMPS_PDF)).iterator(chunk_size=TAILLE_LOT)
+    fiches = ((f'reponse_{ligne[0]}.pdf', lignes_pdf(ligne[1:])) for ligne in lignes)
+
+    sortie = _SortieFlux()
+    # Fichier non positionnable : zipfile écrit les tailles après chaque fiche
+    archive = zipfile.ZipFile(sortie, 'w', zipfile.ZIP_STORED)
+    pool = pool_pdf()
+    en_cours = set()
+
+    def ecrire(termines):
+        for tache in termines:
+            fiches = tache.result()
+            for nom, contenu in fiches:
+                archive.writestr(nom, contenu)
+            if avancer:
+                avancer(len(fiches))
+        return sortie.vider()
+
+    try:
+        lot = []
+        for fiche in fiches:
+            lot.append(fiche)
+            if len(lot) < TAILLE_LOT_PDF:
+                continue
+            en_cours.add(pool.submit(pdf.rendre_lot, lot))
+            lot = []
+            if len(en_cours) >= 2 * processus:
+                termines, en_cours = wait(en_cours, return_when=FIRST_COMPLETED)
+                yield ecrire(termines)
+        if lot:
+            en_cours.add(pool.submit(pdf.rendre_lot, lot))
+        while en_cours:
+            termines, en_cours = wait(en_cours, return_when=FIRST_COMPLETED)
+            yield ecrire(termines)
+    except BrokenProcessPool:
+        _abandonner_pool(pool)
+        raise
+    finally:
+        # Client déconnecté : les lots de cet export pas encore commencés sont abandonnés
+        for tache in en_cours:
+            tache.cancel()
+
+    archive.close()
+    yield sortie.vider()
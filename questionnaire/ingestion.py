@@ -0,0 +1,257 @@
+"""
+Validation et enregistrement en masse des réponses.
+
+Les règles sont celles de ``QuestionnaireForm`` : on réutilise ses champs de
+formulaire (``base_fields``) une fois pour toutes au lieu d'instancier un
+formulaire par ligne, puis la réponse passe par ``full_clean()`` comme une
+réponse saisie dans l'administration (l'unicité est laissée à la base).
+
+L'enregistrement se fait par lots (INSERT multi-lignes, ou COPY sur
+PostgreSQL pour les gros lots) et met à jour lui-même ce que les signaux
+feraient pour une réponse isolée (compteurs, options, cache).
+"""
+import time
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+
+from questionnaire import cache, metriques, options, rollups
+from questionnaire.forms import QuestionnaireForm
+from questionnaire.models import ReponseQuestionnaire
+
+CHAMPS_FORMULAIRE = QuestionnaireForm.base_fields
+
+# Valeurs acceptées par les champs à choix : une valeur valide est reprise telle
+# quelle sans parcourir la liste des choix ; les autres passent par clean() pour
+# obtenir le message d'erreur du formulaire.
+CHOIX_VALIDES = {
+    nom: {str(valeur) for valeur, _ in champ.choices if valeur != ''}
+    for nom, champ in CHAMPS_FORMULAIRE.items()
+    if isinstance(champ, forms.ChoiceField)
+}
+
+# Colonnes insérées (toutes sauf la clé primaire)
+COLONNES = [f for f in ReponseQuestionnaire._meta.concrete_fields if not f.primary_key]
+
+# En dessous, un INSERT multi-lignes coûte moins que la réservation des id et le COPY
+COPY_LIGNES_MIN = 1000
+
+
+def normaliser(valeur):
+    """Ramène une valeur JSON/CSV à ce qu'enverrait le formulaire HTML"""
+    if valeur is None:
+        return ''
+    if isinstance(valeur, (list, tuple)):
+        return ', '.join(str(v) for v in valeur if v is not None)
+    return valeur
+
+
+def valider(donnees):
+    """
+    Valide un dict de réponses avec les règles de QuestionnaireForm.
+    Retourne (valeurs nettoyées, None) ou (None, erreurs par champ).
+    Les clés inconnues sont ignorées. Fonction pure, utilisable dans un
+    processus séparé.
+    """
+    propres, erreurs = {}, {}
+    for nom, champ in CHAMPS_FORMULAIRE.items():
+        valeur = normaliser(donnees.get(nom))
+        if nom in CHOIX_VALIDES and valeur in CHOIX_VALIDES[nom]:
+            propres[nom] = valeur
+            continue
+        try:
+            propres[nom] = champ.clean(valeur)
+        except ValidationError as e:
+            erreurs[nom] = e.messages
+    if erreurs:
+        return None, erreurs
+    try:
+        ReponseQuestionnaire(**propres).full_clean(validate_unique=False, validate_constraints=False)
+    except ValidationError as e:
+        return None, e.message_dict
+    return propres, None
+
+
+def preparer(donnees):
+    """Comme valider(), mais retourne une ReponseQuestionnaire non enregistrée"""
+    propres, erreurs = valider(donnees)
+    if erreurs:
+        return None, erreurs
+    return ReponseQuestionnaire(**propres), None
+
+
+def _valeurs(reponse, connexion):
+    """Paramètres SQL d'une réponse, préparés par chaque champ comme le ferait save() (NULL tel quel)"""
+    valeurs = []
+    for f in COLONNES:
+        valeur = getattr(reponse, f.attname)
+        valeurs.append(None if valeur is None else f.get_db_prep_save(valeur, connexion))
+    return valeurs
+
+
+def _copie_possible(connexion):
+    if connexion.vendor != 'postgresql':
+        return False
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    return is_psycopg3
+
+
+def _inserer_copy(reponses, connexion):
+    """
+    ``COPY ... FROM STDIN`` : les id sont d'abord réservés dans la séquence de
+    la table (une requête), puis écrits avec les lignes. Les options cochées
+    ont besoin de ces id, que COPY ne sait pas renvoyer.
+    """
+    qn = connexion.ops.quote_name
+    meta = ReponseQuestionnaire._meta
+    commande = (
+        f"COPY {qn(meta.db_table)} ({', '.join(qn(f.column) for f in [meta.pk, *COLONNES])}) FROM STDIN"
+    )
+    with connexion.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+            [meta.db_table, meta.pk.column, len(reponses)],
+        )
+        ids = [pk for (pk,) in cursor.fetchall()]
+
+        # cursor.cursor.copy contourne execute_wrappers (voir metriques.signaler_requete)
+        debut = time.perf_counter()
+        reussie = False
+        try:
+            with cursor.cursor.copy(commande) as copie:
+                for pk, reponse in zip(ids, reponses):
+                    copie.write_row([pk, *_valeurs(reponse, connexion)])
+            reussie = True
+        finally:
+            metriques.signaler_requete(connexion, commande, None, debut, time.perf_counter(), reussie)
+    return ids
+
+
+def _inserer_values(reponses, connexion, batch_size):
+    """``INSERT ... VALUES (...), (...) RETURNING id`` par lots de ``batch_size``"""
+    qn = connexion.ops.quote_name
+    meta = ReponseQuestionnaire._meta
+    ligne_sql = '(' + ', '.join(['%s'] * len(COLONNES)) + ')'
+    ids = []
+    with connexion.cursor() as cursor:
+        for debut in range(0, len(reponses), batch_size):
+            lot = reponses[debut:debut + batch_size]
+            cursor.execute(
+                f"INSERT INTO {qn(meta.db_table)} ({', '.join(qn(f.column) for f in COLONNES)}) "
+                f"VALUES {', '.join([ligne_sql] * len(lot))} RETURNING {qn(meta.pk.column)}",
+                [valeur for reponse in lot for valeur in _valeurs(reponse, connexion)],
+            )
+            ids.extend(pk for (pk,) in cursor.fetchall())
+    return ids
+
+
+def inserer(reponses, batch_size=1000):
+    """
+    Insère des réponses et renseigne leur id : par COPY sur PostgreSQL (psycopg 3)
+    à partir de COPY_LIGNES_MIN réponses, sinon par instructions
+    ``INSERT ... VALUES (...), (...) RETURNING id``. Équivaut à bulk_create
+    sans le coût de compilation SQL de l'ORM pour chaque valeur ; repli sur
+    bulk_create si la base ne sait pas renvoyer les id d'une insertion multiple.
+    """
+    connexion = connections[router.db_for_write(ReponseQuestionnaire)]
+    if not connexion.features.can_return_rows_from_bulk_insert:
+        return ReponseQuestionnaire.objects.bulk_create(reponses, batch_size=batch_size)
+
+    maintenant = timezone.now()
+    for reponse in reponses:
+        if reponse.created_at is None:
+            reponse.created_at = maintenant
+
+    if len(reponses) >= COPY_LIGNES_MIN and _copie_possible(connexion):
+        ids = _inserer_copy(reponses, connexion)
+    else:
+        ids = _inserer_values(reponses, connexion, batch_size)
+    for reponse, pk in zip(reponses, ids):
+        reponse.pk = pk
+        reponse._state.adding = False
+        reponse._state.db = connexion.alias
+    return reponses
+
+
+def enregistrer(reponses, batch_size=1000):
+    """
+    Insère des réponses validées en lots, puis met à jour les compteurs du
+    tableau de bord et les options cochées, dans une même transaction.
+    Retourne les réponses créées (avec leur id).
+    """
+    if not reponses:
+        return []
+    with transaction.atomic(using=router.db_for_write(ReponseQuestionnaire)):
+        creees = inserer(reponses, batch_size=batch_size)
+        rollups.incrementer(creees)
+        options.synchroniser(creees)
+        transaction.on_commit(cache.invalider)
+    return creees
+
+
+def soumettre_lot(elements):
+    """
+    Enregistre un lot envoyé par une tablette : liste de
+    ``{"cle": clé d'idempotence, "donnees": {champ: valeur}}``.
+
+    Chaque élément est validé comme le formulaire ; les éléments valides dont
+    la clé est inconnue sont insérés ensemble dans une transaction. Une clé
+    déjà enregistrée (renvoi après une coupure réseau) n'est pas réinsérée.
+    Retourne un résultat par élément, dans l'ordre :
+    ``{"cle", "statut": "cree" | "doublon" | "invalide", "id" | "erreurs"}``.
+    """
+    longueur_cle = ReponseQuestionnaire._meta.get_field('cle_idempotence').max_length
+    resultats = []
+    nouvelles = {}  # clé -> (résultat, réponse à insérer)
+
+    for element in elements:
+        cle = element.get('cle') if isinstance(element, dict) else None
+        resultat = {'cle': cle}
+        resultats.append(resultat)
+
+        if not isinstance(cle, str) or not 0 < len(cle) <= longueur_cle:
+            resultat.update(statut='invalide', erreurs={'cle': [f"Clé d'idempotence requise ({longueur_cle} caractères max)"]})
+            continue
+        if cle in nouvelles:
+            resultat['statut'] = 'doublon'
+            continue
+
+        donnees = element.get('donnees')
+        if not isinstance(donnees, dict):
+            resultat.update(statut='invalide', erreurs={'donnees': ["Un objet est attendu"]})
+            continue
+        reponse, erreurs = preparer(donnees)
+        if erreurs:
+            resultat.update(statut='invalide', erreurs=erreurs)
+            continue
+        reponse.cle_idempotence = cle
+        nouvelles[cle] = (resultat, reponse)
+
+    # Une seconde tentative couvre le cas de deux synchronisations simultanées de la même clé
+    for tentative in range(2):
+        existantes = dict(
+            ReponseQuestionnaire.objects.filter(cle_idempotence__in=list(nouvelles))
+            .values_list('cle_idempotence', 'id')
+        )
+        for cle, identifiant in existantes.items():
+            resultat, _ = nouvelles.pop(cle)
+            resultat.update(statut='doublon', id=identifiant)
+        try:
+            enregistrer([reponse for _, reponse in nouvelles.values()])
+            break
+        except IntegrityError:
+            if tentative:
+                raise
+
+    for resultat, reponse in nouvelles.values():
+        resultat.update(statut='cree', id=reponse.pk)
+
+    # Doublons internes au lot : même id que le premier élément portant la clé
+    ids = {r['cle']: r['id'] for r in resultats if 'id' in r}
+    for resultat in resultats:
+        if resultat.get('statut') == 'doublon' and 'id' not in resultat:
+            resultat['id'] = ids.get(resultat['cle'])
+
+    return resultats
@@ -0,0 +1,182 @@
+"""
+Journalisation non bloquante, en JSON.
+
+``GestionnaireFile`` est le seul gestionnaire vu par les threads des
+requêtes : il dépose l'enregistrement dans une file bornée (sans jamais
+attendre : file pleine, l'enregistrement est compté comme perdu) et un
+``QueueListener`` l'écrit depuis son propre thread sur la sortie standard
+et/ou dans un fichier à rotation.
+
+Chaque processus (worker gunicorn) écrit son propre fichier, ``<fichier>.<pid>``,
+et le fait tourner seul (``<fichier>.<pid>.1``...) : une rotation partagée entre
+processus écraserait les fichiers des autres. ``fichiers()`` les liste tous.
+
+- ``FormatJSON`` : un objet JSON par ligne (moment, niveau, logger, message,
+  champs passés en ``extra``, exception) ; les champs sensibles (réponses
+  personnelles, secrets) sont masqués.
+- ``FiltreEchantillon`` : ne garde qu'une fraction des enregistrements INFO
+  et en dessous ; les avertissements et erreurs sont toujours gardés.
+"""
+import copy
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+# Champs masqués dans les ``extra`` et les dictionnaires passés en argument
+CHAMPS_SENSIBLES = {
+    'nom', 'age', 'ville', 'profession', 'suggestions', 'commentaires', 'email',
+    'password', 'mot_de_passe', 'token', 'jeton', 'authorization', 'cookie', 'csrfmiddlewaretoken',
+}
+MASQUE = '***'
+
+# Attributs standard d'un LogRecord (le reste vient de ``extra``)
+_ATTRIBUTS_STANDARD = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def masquer(valeur):
+    """Copie de ``valeur`` (dictionnaires et listes imbriqués) avec les champs sensibles masqués"""
+    if isinstance(valeur, dict):
+        return {
+            cle: MASQUE if str(cle).lower() in CHAMPS_SENSIBLES else masquer(v) for cle, v in valeur.items()
+        }
+    if isinstance(valeur, (list, tuple)):
+        return [masquer(v) for v in valeur]
+    return valeur
+
+
+class FormatJSON(logging.Formatter):
+    """Un objet JSON par enregistrement"""
+
+    def format(self, record):
+        entree = {
+            'moment': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'niveau': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'ligne': record.lineno,
+            'processus': record.process,
+        }
+        for cle, valeur in vars(record).items():
+            if cle not in _ATTRIBUTS_STANDARD and not cle.startswith('_'):
+                entree[cle] = MASQUE if cle.lower() in CHAMPS_SENSIBLES else masquer(valeur)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entree['exception'] = record.exc_text
+        return json.dumps(entree, ensure_ascii=False, default=str)
+
+
+class FiltreEchantillon(logging.Filter):
+    """Garde une fraction ``taux`` (0 à 1) des enregistrements de niveau <= ``niveau``"""
+
+    def __init__(self, taux=1.0, niveau='INFO'):
+        super().__init__()
+        self.taux = float(taux)
+        self.niveau = logging.getLevelName(niveau) if isinstance(niveau, str) else niveau
+
+    def filter(self, record):
+        return record.levelno > self.niveau or self.taux >= 1 or random.random() < self.taux
+
+
+def fichier_processus(fichier, pid=None):
+    """Fichier du processus ``pid`` (défaut : le processus courant)"""
+    return f'{fichier}.{pid or os.getpid()}'
+
+
+def fichiers(fichier):
+    """
+    Fichiers de tous les processus pour ``fichier`` et leurs rotations : par
+    processus, du plus ancien au plus récent. ``fichier`` lui-même est inclus
+    s'il existe (journal écrit avant le passage aux fichiers par processus).
+    """
+    trouves = []
+    for chemin in glob.glob(glob.escape(fichier) + '.*'):
+        suffixe = chemin[len(fichier) + 1:].split('.')
+        if len(suffixe) > 2 or not all(partie.isdigit() for partie in suffixe):
+            continue
+        pid, rotation = int(suffixe[0]), int(suffixe[1]) if len(suffixe) == 2 else 0
+        trouves.append(((pid, -rotation), chemin))
+    return ([fichier] if os.path.exists(fichier) else []) + [chemin for _, chemin in sorted(trouves)]
+
+
+class GestionnaireFile(logging.handlers.QueueHandler):
+    """
+    Dépose les enregistrements dans une file ; un thread les écrit sur la
+    sortie standard (``console``) et/ou dans ``fichier``.<pid> (rotation à
+    ``max_octets``, ``rotations`` anciens fichiers gardés).
+    ``format`` : 'json' ou 'brut' (message seul).
+    """
+
+    def __init__(self, fichier=None, console=True, format='json', max_octets=10 * 1024 * 1024, rotations=5,
+                 taille_file=10000):
+        self.taille_file = taille_file
+        super().__init__(queue.Queue(taille_file))
+        self.formateur = FormatJSON() if format == 'json' else logging.Formatter('%(message)s')
+        self.fichier = fichier
+        self.max_octets = max_octets
+        self.rotations = rotations
+        self.console = logging.StreamHandler(sys.stdout) if console else None
+        if self.console:
+            self.console.setFormatter(self.formateur)
+        self.cibles = []
+        self.perdus = 0
+        self._demarrer()
+
+    def _demarrer(self):
+        self._pid = os.getpid()
+        for cible in self.cibles:
+            if cible is not self.console:
+                # Fichier du processus parent (fork) : ce processus écrit le sien
+                cible.close()
+        self.cibles = [self.console] if self.console else []
+        if self.fichier:
+            cible = logging.handlers.RotatingFileHandler(
+                fichier_processus(self.fichier), maxBytes=self.max_octets, backupCount=self.rotations,
+                encoding='utf-8', delay=True,
+            )
+            cible.setFormatter(self.formateur)
+            self.cibles.append(cible)
+        self.listener = logging.handlers.QueueListener(self.queue, *self.cibles, respect_handler_level=True)
+        self.listener.start()
+        self._actif = True
+
+    def prepare(self, record):
+        # Message et exception mis en forme ici : les arguments peuvent changer après l'appel
+        record = copy.copy(record)
+        if isinstance(record.args, dict):
+            record.args = masquer(record.args)
+        elif isinstance(record.args, tuple):
+            record.args = tuple(masquer(argument) for argument in record.args)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if os.getpid() != self._pid:
+            # Processus fils (fork) : le thread d'écriture n'a pas suivi
+            self.queue = queue.Queue(self.taille_file)
+            self._demarrer()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.perdus += 1
+
+    def close(self):
+        if self._actif and os.getpid() == self._pid:
+            # Vide la file avant l'arrêt du processus (logging.shutdown)
+            self._actif = False
+            self.listener.stop()
+            if self.perdus:
+                sys.stderr.write(f"Journalisation : {self.perdus} enregistrement(s) perdu(s), file pleine\n")
+        for cible in self.cibles:
+            cible.close()
+        super().close()
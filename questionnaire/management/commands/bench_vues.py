@@ -0,0 +1,226 @@
+import json
+import platform
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.forms.models import model_to_dict
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from questionnaire import cache_pdf, ingestion, pdf
+from questionnaire.management.commands.seed_reponses import Generateur
+from questionnaire.models import ReponseQuestionnaire
+
+# Scénarios mesurés : nom -> (méthode, nom d'URL, paramètres GET)
+SCENARIOS = {
+    'remplir_get': ('GET', 'remplir_formulaire', {}),
+    'remplir_post': ('POST', 'remplir_formulaire', {}),
+    'dashboard': ('GET', 'dashboard', {}),
+    'liste_reponses': ('GET', 'liste_reponses', {}),
+    'export_csv': ('GET', 'export_reponses_csv', {}),
+    'generate_pdf': ('GET', 'generate-pdf', {}),
+    'generate_pdf_reponse': ('GET', 'generate_pdf_from_response', {}),
+}
+
+# Métriques comparées en mode régression (plus petit = meilleur)
+METRIQUES = ['p50_ms', 'p95_ms', 'p99_ms', 'moyenne_ms', 'memoire_pic_ko']
+
+
+def percentile(valeurs, p):
+    """Percentile par interpolation linéaire (valeurs triées)"""
+    if len(valeurs) == 1:
+        return valeurs[0]
+    rang = (len(valeurs) - 1) * p / 100
+    bas = int(rang)
+    haut = min(bas + 1, len(valeurs) - 1)
+    return valeurs[bas] + (valeurs[haut] - valeurs[bas]) * (rang - bas)
+
+
+def reinitialiser_caches():
+    """Vide les caches de l'application : on mesure le travail de la vue, pas un succès de cache"""
+    cache.clear()
+    pdf._vierge.clear()
+    cache_pdf.vider()
+
+
+def comparer(resultats, reference, metrique, seuil):
+    """Liste des régressions (taille, scénario, référence, mesure) au-delà de ``seuil`` (fraction)"""
+    regressions = []
+    for taille, vues in resultats.items():
+        for nom, mesures in vues.items():
+            avant = reference.get(taille, {}).get(nom, {}).get(metrique)
+            if avant and mesures[metrique] > avant * (1 + seuil):
+                regressions.append((taille, nom, avant, mesures[metrique]))
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure latence (percentiles), débit et mémoire de chaque vue à plusieurs tailles de table, "
+        "dans une base de test jetable. Résultats en JSON ; --reference fait échouer en cas de régression."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tailles', default='1000,10000', help="Nombres de réponses en base, séparés par des virgules")
+        parser.add_argument('--requetes', type=int, default=30, help="Requêtes mesurées par scénario et par taille")
+        parser.add_argument('--echauffement', type=int, default=3, help="Requêtes non mesurées avant chaque scénario")
+        parser.add_argument('--scenarios', help=f"Sous-ensemble de : {', '.join(SCENARIOS)}")
+        parser.add_argument('--chaud', action='store_true', help="Laisse les caches de l'application actifs entre les requêtes")
+        parser.add_argument('--seed', type=int, default=42, help="Graine des données générées")
+        parser.add_argument('-o', '--output', help="Fichier JSON de résultats (défaut : sortie standard)")
+        parser.add_argument('--reference', help="Résultats de référence (JSON) : échoue si une vue a régressé")
+        parser.add_argument('--seuil', type=float, default=0.2, help="Régression tolérée en fraction (défaut : 0.2 = +20 %%)")
+        parser.add_argument('--metrique', default='p50_ms', choices=METRIQUES, help="Métrique comparée à la référence")
+
+    def handle(self, *args, **options):
+        try:
+            tailles = sorted({int(t) for t in options['tailles'].split(',') if t.strip()})
+        except ValueError:
+            raise CommandError("--tailles : liste d'entiers attendue")
+        scenarios = list(SCENARIOS)
+        if options['scenarios']:
+            scenarios = [s.strip() for s in options['scenarios'].split(',') if s.strip()]
+            inconnus = set(scenarios) - set(SCENARIOS)
+            if inconnus:
+                raise CommandError(f"Scénarios inconnus : {', '.join(sorted(inconnus))}")
+
+        reference = None
+        if options['reference']:
+            with open(options['reference']) as fichier:
+                reference = json.load(fichier)['resultats']
+
+        setup_test_environment()
+        anciennes_bases = setup_databases(verbosity=0, interactive=False)
+        try:
+            with tempfile.TemporaryDirectory() as dossier, override_settings(PDF_CACHE_DIR=dossier):
+                resultats = self._mesurer(tailles, scenarios, options)
+        finally:
+            teardown_databases(anciennes_bases, verbosity=0)
+            teardown_test_environment()
+
+        rapport = {
+            'meta': {
+                'date': timezone.now().isoformat(),
+                'base': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'plateforme': platform.platform(),
+                'requetes': options['requetes'],
+                'caches': 'chauds' if options['chaud'] else 'froids',
+                'rss_max_ko': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            },
+            'resultats': resultats,
+        }
+        sortie = json.dumps(rapport, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as fichier:
+                fichier.write(sortie + '\n')
+        else:
+            self.stdout.write(sortie)
+
+        if reference is not None:
+            regressions = comparer(resultats, reference, options['metrique'], options['seuil'])
+            for taille, nom, avant, apres in regressions:
+                self.stderr.write(f"{nom} @ {taille} : {options['metrique']} {avant:.2f} → {apres:.2f} (+{apres / avant - 1:.0%})")
+            if regressions:
+                raise CommandError(f"{len(regressions)} régression(s) au-delà de {options['seuil']:.0%}")
+            self.stderr.write(self.style.SUCCESS("Aucune régression par rapport à la référence"))
+
+    def _mesurer(self, tailles, scenarios, options):
+        generateur = Generateur(options['seed'], timezone.now(), 365)
+        client = Client()
+        resultats = {}
+        en_base = 0
+
+        for taille in tailles:
+            while en_base < taille:
+                lot = min(5000, taille - en_base)
+                ingestion.enregistrer([generateur.reponse() for _ in range(lot)])
+                en_base += lot
+            self.stderr.write(f"--- {taille} réponses")
+
+            contexte = {
+                'id': ReponseQuestionnaire.objects.order_by('id').values_list('id', flat=True).first(),
+                'formulaire': {
+                    cle: valeur for cle, valeur in model_to_dict(generateur.reponse()).items() if valeur is not None
+                },
+            }
+            resultats[str(taille)] = {}
+            for nom in scenarios:
+                mesures = self._scenario(client, nom, contexte, options)
+                resultats[str(taille)][nom] = mesures
+                self.stderr.write(
+                    f"{nom:22} p50 {mesures['p50_ms']:8.2f} ms  p95 {mesures['p95_ms']:8.2f} ms  "
+                    f"{mesures['debit_rps']:8.1f} req/s  pic {mesures['memoire_pic_ko']:8.0f} Ko  "
+                    f"{mesures['requetes_sql']} requête(s)"
+                )
+            # Les POST ont ajouté des réponses
+            en_base = ReponseQuestionnaire.objects.count()
+        return resultats
+
+    def _scenario(self, client, nom, contexte, options):
+        methode, url_nom, parametres = SCENARIOS[nom]
+        url = reverse(url_nom, kwargs={'id': contexte['id']} if url_nom == 'generate_pdf_from_response' else None)
+
+        def requete():
+            if methode == 'POST':
+                response = client.post(url, contexte['formulaire'], secure=True)
+            else:
+                response = client.get(url, parametres, secure=True)
+            taille = 0
+            if response.streaming:
+                for morceau in response.streaming_content:
+                    taille += len(morceau)
+            else:
+                taille = len(response.content)
+            if response.status_code >= 400:
+                raise CommandError(f"{nom} : HTTP {response.status_code}")
+            return taille
+
+        for _ in range(options['echauffement']):
+            requete()
+
+        durees = []
+        for _ in range(options['requetes']):
+            if not options['chaud']:
+                reinitialiser_caches()
+            t0 = time.perf_counter()
+            octets = requete()
+            durees.append((time.perf_counter() - t0) * 1000)
+
+        # Passe séparée (tracemalloc ralentit) : pic mémoire Python et requêtes SQL d'une requête
+        if not options['chaud']:
+            reinitialiser_caches()
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as sql:
+                requete()
+            _, pic = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        durees.sort()
+        return {
+            'p50_ms': round(percentile(durees, 50), 3),
+            'p95_ms': round(percentile(durees, 95), 3),
+            'p99_ms': round(percentile(durees, 99), 3),
+            'moyenne_ms': round(statistics.fmean(durees), 3),
+            'max_ms': round(durees[-1], 3),
+            # Client unique : débit séquentiel (hors remise à zéro des caches)
+            'debit_rps': round(1000 * len(durees) / sum(durees), 1),
+            'octets': octets,
+            'memoire_pic_ko': round(pic / 1024, 1),
+            'requetes_sql': len(sql),
+        }
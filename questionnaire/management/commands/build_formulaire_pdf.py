@@ -0,0 +1,21 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from questionnaire import utils
+
+
+class Command(BaseCommand):
+    help = (
+        "Construit le questionnaire PDF interactif (à lancer au déploiement, après collectstatic) "
+        "et supprime les fichiers des versions précédentes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forcer', action='store_true', help="Reconstruit même si le fichier de cette version existe")
+
+    def handle(self, *args, **options):
+        fichier = utils.formulaire_interactif(forcer=options['forcer'])
+        for ancien in utils.supprimer_anciennes_versions():
+            self.stdout.write(f"Ancienne version supprimée : {ancien}")
+        self.stdout.write(self.style.SUCCESS(f"{fichier} ({os.path.getsize(fichier)} octets, version {utils.version()})"))
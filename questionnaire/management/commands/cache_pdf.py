@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from questionnaire import cache_pdf
+
+
+class Command(BaseCommand):
+    help = "Statistiques du cache disque des fiches PDF (succès, échecs, taille), éviction ou purge"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--evincer', action='store_true', help="Applique l'éviction LRU maintenant")
+        parser.add_argument('--vider', action='store_true', help="Supprime toutes les fiches")
+
+    def handle(self, *args, **options):
+        if options['vider']:
+            self.stdout.write(self.style.SUCCESS(f"{cache_pdf.vider()} fiche(s) supprimée(s)"))
+        elif options['evincer']:
+            self.stdout.write(self.style.SUCCESS(f"Taille après éviction : {cache_pdf.evincer()} octets"))
+
+        stats = cache_pdf.statistiques()
+        self.stdout.write(
+            f"Succès : {stats['succes']}, échecs : {stats['echecs']} "
+            f"(taux de succès {stats['taux_succes']:.1%})\n"
+            f"Fiches : {stats['fichiers']}, {stats['taille']} / {stats['taille_max']} octets "
+            f"(version {stats['version']})"
+        )
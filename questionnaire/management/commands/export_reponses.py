@@ -0,0 +1,63 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from questionnaire import exports
+from questionnaire.models import ReponseQuestionnaire
+
+
+def parse_depuis(valeur):
+    """Accepte une date (AAAA-MM-JJ) ou une date-heure ISO 8601"""
+    try:
+        return exports.parse_moment(valeur)
+    except ValueError:
+        raise CommandError(f"Date invalide pour --since : {valeur}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporte les réponses au questionnaire hors requête web : CSV (COPY sur PostgreSQL, ORM sinon), "
+        "Parquet ou Arrow IPC"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', default='csv', choices=['csv', *exports.FORMATS_COLONNAIRES], help="Format d'export")
+        parser.add_argument('--since', help="N'exporte que les réponses créées depuis cette date")
+        parser.add_argument('--fields', help="Colonnes à exporter, séparées par des virgules")
+        parser.add_argument('--gzip', action='store_true', help="Compresse la sortie CSV en gzip")
+        parser.add_argument('-o', '--output', default='-', help="Fichier de sortie ('-' pour la sortie standard)")
+
+    def handle(self, *args, **options):
+        try:
+            champs = exports.champs_demandes(options['fields'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        queryset = ReponseQuestionnaire.objects.all()
+        if options['since']:
+            queryset = queryset.filter(created_at__gte=parse_depuis(options['since']))
+
+        if options['format'] == 'csv':
+            flux = exports.flux_csv(champs, compresse=options['gzip'], queryset=queryset)
+            moteur = 'COPY' if exports.copie_disponible(queryset) else 'ORM'
+        else:
+            try:
+                flux = exports.flux_colonnaire(options['format'], champs, queryset=queryset)
+            except exports.ExportIndisponible as e:
+                raise CommandError(str(e))
+            moteur = options['format']
+
+        if options['output'] == '-':
+            self._ecrire(flux, sys.stdout.buffer)
+        else:
+            with open(options['output'], 'wb') as fichier:
+                taille = self._ecrire(flux, fichier)
+            self.stderr.write(f"{options['output']} : {taille} octets écrits ({moteur})")
+
+    def _ecrire(self, flux, fichier):
+        taille = 0
+        for morceau in flux:
+            fichier.write(morceau)
+            taille += len(morceau)
+        fichier.flush()
+        return taille
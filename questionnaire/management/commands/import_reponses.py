@@ -0,0 +1,134 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from multiprocessing import Pool
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from questionnaire import ingestion
+from questionnaire.models import ReponseQuestionnaire
+
+
+def lire_lignes(chemin, format):
+    """Génère (numéro de ligne, dict) depuis un fichier CSV ou JSONL"""
+    with open(chemin, encoding='utf-8-sig', newline='') as fichier:
+        if format == 'csv':
+            lecteur = csv.DictReader(fichier)
+            for ligne in lecteur:
+                yield lecteur.line_num, ligne
+        else:
+            for numero, texte in enumerate(fichier, start=1):
+                if not texte.strip():
+                    continue
+                try:
+                    donnees = json.loads(texte)
+                except ValueError as e:
+                    donnees = {'__erreur__': f"JSON invalide : {e}"}
+                yield numero, donnees
+
+
+def par_lots(iterable, taille):
+    lot = []
+    for element in iterable:
+        lot.append(element)
+        if len(lot) >= taille:
+            yield lot
+            lot = []
+    if lot:
+        yield lot
+
+
+def imap_borne(pool, fonction, iterable, fenetre):
+    """
+    Comme ``pool.imap`` (résultats dans l'ordre), mais au plus ``fenetre``
+    éléments soumis et pas encore lus : la lecture du fichier avance au rythme
+    des insertions au lieu d'être chargée en entier dans la file du pool.
+    """
+    en_attente = deque()
+    for element in iterable:
+        en_attente.append(pool.apply_async(fonction, (element,)))
+        if len(en_attente) >= fenetre:
+            yield en_attente.popleft().get()
+    while en_attente:
+        yield en_attente.popleft().get()
+
+
+def valider_lot(lot):
+    """Valide un lot de (numéro, données) ; exécuté dans les processus de validation"""
+    resultats = []
+    for numero, donnees in lot:
+        if not isinstance(donnees, dict):
+            resultats.append((numero, donnees, None, {'__all__': ["Un objet JSON est attendu"]}))
+        elif '__erreur__' in donnees:
+            resultats.append((numero, donnees, None, {'__all__': [donnees['__erreur__']]}))
+        else:
+            propres, erreurs = ingestion.valider(donnees)
+            resultats.append((numero, donnees, propres, erreurs))
+    return resultats
+
+
+class Command(BaseCommand):
+    help = (
+        "Importe en masse des questionnaires papier ou hors ligne (CSV ou JSONL), "
+        "validés avec les règles du formulaire ; les lignes rejetées sont écrites dans un fichier à part"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichier', help="Fichier CSV (avec en-tête) ou JSONL à importer")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Format du fichier (déduit de l'extension par défaut)")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Lignes par transaction")
+        parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="Processus de validation en parallèle")
+        parser.add_argument('--rejets', help="Fichier JSONL des lignes rejetées (par défaut <fichier>.rejets.jsonl)")
+        parser.add_argument('--dry-run', action='store_true', help="Valide sans rien enregistrer")
+
+    def handle(self, *args, **options):
+        chemin = options['fichier']
+        if not os.path.exists(chemin):
+            raise CommandError(f"Fichier introuvable : {chemin}")
+
+        format = options['format'] or ('csv' if chemin.lower().endswith('.csv') else 'jsonl')
+        chemin_rejets = options['rejets'] or f"{chemin}.rejets.jsonl"
+        lots = par_lots(lire_lignes(chemin, format), options['batch_size'])
+
+        debut = time.perf_counter()
+        lues = inserees = rejetees = 0
+        pool = Pool(options['jobs'], initializer=django.setup) if options['jobs'] > 1 else None
+        try:
+            # Deux lots d'avance par processus : la mémoire ne dépend pas de la taille du fichier
+            lots_valides = (
+                imap_borne(pool, valider_lot, lots, 2 * options['jobs']) if pool else map(valider_lot, lots)
+            )
+            with open(chemin_rejets, 'w', encoding='utf-8') as rejets:
+                for resultats in lots_valides:
+                    reponses = []
+                    for numero, donnees, propres, erreurs in resultats:
+                        if erreurs:
+                            rejets.write(json.dumps(
+                                {'ligne': numero, 'erreurs': erreurs, 'donnees': donnees}, ensure_ascii=False, default=str,
+                            ) + '\n')
+                            rejetees += 1
+                        else:
+                            reponses.append(ReponseQuestionnaire(**propres))
+                    lues += len(resultats)
+
+                    if not options['dry_run']:
+                        inserees += len(ingestion.enregistrer(reponses))
+                    if options['verbosity'] > 1:
+                        self.stderr.write(f"{lues} lignes traitées")
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        duree = time.perf_counter() - debut
+        if not rejetees:
+            os.remove(chemin_rejets)
+        self.stdout.write(self.style.SUCCESS(
+            f"{lues} ligne(s) lue(s), {inserees} insérée(s), {rejetees} rejetée(s) en {duree:.1f} s "
+            f"({lues / duree if duree else 0:.0f} lignes/s)"
+        ))
+        if rejetees:
+            self.stdout.write(self.style.WARNING(f"Lignes rejetées : {chemin_rejets}"))
@@ -0,0 +1,83 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.urls import reverse
+
+from questionnaire.models import ReponseQuestionnaire
+
+# Vues rejouées (noms d'URL) : listes, statistiques et exports, en lecture seule.
+# Les autres (rendu PDF, pool de processus, écritures, outils techniques) n'ont rien à faire ici.
+VUES = [
+    'liste_reponses',
+    'dashboard',
+    'export_reponses_csv',
+    'export_reponses_parquet',
+    'export_reponses_arrow',
+]
+
+
+def requetes_analyse():
+    """Filtres utilisés couramment par les analystes, en plus des vues"""
+    reponses = ReponseQuestionnaire.objects.all()
+    return [
+        ("Réponses d'une ville, récentes d'abord", reponses.filter(ville='Dakar').order_by('-created_at')[:50]),
+        ("Utilisateurs réguliers par fréquence", reponses.filter(utilise_plantes='Regulierement', frequence='Quotidien')),
+        ("Montant prêt à payer", reponses.filter(montant_pret='>20000').values('id')),
+        ("Export depuis une date", reponses.filter(created_at__gte=datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)).values_list('id', 'created_at')),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Affiche le plan d'exécution (EXPLAIN) de chaque requête SQL émise par les vues du questionnaire. "
+        "À lancer avant et après une migration d'index pour comparer les plans."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help="EXPLAIN ANALYZE (PostgreSQL uniquement)")
+        parser.add_argument('--vue', choices=VUES, help="Ne traite que la vue portant ce nom d'URL")
+
+    def handle(self, *args, **options):
+        analyze = options['analyze'] and connection.vendor == 'postgresql'
+        setup_test_environment()
+        client = Client()
+
+        # Cache des vues désactivé : une page servie depuis le cache n'émet aucune requête
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            for nom in VUES:
+                if options['vue'] and nom != options['vue']:
+                    continue
+                url = reverse(nom)
+
+                with CaptureQueriesContext(connection) as requetes:
+                    response = client.get(url, secure=True)
+                    if response.streaming:
+                        for _ in response.streaming_content:
+                            pass
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== {nom} ({url}) : {len(requetes)} requête(s)"))
+                for requete in requetes.captured_queries:
+                    if requete['sql'].lstrip().upper().startswith('SELECT'):
+                        self._expliquer(requete['sql'], analyze)
+
+        if not options['vue']:
+            for libelle, queryset in requetes_analyse():
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== {libelle}"))
+                self.stdout.write(str(queryset.query))
+                self.stdout.write(queryset.explain(analyze=True) if analyze else queryset.explain())
+
+    def _expliquer(self, sql, analyze):
+        self.stdout.write(sql)
+        if connection.vendor == 'postgresql':
+            prefixe = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+        elif connection.vendor == 'sqlite':
+            prefixe = 'EXPLAIN QUERY PLAN '
+        else:
+            prefixe = 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefixe + sql)
+            for ligne in cursor.fetchall():
+                self.stdout.write('    ' + ' '.join(str(colonne) for colonne in ligne))
@@ -0,0 +1,55 @@
+import io
+import json
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from questionnaire import profiler
+
+
+class Command(BaseCommand):
+    help = (
+        "Profils des requêtes profilées à la demande : jeton pour l'en-tête X-Profiler, "
+        "liste des profils, ou affichage d'un profil et de sa chronologie SQL"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('nom', nargs='?', help="Profil à afficher (en-tête X-Profil de la réponse) ; 'dernier' pour le plus récent")
+        parser.add_argument('--jeton', action='store_true', help="Génère un jeton pour l'en-tête X-Profiler")
+        parser.add_argument('--tri', default='cumulative', choices=['cumulative', 'tottime', 'calls'], help="Tri des fonctions")
+        parser.add_argument('--top', type=int, default=30, help="Nombre de fonctions affichées")
+
+    def handle(self, *args, **options):
+        if options['jeton']:
+            self.stdout.write(f"{profiler.EN_TETE}: {profiler.jeton()}")
+            return
+
+        noms = profiler.profils()
+        if not options['nom']:
+            for nom in noms:
+                self.stdout.write(nom)
+            if not noms:
+                self.stdout.write("Aucun profil")
+            return
+
+        nom = noms[0] if options['nom'] == 'dernier' and noms else options['nom']
+        fichier_profil, fichier_sql = profiler.chemins(nom)
+        tampon = io.StringIO()
+        try:
+            stats = pstats.Stats(fichier_profil, stream=tampon)
+            with open(fichier_sql, encoding='utf-8') as fichier:
+                chronologie = json.load(fichier)
+        except FileNotFoundError:
+            raise CommandError(f"Profil introuvable : {nom}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{chronologie['methode']} {chronologie['chemin']} ({chronologie['vue']}) → {chronologie['statut']}, "
+            f"{chronologie['duree_ms']:.1f} ms, {chronologie['taille']} octets, "
+            f"{len(chronologie['requetes'])} requête(s) SQL en {chronologie['sql_total_ms']:.1f} ms"
+        ))
+        stats.sort_stats(options['tri']).print_stats(options['top'])
+        self.stdout.write(tampon.getvalue())
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Chronologie SQL"))
+        for requete in chronologie['requetes']:
+            self.stdout.write(f"  +{requete['debut_ms']:9.1f} ms  {requete['duree_ms']:8.1f} ms  {requete['sql'][:200]}")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from questionnaire import rollups
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs du tableau de bord depuis les réponses et signale les écarts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Vérifie seulement : liste les écarts sans rien modifier (code de sortie 1 s'il y en a)",
+        )
+
+    def handle(self, *args, **options):
+        # Sans --check, un seul parcours des réponses : les écarts sont ceux que la reconstruction corrige
+        if options['check']:
+            differences = rollups.ecarts()
+        else:
+            differences, nb_jours, nb_compteurs = rollups.reconstruire()
+
+        for jour, champ, modalite, stocke, attendu in differences[:50]:
+            self.stdout.write(f"{jour} {champ}={modalite!r} : stocké {stocke}, attendu {attendu}")
+        if len(differences) > 50:
+            self.stdout.write(f"... et {len(differences) - 50} autre(s) écart(s)")
+
+        if options['check']:
+            if differences:
+                raise CommandError(f"{len(differences)} écart(s) entre les compteurs et les réponses")
+            self.stdout.write(self.style.SUCCESS("Compteurs à jour"))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(differences)} écart(s) corrigé(s) : {nb_jours} jour(s), {nb_compteurs} compteur(s) reconstruits"
+        ))
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from questionnaire import exports, requetes_lentes
+
+
+class Command(BaseCommand):
+    help = (
+        "Résume le journal des requêtes SQL lentes (REQUETES_LENTES_SEUIL_MS) : requêtes semblables "
+        "regroupées, les plus coûteuses d'abord"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fichiers', nargs='*', help="Journaux à lire (défaut : REQUETES_LENTES_FICHIER de chaque processus et ses rotations)")
+        parser.add_argument('--top', type=int, default=10, help="Nombre de requêtes affichées (défaut : 10)")
+        parser.add_argument('--tri', default='total', choices=['total', 'max', 'moyenne', 'nombre'], help="Critère de tri")
+        parser.add_argument('--depuis', help="Entrées à partir de cette date (AAAA-MM-JJ ou ISO 8601)")
+        parser.add_argument('--vue', help="Seulement les requêtes de cette vue (nom d'URL)")
+        parser.add_argument('--plans', action='store_true', help="Affiche l'occurrence la plus lente avec ses paramètres et son plan")
+
+    def handle(self, *args, **options):
+        depuis = None
+        if options['depuis']:
+            try:
+                depuis = exports.parse_moment(options['depuis'])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        fichiers = options['fichiers'] or requetes_lentes.fichiers_journal()
+        if not fichiers:
+            raise CommandError("Aucun journal de requêtes lentes trouvé")
+
+        try:
+            groupes = requetes_lentes.resumer(
+                requetes_lentes.lire(fichiers, depuis=depuis, vue=options['vue']), tri=options['tri'],
+            )
+        except OSError as e:
+            raise CommandError(str(e))
+        if not groupes:
+            self.stdout.write("Aucune requête lente")
+            return
+
+        # Entrées sans durée lisible : total nul, pourcentages à 0 %
+        total = sum(g['total_ms'] for g in groupes)
+        self.stdout.write(
+            f"{sum(g['nombre'] for g in groupes)} requête(s) lente(s), {len(groupes)} distincte(s), "
+            f"{total / 1000:.1f} s au total"
+        )
+        for rang, groupe in enumerate(groupes[:options['top']], 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"\n#{rang}  {groupe['nombre']} fois, total {groupe['total_ms']:.1f} ms ({groupe['total_ms'] / (total or 1):.0%}), "
+                f"moyenne {groupe['moyenne_ms']:.1f} ms, max {groupe['max_ms']:.1f} ms — {', '.join(groupe['vues'])}"
+            ))
+            self.stdout.write(groupe['sql'])
+            if options['plans']:
+                pire = groupe['pire']
+                self.stdout.write(
+                    f"  pire : {pire.get('moment')} {pire.get('methode')} {pire.get('chemin')}, "
+                    f"paramètres {pire.get('params')}"
+                )
+                if pire.get('plan'):
+                    self.stdout.write('  ' + pire['plan'].replace('\n', '\n  '))
@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import signal
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from questionnaire import taches
+
+
+def _worker(nom, arret, intervalle):
+    # Ctrl-C / SIGTERM : la tâche en cours se termine, puis le worker s'arrête
+    signal.signal(signal.SIGINT, lambda *_: arret.set())
+    signal.signal(signal.SIGTERM, lambda *_: arret.set())
+    taches.travailler(nom, arret, intervalle)
+
+
+class Command(BaseCommand):
+    help = "Lance les workers qui exécutent les tâches en arrière-plan (exports lourds)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.TACHES_CONCURRENCE,
+            help="Nombre de processus workers (défaut : TACHES_CONCURRENCE)",
+        )
+        parser.add_argument(
+            '--intervalle', type=float, default=settings.TACHES_INTERVALLE,
+            help="Attente (secondes) entre deux consultations de la file vide",
+        )
+        parser.add_argument(
+            '--une-fois', action='store_true',
+            help="Exécute les tâches en attente dans ce processus puis s'arrête",
+        )
+
+    def handle(self, *args, **options):
+        prefixe = f"{socket.gethostname()}:{os.getpid()}"
+
+        if options['une_fois']:
+            taches.travailler(prefixe, multiprocessing.Event(), une_fois=True)
+            return
+
+        # Chaque processus ouvre ses propres connexions
+        connections.close_all()
+        arret = multiprocessing.Event()
+        workers = [
+            multiprocessing.Process(
+                target=_worker, args=(f"{prefixe}/{i}", arret, options['intervalle']), name=f"worker-{i}",
+            )
+            for i in range(options['concurrency'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"{len(workers)} worker(s) démarré(s) ({prefixe})")
+
+        def arreter(*_):
+            arret.set()
+        signal.signal(signal.SIGINT, arreter)
+        signal.signal(signal.SIGTERM, arreter)
+
+        for worker in workers:
+            worker.join()
+        self.stdout.write("Workers arrêtés")
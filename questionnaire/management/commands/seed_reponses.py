@@ -0,0 +1,160 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from questionnaire import ingestion, utils
+from questionnaire.models import ReponseQuestionnaire
+
+# Villes et poids approximatifs (population urbaine)
+VILLES = {
+    'Dakar': 30, 'Pikine': 12, 'Guédiawaye': 6, 'Rufisque': 5, 'Touba': 10, 'Thiès': 6,
+    'Kaolack': 4, 'Mbour': 4, 'Saint-Louis': 4, 'Ziguinchor': 3, 'Diourbel': 2, 'Louga': 2,
+    'Tambacounda': 2, 'Kolda': 1, 'Fatick': 1, 'Kaffrine': 1, 'Matam': 1, 'Kédougou': 1,
+    'Sédhiou': 1, 'Richard-Toll': 1,
+}
+
+PRENOMS = [
+    'Moussa', 'Fatou', 'Awa', 'Mamadou', 'Aminata', 'Cheikh', 'Ousmane', 'Khady', 'Ibrahima', 'Astou',
+    'Abdoulaye', 'Mariama', 'Modou', 'Ndeye', 'Babacar', 'Coumba', 'Aliou', 'Bineta', 'Serigne', 'Adama',
+]
+NOMS = [
+    'Diop', 'Ndiaye', 'Fall', 'Sow', 'Ba', 'Gueye', 'Sy', 'Diallo', 'Mbaye', 'Faye',
+    'Sarr', 'Cissé', 'Thiam', 'Kane', 'Seck', 'Niang', 'Diouf', 'Touré', 'Camara', 'Sène',
+]
+
+PROFESSIONS = {
+    'Commerçant(e)': 20, 'Étudiant(e)': 15, 'Enseignant(e)': 8, 'Agriculteur': 10, 'Ménagère': 10,
+    'Fonctionnaire': 7, 'Infirmier(ère)': 4, 'Tailleur': 4, 'Chauffeur': 5, 'Pêcheur': 3,
+    'Artisan': 4, 'Sans emploi': 6, 'Retraité(e)': 4,
+}
+
+CRITERES = ['Prix', 'Qualité', 'Efficacité', 'Origine locale', 'Conseils du vendeur', 'Emballage', 'Recommandation']
+
+SUGGESTIONS = [
+    'Tisanes prêtes à l’emploi', 'Huiles essentielles locales', 'Livraison à domicile',
+    'Consultations en wolof', 'Produits certifiés', 'Formations sur les plantes',
+]
+
+COMMENTAIRES = ['Très bonne initiative', 'Les prix doivent rester abordables', 'Merci', 'Plus d’informations sur les dosages']
+
+# Poids des modalités des champs à choix (valeurs du modèle) ; None = non renseigné
+POIDS_CHOIX = {
+    'sexe': {'Homme': 47, 'Femme': 50, 'Autre': 1, None: 2},
+    'utilise_plantes': {'Regulierement': 35, 'Parfois': 45, 'Jamais': 15, None: 5},
+    'frequence': {'Quotidien': 20, 'Hebdomadaire': 35, 'Mensuel': 25, 'Rarement': 15, None: 5},
+    'type_produit': {'Bruts': 40, 'Transformes': 30, 'Peuimporte': 25, None: 5},
+    'montant_pret': {'<5000': 45, '5000-10000': 30, '10000-20000': 15, '>20000': 5, None: 5},
+}
+
+
+def _tirage(poids):
+    """(valeurs, poids cumulés) pour random.choices"""
+    valeurs = list(poids)
+    cumules, total = [], 0
+    for valeur in valeurs:
+        total += poids[valeur]
+        cumules.append(total)
+    return valeurs, cumules
+
+
+class Generateur:
+    """Réponses réalistes et reproductibles : même graine et même date de fin, mêmes réponses"""
+
+    def __init__(self, graine, fin, jours):
+        self.hasard = random.Random(graine)
+        self.fin = fin
+        self.etendue = jours * 86400
+        self.villes = _tirage(VILLES)
+        self.professions = _tirage(PROFESSIONS)
+        self.choix = {champ: _tirage(poids) for champ, poids in POIDS_CHOIX.items()}
+        for champ, (valeurs, _) in self.choix.items():
+            connues = {v for v, _ in ReponseQuestionnaire._meta.get_field(champ).choices}
+            if set(valeurs) - {None} != connues:
+                raise CommandError(f"POIDS_CHOIX['{champ}'] ne correspond plus aux choix du modèle")
+        self.options = {
+            champ: [o for o in valeurs if not o.startswith('Autre')]
+            for champ, valeurs in utils.OPTIONS_MULTIPLES.items()
+        }
+
+    def _un(self, tirage):
+        valeurs, cumules = tirage
+        return self.hasard.choices(valeurs, cum_weights=cumules)[0]
+
+    def _plusieurs(self, options, maximum=3):
+        return ', '.join(self.hasard.sample(options, self.hasard.randint(1, min(maximum, len(options)))))
+
+    def reponse(self):
+        h = self.hasard
+        choix = {champ: self._un(tirage) for champ, tirage in self.choix.items()}
+        utilise = choix['utilise_plantes'] in ('Regulierement', 'Parfois')
+        if not utilise:
+            choix['frequence'] = 'Rarement' if choix['utilise_plantes'] == 'Jamais' else None
+
+        age = None
+        if h.random() > 0.05:
+            age = max(15, min(85, int(h.gauss(36, 13))))
+
+        # Plus de réponses récentes (campagnes qui montent en charge) et en journée
+        decalage = int(self.etendue * h.random() ** 1.5)
+        moment = self.fin - datetime.timedelta(seconds=decalage)
+        moment = moment.replace(hour=h.choices(range(24), weights=[1] * 7 + [4] * 12 + [2] * 5)[0])
+
+        return ReponseQuestionnaire(
+            nom=f"{h.choice(PRENOMS)} {h.choice(NOMS)}" if h.random() < 0.7 else None,
+            age=age,
+            ville=self._un(self.villes),
+            profession=self._un(self.professions) if h.random() < 0.9 else None,
+            connait_med_naturelle=h.random() < 0.8,
+            types_soins=self._plusieurs(self.options['types_soins']) if utilise else None,
+            lieu_achat=self._plusieurs(self.options['lieu_achat'], 2) if utilise else None,
+            motivations=self._plusieurs(self.options['motivations']) if h.random() < 0.85 else None,
+            criteres_achat=self._plusieurs(CRITERES) if h.random() < 0.6 else None,
+            interet_services=self._plusieurs(self.options['interet_services'], 2) if h.random() < 0.7 else None,
+            suggestions=h.choice(SUGGESTIONS) if h.random() < 0.25 else None,
+            commentaires=h.choice(COMMENTAIRES) if h.random() < 0.1 else None,
+            created_at=moment,
+            **choix,
+        )
+
+
+class Command(BaseCommand):
+    help = "Génère des réponses réalistes (villes du Sénégal, répartitions plausibles) pour les tests de charge"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, required=True, help="Nombre de réponses à créer")
+        parser.add_argument('--seed', type=int, default=42, help="Graine du générateur (défaut : 42)")
+        parser.add_argument('--jours', type=int, default=365, help="Étalement de created_at en jours (défaut : 365)")
+        parser.add_argument(
+            '--jusqua', help="Date de la réponse la plus récente (AAAA-MM-JJ, défaut : aujourd'hui) ; "
+                             "avec la même graine, même date = mêmes réponses",
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help="Réponses par transaction")
+
+    def handle(self, *args, **options):
+        if options['count'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--count et --batch-size doivent être positifs")
+
+        if options['jusqua']:
+            try:
+                fin = datetime.date.fromisoformat(options['jusqua'])
+            except ValueError:
+                raise CommandError(f"Date invalide pour --jusqua : {options['jusqua']}")
+        else:
+            fin = timezone.localdate()
+        fin = timezone.make_aware(datetime.datetime.combine(fin, datetime.time(23, 59, 59)))
+
+        generateur = Generateur(options['seed'], fin, options['jours'])
+        total, debut = 0, time.monotonic()
+        while total < options['count']:
+            taille = min(options['batch_size'], options['count'] - total)
+            # Même chemin que l'import en masse : INSERT multi-lignes, compteurs et options dans la transaction
+            ingestion.enregistrer([generateur.reponse() for _ in range(taille)])
+            total += taille
+            duree = time.monotonic() - debut
+            self.stderr.write(f"\r{total}/{options['count']} réponses ({total / duree:.0f}/s)", ending='')
+
+        self.stderr.write('')
+        self.stdout.write(self.style.SUCCESS(f"{total} réponse(s) créée(s) en {time.monotonic() - debut:.1f} s"))
@@ -0,0 +1,324 @@
+"""
+Métriques des requêtes au format texte Prometheus, sans dépendance externe.
+
+``MetriquesMiddleware`` mesure chaque requête : durée (jusqu'au dernier
+octet pour les réponses en flux), taille de la réponse, nombre et durée des
+requêtes SQL. L'étiquette ``vue`` est le nom de l'URL résolue. Les autres
+modules ajoutent leurs compteurs avec ``compter()`` (cache des fiches PDF).
+
+Chaque processus (worker gunicorn, processus ASGI...) accumule ses valeurs en
+mémoire et les écrit, au plus une fois par ``METRIQUES_INTERVALLE`` et à sa
+sortie, dans ``METRIQUES_DIR/<pid>.json``, depuis un thread d'arrière-plan.
+La vue ``/metrics`` additionne les fichiers de tous les processus : les
+compteurs d'un worker redémarré restent comptés. Le dossier est vidé au
+démarrage du serveur (``vider()``).
+"""
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+# Bornes (le) des histogrammes
+BORNES_DUREE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BORNES_TAILLE = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+BORNES_SQL = (0, 1, 2, 5, 10, 20, 50, 100)
+BORNES_DUREE_SQL = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+# Nom -> (type, aide, bornes des histogrammes)
+METRIQUES = {
+    'questionnaire_requetes_total': ('counter', "Requêtes HTTP traitées", None),
+    'questionnaire_requete_duree_secondes': ('histogram', "Durée des requêtes HTTP, flux compris", BORNES_DUREE),
+    'questionnaire_reponse_taille_octets': ('histogram', "Taille du corps des réponses", BORNES_TAILLE),
+    'questionnaire_requete_sql_nombre': ('histogram', "Requêtes SQL par requête HTTP", BORNES_SQL),
+    'questionnaire_requete_sql_duree_secondes': ('histogram', "Temps SQL cumulé par requête HTTP", BORNES_DUREE_SQL),
+    'questionnaire_cache_pdf_total': ('counter', "Lectures du cache disque des fiches PDF, par résultat", None),
+}
+
+# Vue des requêtes qui ne correspondent à aucune URL (404, redirection HTTPS...)
+VUE_INCONNUE = 'aucune'
+
+_verrou = threading.Lock()
+# Nom -> {étiquettes (tuple de paires): valeur (compteur) ou [buckets..., somme, nombre] (histogramme)}
+_valeurs = {nom: {} for nom in METRIQUES}
+_modifie = False
+_ecrivain = None
+
+
+def _observer(nom, etiquettes, valeur):
+    """Ajoute une observation ; appeler avec _verrou pris"""
+    global _modifie
+    type, _, bornes = METRIQUES[nom]
+    series = _valeurs[nom]
+    if type == 'counter':
+        series[etiquettes] = series.get(etiquettes, 0) + valeur
+    else:
+        serie = series.get(etiquettes)
+        if serie is None:
+            serie = series[etiquettes] = [0] * (len(bornes) + 2)
+        for i, borne in enumerate(bornes):
+            if valeur <= borne:
+                serie[i] += 1
+        serie[-2] += valeur
+        serie[-1] += 1
+    _modifie = True
+
+
+def enregistrer(vue, methode, statut, duree, taille, nb_sql, duree_sql):
+    """Enregistre les mesures d'une requête terminée"""
+    with _verrou:
+        _observer('questionnaire_requetes_total', (('vue', vue), ('methode', methode), ('statut', str(statut))), 1)
+        _observer('questionnaire_requete_duree_secondes', (('vue', vue), ('methode', methode)), duree)
+        _observer('questionnaire_reponse_taille_octets', (('vue', vue),), taille)
+        _observer('questionnaire_requete_sql_nombre', (('vue', vue),), nb_sql)
+        _observer('questionnaire_requete_sql_duree_secondes', (('vue', vue),), duree_sql)
+    _demarrer_ecrivain()
+
+
+def compter(nom, etiquettes, valeur=1):
+    """Incrémente le compteur ``nom`` ; ``etiquettes`` : tuple de paires (clé, valeur)"""
+    with _verrou:
+        _observer(nom, etiquettes, valeur)
+    _demarrer_ecrivain()
+
+
+# --------------------------------------------------------------------
+# Fichiers par processus
+# --------------------------------------------------------------------
+def dossier():
+    return settings.METRIQUES_DIR
+
+
+def ecrire():
+    """Écrit les valeurs de ce processus dans son fichier (remplacement atomique)"""
+    global _modifie
+    with _verrou:
+        if not _modifie:
+            return
+        contenu = json.dumps({
+            nom: [[list(map(list, etiquettes)), valeur] for etiquettes, valeur in series.items()]
+            for nom, series in _valeurs.items()
+        })
+        _modifie = False
+    os.makedirs(dossier(), exist_ok=True)
+    descripteur, temporaire = tempfile.mkstemp(dir=dossier(), suffix='.tmp')
+    with os.fdopen(descripteur, 'w') as sortie:
+        sortie.write(contenu)
+    os.replace(temporaire, os.path.join(dossier(), f'{os.getpid()}.json'))
+
+
+def _boucle(pid):
+    while os.getpid() == pid:
+        time.sleep(settings.METRIQUES_INTERVALLE)
+        try:
+            ecrire()
+        except OSError:
+            pass
+
+
+def _demarrer_ecrivain():
+    """Thread d'écriture périodique, (re)lancé au besoin dans chaque processus (après un fork)"""
+    global _ecrivain
+    if _ecrivain is not None and _ecrivain[0] == os.getpid():
+        return
+    with _verrou:
+        if _ecrivain is not None and _ecrivain[0] == os.getpid():
+            return
+        thread = threading.Thread(target=_boucle, args=(os.getpid(),), name='metriques', daemon=True)
+        _ecrivain = (os.getpid(), thread)
+    thread.start()
+
+
+def vider():
+    """Supprime les fichiers de tous les processus (à l'arrêt ou au démarrage du serveur)"""
+    for chemin in glob.glob(os.path.join(dossier(), '*.json')):
+        try:
+            os.remove(chemin)
+        except FileNotFoundError:
+            pass
+
+
+def agreger():
+    """Somme des valeurs de tous les processus : {nom: {étiquettes: valeur}}"""
+    ecrire()
+    total = {nom: {} for nom in METRIQUES}
+    for chemin in glob.glob(os.path.join(dossier(), '*.json')):
+        try:
+            with open(chemin) as fichier:
+                contenu = json.load(fichier)
+        except (OSError, ValueError):
+            continue
+        for nom, series in contenu.items():
+            if nom not in METRIQUES:
+                continue
+            type, _, bornes = METRIQUES[nom]
+            for etiquettes, valeur in series:
+                cle = tuple(map(tuple, etiquettes))
+                if type == 'counter':
+                    total[nom][cle] = total[nom].get(cle, 0) + valeur
+                elif len(valeur) == len(bornes) + 2:
+                    # Fichier d'une version aux bornes différentes : ignoré
+                    serie = total[nom].setdefault(cle, [0] * len(valeur))
+                    for i, v in enumerate(valeur):
+                        serie[i] += v
+    return total
+
+
+def _etiquettes(paires):
+    return ','.join(
+        '{}="{}"'.format(cle, str(valeur).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for cle, valeur in paires
+    )
+
+
+def _nombre(valeur):
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+
+def format_prometheus(valeurs):
+    """Texte d'exposition Prometheus (version 0.0.4)"""
+    lignes = []
+    for nom, (type, aide, bornes) in METRIQUES.items():
+        lignes.append(f'# HELP {nom} {aide}')
+        lignes.append(f'# TYPE {nom} {type}')
+        for etiquettes, valeur in sorted(valeurs[nom].items()):
+            if type == 'counter':
+                lignes.append(f'{nom}{{{_etiquettes(etiquettes)}}} {_nombre(valeur)}')
+                continue
+            for borne, cumul in zip(bornes + ('+Inf',), valeur[:-2] + [valeur[-1]]):
+                lignes.append(f'{nom}_bucket{{{_etiquettes(etiquettes + (("le", borne),))}}} {cumul}')
+            lignes.append(f'{nom}_sum{{{_etiquettes(etiquettes)}}} {_nombre(valeur[-2])}')
+            lignes.append(f'{nom}_count{{{_etiquettes(etiquettes)}}} {valeur[-1]}')
+    return '\n'.join(lignes) + '\n'
+
+
+atexit.register(ecrire)
+
+
+# --------------------------------------------------------------------
+# Middleware
+# --------------------------------------------------------------------
+def a_la_fin(response, terminer):
+    """
+    Appelle ``terminer(taille du corps)`` une fois la réponse envoyée : tout de
+    suite, ou après le dernier morceau (ou l'abandon) d'une réponse en flux.
+    Retourne la réponse.
+    """
+    if not response.streaming:
+        terminer(len(response.content))
+    elif response.has_header('Content-Length'):
+        # FileResponse : le serveur peut l'envoyer lui-même (sendfile) sans itérer le contenu
+        terminer(int(response['Content-Length']))
+    elif response.is_async:
+        response.streaming_content = _suivre_async(response.streaming_content, terminer)
+    else:
+        response.streaming_content = _suivre(response.streaming_content, terminer)
+    return response
+
+
+def _suivre(contenu, terminer):
+    taille = 0
+    try:
+        for morceau in contenu:
+            taille += len(morceau)
+            yield morceau
+    finally:
+        terminer(taille)
+
+
+async def _suivre_async(contenu, terminer):
+    taille = 0
+    try:
+        async for morceau in contenu:
+            taille += len(morceau)
+            yield morceau
+    finally:
+        terminer(taille)
+
+
+class _CompteurSql:
+    """Wrapper d'exécution : nombre et durée des requêtes SQL de la requête en cours"""
+
+    def __init__(self):
+        self.nombre = 0
+        self.duree = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        reussie = False
+        try:
+            resultat = execute(sql, params, many, context)
+            reussie = True
+            return resultat
+        finally:
+            self.enregistrer(sql, params, many, context, debut, time.perf_counter(), reussie)
+
+    def enregistrer(self, sql, params, many, context, debut, fin, reussie):
+        self.nombre += 1
+        self.duree += fin - debut
+
+
+def signaler_requete(connexion, sql, params, debut, fin, reussie):
+    """
+    Transmet aux wrappers d'exécution actifs (métriques, requêtes lentes,
+    profiler) et au journal des requêtes de Django une requête qui n'est pas
+    passée par ``cursor.execute`` (COPY par le curseur psycopg). ``debut`` et
+    ``fin`` viennent de ``time.perf_counter()``.
+    """
+    contexte = {'connection': connexion, 'cursor': None}
+    for wrapper in list(connexion.execute_wrappers):
+        enregistrer = getattr(wrapper, 'enregistrer', None)
+        if enregistrer is not None:
+            enregistrer(sql, params, False, contexte, debut, fin, reussie)
+    if connexion.queries_logged:
+        connexion.queries_log.append({'sql': sql, 'time': f'{fin - debut:.3f}'})
+
+
+class MetriquesMiddleware:
+    """
+    Mesure chaque requête. À placer en tête de MIDDLEWARE pour compter le
+    temps des autres middlewares. Les réponses en flux (exports) sont mesurées
+    jusqu'à leur dernier morceau ; leurs requêtes SQL aussi.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRIQUES_ACTIVES:
+            return self.get_response(request)
+
+        debut = time.perf_counter()
+        sql = _CompteurSql()
+        connection.execute_wrappers.append(sql)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            connection.execute_wrappers.remove(sql)
+            raise
+
+        correspondance = getattr(request, 'resolver_match', None)
+        vue = correspondance.view_name if correspondance else VUE_INCONNUE
+        if vue == 'metriques':
+            connection.execute_wrappers.remove(sql)
+            return response
+
+        termine = False
+
+        def terminer(taille):
+            nonlocal termine
+            if termine:
+                return
+            termine = True
+            if sql in connection.execute_wrappers:
+                connection.execute_wrappers.remove(sql)
+            enregistrer(
+                vue, request.method, response.status_code, time.perf_counter() - debut, taille, sql.nombre, sql.duree,
+            )
+
+        return a_la_fin(response, terminer)
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:38
+
+from django.db import migrations, models
+
+
+def creer_index_brin(apps, schema_editor):
+    # Table en ajout seul : created_at suit l'ordre physique des lignes,
+    # un index BRIN couvre les filtres par période pour quelques pages seulement.
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS reponse_created_brin "
+        "ON questionnaire_reponsequestionnaire USING brin (created_at)"
+    )
+
+
+def supprimer_index_brin(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS reponse_created_brin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("questionnaire", "0003_alter_reponsequestionnaire_commentaires_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="reponsequestionnaire",
+            index=models.Index(
+                fields=["created_at", "id"], name="reponse_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reponsequestionnaire",
+            index=models.Index(fields=["sexe"], name="reponse_sexe_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="reponsequestionnaire",
+            index=models.Index(
+                fields=["ville", "created_at"], name="reponse_ville_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reponsequestionnaire",
+            index=models.Index(
+                fields=["utilise_plantes", "frequence"], name="reponse_plantes_freq_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reponsequestionnaire",
+            index=models.Index(fields=["frequence"], name="reponse_frequence_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="reponsequestionnaire",
+            index=models.Index(fields=["montant_pret"], name="reponse_montant_idx"),
+        ),
+        migrations.RunPython(creer_index_brin, supprimer_index_brin),
+    ]
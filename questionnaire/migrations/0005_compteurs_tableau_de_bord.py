@@ -0,0 +1,116 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:40
+
+from django.db import migrations, models
+from django.db.models import Case, Count, Sum, Value, When
+from django.db.models.functions import TruncDate
+
+# Copie figée des dimensions du tableau de bord à la date de cette migration
+# (questionnaire.stats peut changer ensuite sans modifier l'historique)
+CHAMPS_CHOIX = ["sexe", "utilise_plantes", "frequence", "type_produit", "montant_pret"]
+TRANCHES_AGE = [
+    ("< 18", None, 18),
+    ("18-24", 18, 25),
+    ("25-34", 25, 35),
+    ("35-44", 35, 45),
+    ("45-54", 45, 55),
+    ("55-64", 55, 65),
+    ("65 +", 65, None),
+]
+
+
+def remplir_compteurs(apps, schema_editor):
+    Reponse = apps.get_model("questionnaire", "ReponseQuestionnaire")
+    Statistique = apps.get_model("questionnaire", "StatistiqueJournaliere")
+    Compteur = apps.get_model("questionnaire", "CompteurJournalier")
+    base = schema_editor.connection.alias
+
+    reponses = Reponse.objects.using(base).annotate(jour=TruncDate("created_at")).order_by()
+    Statistique.objects.using(base).bulk_create(
+        [
+            Statistique(jour=l["jour"], total=l["total"], nb_age=l["nb_age"], somme_age=l["somme_age"] or 0)
+            for l in reponses.values("jour").annotate(total=Count("id"), nb_age=Count("age"), somme_age=Sum("age"))
+        ],
+        batch_size=1000,
+    )
+
+    # (champ, modalité) : valeur stockée en texte, chaîne vide pour « non renseigné »
+    compteurs = []
+    for champ in CHAMPS_CHOIX:
+        connues = {valeur for valeur, _ in Reponse._meta.get_field(champ).choices}
+        for ligne in reponses.values("jour", champ).annotate(total=Count("id")):
+            valeur = ligne[champ]
+            if valeur is None or valeur in connues:
+                compteurs.append((ligne["jour"], champ, "" if valeur is None else str(valeur), ligne["total"]))
+    for ligne in reponses.values("jour", "connait_med_naturelle").annotate(total=Count("id")):
+        compteurs.append((ligne["jour"], "connait_med_naturelle", str(ligne["connait_med_naturelle"]), ligne["total"]))
+
+    tranche = Case(
+        *[
+            When(**{k: v for k, v in (("age__gte", bas), ("age__lt", haut)) if v is not None}, then=Value(libelle))
+            for libelle, bas, haut in TRANCHES_AGE
+        ],
+        default=Value(""),
+        output_field=models.CharField(),
+    )
+    for ligne in reponses.annotate(tranche=tranche).values("jour", "tranche").annotate(total=Count("id")):
+        compteurs.append((ligne["jour"], "age", ligne["tranche"], ligne["total"]))
+
+    Compteur.objects.using(base).bulk_create(
+        [Compteur(jour=jour, champ=champ, modalite=modalite, total=total) for jour, champ, modalite, total in compteurs],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("questionnaire", "0004_index_reponses"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StatistiqueJournaliere",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("jour", models.DateField(unique=True)),
+                ("total", models.BigIntegerField(default=0)),
+                ("nb_age", models.BigIntegerField(default=0)),
+                ("somme_age", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CompteurJournalier",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("jour", models.DateField()),
+                ("champ", models.CharField(max_length=50)),
+                ("modalite", models.CharField(blank=True, max_length=50)),
+                ("total", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("jour", "champ", "modalite"),
+                        name="compteur_jour_champ_modalite_uniq",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(remplir_compteurs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,136 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:42
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copie figée des règles de questionnaire.options à la date de cette migration
+CHAMPS_MULTIPLES = ["types_soins", "lieu_achat", "motivations", "criteres_achat", "interet_services"]
+SEPARATEURS = re.compile(r"[,;\n]")
+LONGUEUR_MAX = 100
+TAILLE_LOT = 2000
+
+
+def decouper(texte):
+    if not texte:
+        return []
+    valeurs = []
+    for morceau in SEPARATEURS.split(texte):
+        valeur = " ".join(morceau.split())[:LONGUEUR_MAX]
+        if valeur and valeur not in valeurs:
+            valeurs.append(valeur)
+    return valeurs
+
+
+def synchroniser(lot, Option, Lien, base):
+    couples = {
+        (reponse.pk, champ, valeur)
+        for reponse in lot
+        for champ in CHAMPS_MULTIPLES
+        for valeur in decouper(getattr(reponse, champ))
+    }
+    if not couples:
+        return
+    options = {(champ, valeur) for _, champ, valeur in couples}
+    Option.objects.using(base).bulk_create(
+        [Option(champ=champ, valeur=valeur) for champ, valeur in options], ignore_conflicts=True, batch_size=500,
+    )
+    ids = {}
+    for champ in {champ for champ, _ in options}:
+        valeurs = [valeur for c, valeur in options if c == champ]
+        for debut in range(0, len(valeurs), 500):
+            lues = Option.objects.using(base).filter(champ=champ, valeur__in=valeurs[debut:debut + 500])
+            for pk, valeur in lues.values_list("pk", "valeur"):
+                ids[(champ, valeur)] = pk
+    Lien.objects.using(base).bulk_create(
+        [Lien(reponse_id=pk, option_id=ids[(champ, valeur)]) for pk, champ, valeur in couples],
+        ignore_conflicts=True, batch_size=1000,
+    )
+
+
+def remplir_options(apps, schema_editor):
+    Reponse = apps.get_model("questionnaire", "ReponseQuestionnaire")
+    Option = apps.get_model("questionnaire", "OptionReponse")
+    Lien = apps.get_model("questionnaire", "ReponseOption")
+    base = schema_editor.connection.alias
+
+    lot = []
+    reponses = Reponse.objects.using(base).only("pk", *CHAMPS_MULTIPLES).order_by("pk")
+    for reponse in reponses.iterator(chunk_size=TAILLE_LOT):
+        lot.append(reponse)
+        if len(lot) >= TAILLE_LOT:
+            synchroniser(lot, Option, Lien, base)
+            lot = []
+    synchroniser(lot, Option, Lien, base)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("questionnaire", "0005_compteurs_tableau_de_bord"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OptionReponse",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("champ", models.CharField(max_length=50)),
+                ("valeur", models.CharField(max_length=100)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("champ", "valeur"), name="option_champ_valeur_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="ReponseOption",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "option",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reponses",
+                        to="questionnaire.optionreponse",
+                    ),
+                ),
+                (
+                    "reponse",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="options",
+                        to="questionnaire.reponsequestionnaire",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("option", "reponse"), name="reponse_option_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(remplir_options, migrations.RunPython.noop),
+    ]
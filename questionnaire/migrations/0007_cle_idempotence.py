@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("questionnaire", "0006_options_choix_multiples"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reponsequestionnaire",
+            name="cle_idempotence",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, null=True, unique=True
+            ),
+        ),
+    ]
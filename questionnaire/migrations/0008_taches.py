@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("questionnaire", "0007_cle_idempotence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("type", models.CharField(max_length=50)),
+                ("parametres", models.JSONField(blank=True, default=dict)),
+                (
+                    "statut",
+                    models.CharField(
+                        choices=[
+                            ("en_attente", "En attente"),
+                            ("en_cours", "En cours"),
+                            ("terminee", "Terminée"),
+                            ("echec", "Échec"),
+                        ],
+                        default="en_attente",
+                        max_length=20,
+                    ),
+                ),
+                ("progression", models.PositiveBigIntegerField(default=0)),
+                ("total", models.PositiveBigIntegerField(blank=True, null=True)),
+                ("resultat", models.CharField(blank=True, max_length=255)),
+                ("erreur", models.TextField(blank=True)),
+                ("tentatives", models.PositiveSmallIntegerField(default=0)),
+                ("worker", models.CharField(blank=True, max_length=100)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("debut", models.DateTimeField(blank=True, null=True)),
+                ("fin", models.DateTimeField(blank=True, null=True)),
+                ("battement", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["statut", "created_at"], name="tache_statut_created_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+import uuid
+
+from django.db import migrations, models
+
+
+def attribuer_cles(apps, schema_editor):
+    # Une clé distincte par tâche existante : le default de AddField est évalué une seule fois
+    Tache = apps.get_model("questionnaire", "Tache")
+    for tache in Tache.objects.only("pk").iterator():
+        Tache.objects.filter(pk=tache.pk).update(cle=uuid.uuid4())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("questionnaire", "0008_taches"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tache",
+            name="cle",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(attribuer_cles, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="tache",
+            name="cle",
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
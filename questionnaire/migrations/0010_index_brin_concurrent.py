@@ -0,0 +1,75 @@
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations
+from django.db.migrations.operations import AddIndex, RemoveIndex
+
+import questionnaire.models
+
+
+# CREATE/DROP INDEX CONCURRENTLY n'existe que sur PostgreSQL : ailleurs (SQLite
+# en développement), ces opérations se comportent comme AddIndex / RemoveIndex.
+class AjouterIndexConcurrent(AddIndexConcurrently):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class SupprimerIndexConcurrent(RemoveIndexConcurrently):
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            RemoveIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == "postgresql":
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            RemoveIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+def supprimer_ancien_brin(apps, schema_editor):
+    # Index BRIN créé hors de l'état des migrations par 0004 : il est recréé ci-dessous,
+    # déclaré dans Meta.indexes
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS reponse_created_brin")
+
+
+def recreer_ancien_brin(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS reponse_created_brin "
+            "ON questionnaire_reponsequestionnaire USING brin (created_at)"
+        )
+
+
+class Migration(migrations.Migration):
+    # Les index sont construits sans bloquer les écritures, hors transaction
+    atomic = False
+
+    dependencies = [
+        ("questionnaire", "0009_cle_tache"),
+    ]
+
+    operations = [
+        migrations.RunPython(supprimer_ancien_brin, recreer_ancien_brin),
+        AjouterIndexConcurrent(
+            model_name="reponsequestionnaire",
+            index=questionnaire.models.IndexBrin(fields=["created_at"], name="reponse_created_brin"),
+        ),
+        SupprimerIndexConcurrent(
+            model_name="reponsequestionnaire",
+            name="reponse_sexe_idx",
+        ),
+        SupprimerIndexConcurrent(
+            model_name="reponsequestionnaire",
+            name="reponse_frequence_idx",
+        ),
+    ]
@@ -1,5 +1,18 @@
+import uuid
+
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
+
+class IndexBrin(BrinIndex):
+    """Index BRIN sur PostgreSQL ; index B-tree ordinaire sur les autres bases (SQLite en développement)"""
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return models.Index.create_sql(self, model, schema_editor, using=using, **kwargs)
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+
 class ReponseQuestionnaire(models.Model):
     # Section 1 : Informations générales
     nom = models.CharField(max_length=100, blank=True, null=True)
@@ -75,5 +88,135 @@ class ReponseQuestionnaire(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Clé fournie par les tablettes hors ligne : un renvoi du même questionnaire n'est pas réenregistré
+    cle_idempotence = models.CharField(max_length=64, unique=True, blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Liste paginée par curseur (created_at, id) et exports --since
+            models.Index(fields=['created_at', 'id'], name='reponse_created_id_idx'),
+            # Table en ajout seul : created_at suit l'ordre physique des lignes, un BRIN de
+            # quelques pages couvre les filtres par période
+            IndexBrin(fields=['created_at'], name='reponse_created_brin'),
+            # Filtres et regroupements courants (pas de sexe ni de frequence seuls : trop peu
+            # de valeurs distinctes, un parcours de table coûte moins cher)
+            models.Index(fields=['ville', 'created_at'], name='reponse_ville_created_idx'),
+            models.Index(fields=['utilise_plantes', 'frequence'], name='reponse_plantes_freq_idx'),
+            models.Index(fields=['montant_pret'], name='reponse_montant_idx'),
+        ]
+
     def __str__(self):
         return f"{self.nom} - {self.ville} ({self.created_at.date()})"
+
+
+# --------------------------------------------------------------------
+# Compteurs agrégés du tableau de bord (maintenus à chaque réponse)
+# --------------------------------------------------------------------
+# Les compteurs sont signés : les décréments passent par un INSERT ... ON CONFLICT
+# dont la ligne proposée porte une valeur négative (voir questionnaire.rollups).
+class StatistiqueJournaliere(models.Model):
+    """Nombre de réponses et somme des âges renseignés, par jour"""
+    jour = models.DateField(unique=True)
+    total = models.BigIntegerField(default=0)
+    nb_age = models.BigIntegerField(default=0)
+    somme_age = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.jour} : {self.total} réponse(s)"
+
+
+class CompteurJournalier(models.Model):
+    """Nombre de réponses par jour pour une modalité d'une dimension du tableau de bord"""
+    jour = models.DateField()
+    champ = models.CharField(max_length=50)
+    # Valeur stockée (ou tranche d'âge) ; chaîne vide pour « non renseigné »
+    modalite = models.CharField(max_length=50, blank=True)
+    total = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['jour', 'champ', 'modalite'], name='compteur_jour_champ_modalite_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.jour} {self.champ}={self.modalite} : {self.total}"
+
+
+# --------------------------------------------------------------------
+# Réponses à choix multiples, normalisées et indexées
+# --------------------------------------------------------------------
+class OptionReponse(models.Model):
+    """Une option distincte d'une question à choix multiples (ex. lieu_achat = « Marchés locaux »)"""
+    champ = models.CharField(max_length=50)
+    valeur = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['champ', 'valeur'], name='option_champ_valeur_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.champ} : {self.valeur}"
+
+
+class ReponseOption(models.Model):
+    """Option cochée par une réponse"""
+    reponse = models.ForeignKey(ReponseQuestionnaire, on_delete=models.CASCADE, related_name='options')
+    option = models.ForeignKey(OptionReponse, on_delete=models.CASCADE, related_name='reponses')
+
+    class Meta:
+        constraints = [
+            # Index (option_id, reponse_id) : « qui a coché X » est une lecture d'index
+            models.UniqueConstraint(fields=['option', 'reponse'], name='reponse_option_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.reponse_id} → {self.option}"
+
+
+# --------------------------------------------------------------------
+# Tâches en arrière-plan (exports lourds, voir questionnaire.taches)
+# --------------------------------------------------------------------
+class Tache(models.Model):
+    """Travail exécuté hors requête par ``manage.py run_workers``"""
+    EN_ATTENTE = 'en_attente'
+    EN_COURS = 'en_cours'
+    TERMINEE = 'terminee'
+    ECHEC = 'echec'
+    STATUTS = [
+        (EN_ATTENTE, 'En attente'),
+        (EN_COURS, 'En cours'),
+        (TERMINEE, 'Terminée'),
+        (ECHEC, 'Échec'),
+    ]
+
+    # Identifie la tâche dans les URL de suivi : l'id séquentiel se devine
+    cle = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    type = models.CharField(max_length=50)
+    parametres = models.JSONField(default=dict, blank=True)
+    statut = models.CharField(max_length=20, choices=STATUTS, default=EN_ATTENTE)
+
+    # Avancement dans l'unité du travail (lignes, fiches) ; total inconnu = None
+    progression = models.PositiveBigIntegerField(default=0)
+    total = models.PositiveBigIntegerField(blank=True, null=True)
+
+    # Chemin du fichier produit, relatif à TACHES_DIR
+    resultat = models.CharField(max_length=255, blank=True)
+    erreur = models.TextField(blank=True)
+    tentatives = models.PositiveSmallIntegerField(default=0)
+
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    debut = models.DateTimeField(blank=True, null=True)
+    fin = models.DateTimeField(blank=True, null=True)
+    # Mis à jour pendant l'exécution : une tâche muette depuis trop longtemps est reprise
+    battement = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Prise de la plus ancienne tâche en attente, reprise des tâches abandonnées
+            models.Index(fields=['statut', 'created_at'], name='tache_statut_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Tâche {self.pk} {self.type} ({self.statut})"
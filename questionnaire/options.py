@@ -0,0 +1,106 @@
+"""
+Réponses à choix multiples sous forme normalisée.
+
+Les champs texte ``types_soins``, ``lieu_achat``, ``motivations``,
+``criteres_achat`` et ``interet_services`` contiennent plusieurs options
+séparées par des virgules. Chaque option distincte est stockée une fois dans
+``OptionReponse`` et reliée aux réponses par ``ReponseOption`` : compter ou
+filtrer sur une option devient une lecture d'index au lieu d'un LIKE sur
+toute la table.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Count
+
+from questionnaire.models import OptionReponse, ReponseOption
+
+CHAMPS_MULTIPLES = ['types_soins', 'lieu_achat', 'motivations', 'criteres_achat', 'interet_services']
+
+SEPARATEURS = re.compile(r'[,;\n]')
+
+LONGUEUR_MAX = OptionReponse._meta.get_field('valeur').max_length
+
+
+def decouper(texte):
+    """Options distinctes d'un champ texte, dans l'ordre de saisie"""
+    if not texte:
+        return []
+    valeurs = []
+    for morceau in SEPARATEURS.split(texte):
+        valeur = ' '.join(morceau.split())[:LONGUEUR_MAX]
+        if valeur and valeur not in valeurs:
+            valeurs.append(valeur)
+    return valeurs
+
+
+def synchroniser(reponses):
+    """
+    Crée les options et les liens des réponses données (déjà enregistrées).
+    Quelques requêtes par lot, quel que soit le nombre de réponses.
+    """
+    couples = {
+        (reponse.pk, champ, valeur)
+        for reponse in reponses
+        for champ in CHAMPS_MULTIPLES
+        for valeur in decouper(getattr(reponse, champ))
+    }
+    if not couples:
+        return 0
+
+    options = {(champ, valeur) for _, champ, valeur in couples}
+    OptionReponse.objects.bulk_create(
+        [OptionReponse(champ=champ, valeur=valeur) for champ, valeur in options],
+        ignore_conflicts=True, batch_size=500,
+    )
+
+    ids = {}
+    for champ in {champ for champ, _ in options}:
+        valeurs = [valeur for c, valeur in options if c == champ]
+        for debut in range(0, len(valeurs), 500):
+            lues = OptionReponse.objects.filter(champ=champ, valeur__in=valeurs[debut:debut + 500])
+            for pk, valeur in lues.values_list('pk', 'valeur'):
+                ids[(champ, valeur)] = pk
+
+    connexion = connections[router.db_for_write(ReponseOption)]
+    qn = connexion.ops.quote_name
+    meta = ReponseOption._meta
+    insertion = (
+        f"INSERT INTO {qn(meta.db_table)} "
+        f"({qn(meta.get_field('reponse').column)}, {qn(meta.get_field('option').column)}) "
+    )
+    liens = [(reponse_id, ids[(champ, valeur)]) for reponse_id, champ, valeur in couples]
+    with connexion.cursor() as cursor:
+        if connexion.vendor == 'postgresql':
+            # Une instruction et deux tableaux en paramètres, quel que soit le nombre de liens
+            reponses_ids, options_ids = zip(*liens)
+            cursor.execute(
+                insertion + "SELECT * FROM unnest(%s::bigint[], %s::bigint[]) ON CONFLICT DO NOTHING",
+                [list(reponses_ids), list(options_ids)],
+            )
+        else:
+            # executemany direct : bien plus rapide que bulk_create pour des lignes de deux entiers
+            cursor.executemany(insertion + "VALUES (%s, %s) ON CONFLICT DO NOTHING", liens)
+    return len(couples)
+
+
+def avec_options(queryset, *options):
+    """
+    Restreint un queryset de réponses à celles qui ont coché toutes les options données.
+    Exemple : ``avec_options(qs, ('lieu_achat', 'Marchés locaux'), ('interet_services', 'Consultations'))``
+    """
+    for champ, valeur in options:
+        queryset = queryset.filter(
+            pk__in=ReponseOption.objects.filter(option__champ=champ, option__valeur=valeur).values('reponse_id')
+        )
+    return queryset
+
+
+def comptes(champ, queryset=None):
+    """Nombre de réponses par option d'un champ, des plus fréquentes aux plus rares"""
+    liens = ReponseOption.objects.filter(option__champ=champ)
+    if queryset is not None:
+        liens = liens.filter(reponse__in=queryset)
+    return list(
+        liens.values_list('option__valeur').annotate(total=Count('reponse_id')).order_by('-total', 'option__valeur')
+    )
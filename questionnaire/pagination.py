@@ -0,0 +1,79 @@
+"""
+Pagination par curseur (keyset) sur ``(created_at, id)``.
+
+Contrairement à OFFSET, le coût d'une page ne dépend pas de sa position :
+la base descend directement dans l'index jusqu'au curseur puis lit
+``taille`` lignes.
+"""
+import datetime
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+SEPARATEUR = '_'
+# Plus grand id d'un BigAutoField : au-delà, la base refuserait le paramètre
+ID_MAX = 2 ** 63 - 1
+
+
+class CurseurInvalide(ValueError):
+    pass
+
+
+def encoder_curseur(ligne):
+    """Curseur opaque pour une ligne (dict avec 'created_at' et 'id')"""
+    return f"{ligne['created_at'].isoformat()}{SEPARATEUR}{ligne['id']}"
+
+
+def decoder_curseur(curseur):
+    """Retourne (created_at, id) à partir d'un curseur"""
+    horodatage, _, identifiant = curseur.rpartition(SEPARATEUR)
+    try:
+        # parse_datetime lève ValueError pour une date bien formée mais impossible (mois 13)
+        moment = parse_datetime(horodatage) if horodatage else None
+    except ValueError:
+        moment = None
+    if moment is None or not identifiant.isascii() or not identifiant.isdigit() or int(identifiant) > ID_MAX:
+        raise CurseurInvalide(f"Curseur invalide : {curseur}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, datetime.timezone.utc)
+    return moment, int(identifiant)
+
+
+def page_keyset(queryset, apres=None, avant=None, taille=50):
+    """
+    Page de ``taille`` lignes, de la plus récente à la plus ancienne.
+
+    ``apres`` : curseur de la dernière ligne de la page précédente (page suivante).
+    ``avant`` : curseur de la première ligne de la page courante (page précédente).
+
+    Retourne (lignes, curseur_suivant, curseur_precedent) ; un curseur vaut
+    None quand il n'y a plus rien dans cette direction.
+    """
+    if avant:
+        moment, identifiant = decoder_curseur(avant)
+        queryset = queryset.filter(
+            Q(created_at__gt=moment) | Q(created_at=moment, id__gt=identifiant)
+        ).order_by('created_at', 'id')
+    else:
+        queryset = queryset.order_by('-created_at', '-id')
+        if apres:
+            moment, identifiant = decoder_curseur(apres)
+            queryset = queryset.filter(
+                Q(created_at__lt=moment) | Q(created_at=moment, id__lt=identifiant)
+            )
+
+    # Une ligne de plus pour savoir s'il existe une page au-delà
+    lignes = list(queryset[:taille + 1])
+    encore = len(lignes) > taille
+    lignes = lignes[:taille]
+
+    if avant:
+        lignes.reverse()
+        precedent = encoder_curseur(lignes[0]) if encore and lignes else None
+        suivant = encoder_curseur(lignes[-1]) if lignes else None
+    else:
+        suivant = encoder_curseur(lignes[-1]) if encore else None
+        precedent = encoder_curseur(lignes[0]) if apres and lignes else None
+
+    return lignes, suivant, precedent
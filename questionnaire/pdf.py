@@ -0,0 +1,234 @@
+"""
+Génération des PDF du questionnaire (reportlab).
+
+Ce module n'utilise pas Django : les fonctions de rendu reçoivent des
+valeurs simples et peuvent tourner dans un processus séparé.
+
+Le questionnaire vierge ne dépend que du code : il est rendu une fois par
+processus puis servi depuis la mémoire. Sa version (empreinte des sections
+et de ``VERSION_MISE_EN_PAGE``) sert d'ETag ; modifier les sections change
+la version et invalide d'office la copie en mémoire et celles des clients.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+
+# À incrémenter quand le dessin change sans que les sections changent
+VERSION_MISE_EN_PAGE = 1
+
+# À incrémenter quand le dessin des fiches de réponse change (invalide le cache disque)
+VERSION_FICHE = 1
+
+TITRE_QUESTIONNAIRE = "Questionnaire Étude de Marché – Médecine Naturelle au Sénégal"
+
+# Une question est une chaîne (ligne à compléter) ou un tuple (question, options à cocher)
+SECTIONS_QUESTIONNAIRE = [
+    ("Section 1 : Informations générales", [
+        "Nom : ___________________________",
+        "Âge : ___________________________",
+        "Sexe : ___________________________",
+        "Profession : ___________________________"
+    ]),
+    ("Section 2 : Habitudes de consommation", [
+        ("Achetez-vous régulièrement des produits naturels ?", ["Oui", "Non"]),
+        ("Si oui, où les achetez-vous ?", ["Pharmacie", "Marché", "En ligne", "Autre"]),
+        "Quels types de produits naturels consommez-vous ? ___________________________"
+    ]),
+]
+
+
+def check_page_space(y, c, min_space=5 * cm):
+    """Crée une nouvelle page si la zone d'écriture est presque pleine"""
+    if y < min_space:
+        c.showPage()
+        y = 27 * cm
+    return y
+
+
+def dessiner_questionnaire_vierge(sortie, titre=TITRE_QUESTIONNAIRE, sections=SECTIONS_QUESTIONNAIRE):
+    """Dessine le questionnaire vierge dans ``sortie`` (fichier ou réponse HTTP)"""
+    # invariant : pas de date ni d'identifiant aléatoire, même contenu à chaque rendu
+    c = canvas.Canvas(sortie, pagesize=A4, invariant=1)
+
+    def add_title(title, y):
+        c.setFont("Helvetica-Bold", 16)
+        c.setFillColor(colors.darkblue)
+        c.drawString(2 * cm, y, title)
+        return y - 1.5 * cm
+
+    def add_section_title(title, y):
+        c.setFont("Helvetica-Bold", 14)
+        c.setFillColor(colors.green)
+        c.drawString(2 * cm, y, title)
+        return y - 1 * cm
+
+    def add_question(question, y):
+        c.setFont("Helvetica", 12)
+        c.setFillColor(colors.black)
+        c.drawString(2.5 * cm, y, f"- {question}")
+        return y - 1 * cm
+
+    def add_checkbox(question, options, y):
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(2.5 * cm, y, f"- {question}")
+        y -= 0.8 * cm
+
+        c.setFont("Helvetica", 12)
+        for opt in options:
+            c.setFillColor(colors.white)
+            c.setStrokeColor(colors.black)
+            c.rect(3 * cm, y - 0.3 * cm, 0.4 * cm, 0.4 * cm, fill=1)
+            c.setFillColor(colors.black)
+            c.drawString(3.6 * cm, y - 0.2 * cm, opt)
+            y -= 0.8 * cm
+
+        return y - 0.3 * cm
+
+    # --- Structure du PDF ---
+    y = 27 * cm
+    y = add_title(titre, y)
+
+    for title, items in sections:
+        y = check_page_space(y, c)
+        y = add_section_title(title, y)
+        for item in items:
+            if isinstance(item, tuple):
+                y = add_checkbox(item[0], item[1], y)
+            else:
+                y = add_question(item, y)
+        y -= 0.5 * cm
+
+    c.save()
+
+
+def version_vierge():
+    """Empreinte du questionnaire vierge : change avec les sections ou la mise en page"""
+    definition = json.dumps([VERSION_MISE_EN_PAGE, TITRE_QUESTIONNAIRE, SECTIONS_QUESTIONNAIRE], ensure_ascii=False)
+    return hashlib.sha256(definition.encode()).hexdigest()[:16]
+
+
+# Date de dernière modification commune à tous les workers : celle de ce module
+DATE_MODIFICATION = datetime.fromtimestamp(int(os.path.getmtime(__file__)), tz=timezone.utc)
+
+_vierge = {}
+_verrou_vierge = threading.Lock()
+
+
+def questionnaire_vierge():
+    """Octets du PDF vierge pour la version courante, rendus au premier appel"""
+    version = version_vierge()
+    contenu = _vierge.get(version)
+    if contenu is None:
+        with _verrou_vierge:
+            contenu = _vierge.get(version)
+            if contenu is None:
+                sortie = io.BytesIO()
+                dessiner_questionnaire_vierge(sortie)
+                _vierge.clear()
+                _vierge[version] = contenu = sortie.getvalue()
+    return contenu
+
+
+def dessiner_reponse(sortie, lignes):
+    """Dessine la fiche d'une réponse : une ligne « champ: valeur » par champ"""
+    c = canvas.Canvas(sortie, pagesize=A4)
+    y = 27 * cm
+
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(2 * cm, y, "Réponse au Questionnaire")
+    y -= 1 * cm
+
+    c.setFont("Helvetica", 12)
+    for ligne in lignes:
+        c.drawString(2 * cm, y, ligne)
+        y -= 0.6 * cm
+        if y < 3 * cm:
+            c.showPage()
+            y = 27 * cm
+
+    c.save()
+
+
+def rendre_reponse(lignes):
+    """Octets du PDF d'une réponse"""
+    sortie = io.BytesIO()
+    dessiner_reponse(sortie, lignes)
+    return sortie.getvalue()
+
+
+def rendre_lot(lot):
+    """Rend une liste de (nom de fichier, lignes) ; exécuté dans un processus du pool"""
+    return [(nom, rendre_reponse(lignes)) for nom, lignes in lot]
+
+
+def dessiner_formulaire_interactif(sortie, titre, sections):
+    """
+    Dessine le questionnaire à remplir à l'écran (AcroForm). Une question est
+    une chaîne (ligne à compléter) ou un tuple (question, options, nom du
+    champ) : une case à cocher par option, nommée ``<champ>_<i>``.
+    """
+    c = canvas.Canvas(sortie, pagesize=A4, invariant=1)
+    _, height = A4
+    margin = 2 * cm
+
+    def add_section_title(title, y_pos):
+        c.setFillColor(colors.green)
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(margin, y_pos, title)
+        return y_pos - 1 * cm
+
+    def add_question(question, y_pos):
+        c.setFillColor(colors.black)
+        c.setFont("Helvetica", 12)
+        c.drawString(margin, y_pos, question)
+        return y_pos - 0.7 * cm
+
+    def add_checkbox(question, options, y_pos, field_prefix):
+        y_pos = add_question(question, y_pos)
+        c.setFont("Helvetica", 12)
+        for i, option in enumerate(options):
+            c.acroForm.checkbox(
+                name=f"{field_prefix}_{i}",
+                tooltip=option,
+                x=margin,
+                y=y_pos - 0.2 * cm,
+                size=12,
+                borderStyle='solid',
+                borderWidth=1,
+                fillColor=colors.white,
+                textColor=colors.black,
+                buttonStyle='check'
+            )
+            c.drawString(margin + 0.6 * cm, y_pos, option)
+            y_pos -= 0.7 * cm
+        return y_pos
+
+    y = height - margin
+    c.setFont("Helvetica-Bold", 16)
+    c.setFillColor(colors.darkblue)
+    c.drawString(margin, y, titre)
+    y -= 1.5 * cm
+
+    for title, items in sections:
+        y = check_page_space(y, c)
+        y = add_section_title(title, y)
+        for item in items:
+            if isinstance(item, tuple):
+                question, options, champ = item
+                # Une question et ses cases restent sur la même page
+                y = check_page_space(y, c, min_space=margin + 0.7 * cm * (1 + len(options)))
+                y = add_checkbox(question, options, y, champ)
+            else:
+                y = check_page_space(y, c, min_space=margin + 0.7 * cm)
+                y = add_question(item, y)
+        y -= 1 * cm
+
+    c.save()
@@ -0,0 +1,192 @@
+"""
+Profilage d'une requête à la demande, en production, sans redéploiement.
+
+Désactivé par défaut : le middleware n'est chargé que si ``PROFILER_ACTIF``
+(variable d'environnement) est vrai, le temps d'une investigation.
+
+Une requête est profilée si elle porte ``?profiler=1`` et vient d'un membre
+du staff, ou si elle porte l'en-tête ``X-Profiler`` avec un jeton signé
+(``manage.py profiler --jeton``, valable ``PROFILER_JETON_DUREE`` secondes).
+La vue tourne alors sous cProfile, flux de la réponse compris ; le profil
+(format pstats : ``python -m pstats``, snakeviz...) et la chronologie des
+requêtes SQL (JSON) sont écrits dans ``PROFILER_DIR``, et la réponse indique
+leur nom dans l'en-tête ``X-Profil``. ``manage.py profiler <nom>`` les affiche.
+
+Depuis Python 3.12, cProfile est global au processus : un seul profil peut être
+actif à la fois, et il enregistre aussi les appels des autres threads (autres
+requêtes des workers gthread, threads de journalisation et de métriques). Une
+requête qui demande un profil alors qu'un autre est en cours est servie
+normalement, sans profil.
+
+Les autres requêtes ne paient qu'une lecture d'en-tête et de paramètre.
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils import timezone
+
+from questionnaire.metriques import VUE_INCONNUE, a_la_fin
+
+EN_TETE = 'X-Profiler'
+# En-tête de la réponse : nom du profil enregistré
+EN_TETE_REPONSE = 'X-Profil'
+PARAMETRE = 'profiler'
+SEL = 'questionnaire.profiler'
+
+# Un seul profil à la fois par processus (voir le module)
+_verrou = threading.Lock()
+
+
+def jeton():
+    """Valeur signée à envoyer dans l'en-tête X-Profiler"""
+    return signing.TimestampSigner(salt=SEL).sign(uuid.uuid4().hex)
+
+
+def jeton_valide(valeur):
+    try:
+        signing.TimestampSigner(salt=SEL).unsign(valeur, max_age=settings.PROFILER_JETON_DUREE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def demande(request):
+    """La requête demande-t-elle (et a-t-elle le droit) d'être profilée ?"""
+    valeur = request.headers.get(EN_TETE)
+    if valeur:
+        return jeton_valide(valeur)
+    if request.GET.get(PARAMETRE):
+        utilisateur = getattr(request, 'user', None)
+        return bool(utilisateur and utilisateur.is_staff)
+    return False
+
+
+def dossier():
+    return settings.PROFILER_DIR
+
+
+def chemins(nom):
+    """(profil pstats, chronologie SQL) d'un profil"""
+    base = os.path.join(dossier(), os.path.basename(nom))
+    return base + '.prof', base + '.sql.json'
+
+
+def profils():
+    """Noms des profils enregistrés, du plus récent au plus ancien"""
+    try:
+        fichiers = [f for f in os.listdir(dossier()) if f.endswith('.prof')]
+    except FileNotFoundError:
+        return []
+    return sorted((f[:-len('.prof')] for f in fichiers), reverse=True)
+
+
+def _nettoyer():
+    """Ne garde que les PROFILER_MAX_FICHIERS profils les plus récents"""
+    for nom in profils()[settings.PROFILER_MAX_FICHIERS:]:
+        for chemin in chemins(nom):
+            try:
+                os.remove(chemin)
+            except FileNotFoundError:
+                pass
+
+
+class _ChronologieSql:
+    """Wrapper d'exécution : début, durée et texte de chaque requête SQL"""
+
+    def __init__(self, origine):
+        self.origine = origine
+        self.requetes = []
+
+    def __call__(self, execute, sql, params, many, context):
+        debut = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.enregistrer(sql, params, many, context, debut, time.perf_counter(), True)
+
+    def enregistrer(self, sql, params, many, context, debut, fin, reussie):
+        self.requetes.append({
+            'debut_ms': round((debut - self.origine) * 1000, 3),
+            'duree_ms': round((fin - debut) * 1000, 3),
+            'sql': sql,
+            'many': many,
+        })
+
+
+class ProfilerMiddleware:
+    """Profile les requêtes qui le demandent (voir le module). Après AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        if not settings.PROFILER_ACTIF:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not demande(request):
+            return self.get_response(request)
+
+        if not _verrou.acquire(blocking=False):
+            return self.get_response(request)
+
+        origine = time.perf_counter()
+        sql = _ChronologieSql(origine)
+        profil = cProfile.Profile()
+        connection.execute_wrappers.append(sql)
+        try:
+            profil.enable()
+        except ValueError:
+            # Un autre outil de profilage est actif dans le processus
+            self._detacher(profil, sql)
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self._detacher(profil, sql)
+            raise
+
+        correspondance = getattr(request, 'resolver_match', None)
+        vue = correspondance.url_name if correspondance and correspondance.url_name else VUE_INCONNUE
+        nom = f"{timezone.now():%Y%m%d-%H%M%S}-{vue}-{uuid.uuid4().hex[:8]}"
+        response[EN_TETE_REPONSE] = nom
+
+        def terminer(taille):
+            self._detacher(profil, sql)
+            self._enregistrer(nom, profil, sql, request, response, vue, time.perf_counter() - origine, taille)
+
+        return a_la_fin(response, terminer)
+
+    @staticmethod
+    def _detacher(profil, sql):
+        """Arrête le profil, retire le wrapper SQL et libère le verrou, même après une erreur"""
+        try:
+            profil.disable()
+        finally:
+            if sql in connection.execute_wrappers:
+                connection.execute_wrappers.remove(sql)
+            _verrou.release()
+
+    @staticmethod
+    def _enregistrer(nom, profil, sql, request, response, vue, duree, taille):
+        os.makedirs(dossier(), exist_ok=True)
+        fichier_profil, fichier_sql = chemins(nom)
+        profil.dump_stats(fichier_profil)
+        with open(fichier_sql, 'w', encoding='utf-8') as sortie:
+            json.dump({
+                'vue': vue,
+                'methode': request.method,
+                'chemin': request.get_full_path(),
+                'statut': response.status_code,
+                'duree_ms': round(duree * 1000, 3),
+                'taille': taille,
+                'sql_total_ms': round(sum(r['duree_ms'] for r in sql.requetes), 3),
+                'requetes': sql.requetes,
+            }, sortie, ensure_ascii=False, indent=1)
+        _nettoyer()
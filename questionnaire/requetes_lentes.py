@@ -0,0 +1,220 @@
+"""
+Journal des requêtes SQL lentes (activé par ``REQUETES_LENTES_SEUIL_MS``).
+
+``RequetesLentesMiddleware`` installe un wrapper d'exécution
+(``connection.execute_wrapper``) le temps de chaque requête HTTP, flux compris.
+Toute requête SQL plus longue que le seuil est écrite, en une ligne JSON, dans
+le logger ``questionnaire.requetes_lentes`` : vue, durée, SQL et forme des
+paramètres (types et nombre de lignes, jamais les valeurs). Sur PostgreSQL,
+``REQUETES_LENTES_EXPLAIN`` y ajoute le plan (EXPLAIN sans ANALYZE, la requête
+n'est pas rejouée).
+
+Seuil à 0 : le middleware se retire de la chaîne au démarrage, aucun coût.
+``manage.py requetes_lentes`` résume le journal.
+"""
+import json
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from questionnaire import journalisation
+from questionnaire.metriques import VUE_INCONNUE, a_la_fin
+
+logger = logging.getLogger(__name__)
+
+# Longueur maximale du SQL journalisé
+SQL_MAX = 4000
+
+# Requêtes dont le plan peut être demandé
+LECTURE = re.compile(r'\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+
+def forme(params, many=False):
+    """Forme des paramètres : types (et nombre de lignes pour executemany), sans les valeurs"""
+    if params is None:
+        return None
+    if many:
+        if not isinstance(params, (list, tuple)):
+            # Itérateur déjà consommé par l'exécution
+            return {'lignes': None}
+        return {'lignes': len(params), 'ligne': forme(params[0]) if params else None}
+    if isinstance(params, dict):
+        return {cle: type(valeur).__name__ for cle, valeur in params.items()}
+    types = [type(valeur).__name__ for valeur in params]
+    # « str×40 » plutôt que 40 fois « str » (listes IN)
+    resume = []
+    for nom in types:
+        if resume and resume[-1][0] == nom:
+            resume[-1][1] += 1
+        else:
+            resume.append([nom, 1])
+    return [nom if n == 1 else f'{nom}×{n}' for nom, n in resume]
+
+
+def normaliser(sql):
+    """SQL sans ses littéraux ni la longueur des listes IN, pour regrouper les requêtes semblables"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = re.sub(r'%s', '?', sql)
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?…)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+# Point de sauvegarde qui isole l'EXPLAIN de la transaction de la vue
+SAVEPOINT_EXPLAIN = 'requetes_lentes_explain'
+
+
+def _expliquer(contexte, sql, params):
+    """
+    Plan PostgreSQL de la requête, par le curseur brut (sans repasser par les
+    wrappers). Dans une transaction, l'EXPLAIN passe par un point de
+    sauvegarde : s'il échoue, la transaction de la vue reste utilisable.
+    """
+    transaction_ouverte = contexte['connection'].in_atomic_block
+    try:
+        with contexte['connection'].connection.cursor() as curseur:
+            if transaction_ouverte:
+                curseur.execute(f'SAVEPOINT {SAVEPOINT_EXPLAIN}')
+            try:
+                curseur.execute('EXPLAIN ' + sql, params)
+                plan = '\n'.join(ligne[0] for ligne in curseur.fetchall())
+            except Exception:
+                if transaction_ouverte:
+                    curseur.execute(f'ROLLBACK TO SAVEPOINT {SAVEPOINT_EXPLAIN}')
+                raise
+            finally:
+                if transaction_ouverte:
+                    curseur.execute(f'RELEASE SAVEPOINT {SAVEPOINT_EXPLAIN}')
+            return plan
+    except Exception as e:
+        return f"EXPLAIN impossible : {e}"
+
+
+class _Enregistreur:
+    """Wrapper d'exécution d'une requête HTTP : chronomètre et journalise les requêtes SQL lentes"""
+
+    def __init__(self, request, seuil, expliquer):
+        self.request = request
+        self.seuil = seuil
+        self.expliquer = expliquer
+
+    def __call__(self, execute, sql, params, many, contexte):
+        debut = time.perf_counter()
+        reussie = False
+        try:
+            resultat = execute(sql, params, many, contexte)
+            reussie = True
+            return resultat
+        finally:
+            self.enregistrer(sql, params, many, contexte, debut, time.perf_counter(), reussie)
+
+    def enregistrer(self, sql, params, many, contexte, debut, fin, reussie):
+        duree = (fin - debut) * 1000
+        if duree >= self.seuil:
+            self._journaliser(sql, params, many, contexte, duree, reussie)
+
+    def _journaliser(self, sql, params, many, contexte, duree, reussie):
+        correspondance = getattr(self.request, 'resolver_match', None)
+        entree = {
+            'moment': timezone.now().isoformat(),
+            'vue': correspondance.view_name if correspondance else VUE_INCONNUE,
+            'methode': self.request.method,
+            'chemin': self.request.path,
+            'duree_ms': round(duree, 3),
+            'sql': sql[:SQL_MAX],
+            'params': forme(params, many),
+        }
+        if not reussie:
+            entree['erreur'] = True
+        elif self.expliquer and not many and contexte['connection'].vendor == 'postgresql' and LECTURE.match(sql):
+            entree['plan'] = _expliquer(contexte, sql, params)
+        logger.warning(json.dumps(entree, ensure_ascii=False, default=str))
+
+
+class RequetesLentesMiddleware:
+    """Journalise les requêtes SQL lentes de chaque requête HTTP (voir le module)"""
+
+    def __init__(self, get_response):
+        if not settings.REQUETES_LENTES_SEUIL_MS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        enregistreur = _Enregistreur(request, settings.REQUETES_LENTES_SEUIL_MS, settings.REQUETES_LENTES_EXPLAIN)
+        connection.execute_wrappers.append(enregistreur)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            connection.execute_wrappers.remove(enregistreur)
+            raise
+
+        def terminer(taille):
+            if enregistreur in connection.execute_wrappers:
+                connection.execute_wrappers.remove(enregistreur)
+
+        return a_la_fin(response, terminer)
+
+
+# --------------------------------------------------------------------
+# Lecture du journal (manage.py requetes_lentes)
+# --------------------------------------------------------------------
+def fichiers_journal(chemin=None):
+    """Les journaux de tous les processus et leurs rotations (voir journalisation.fichiers)"""
+    return journalisation.fichiers(chemin or settings.REQUETES_LENTES_FICHIER)
+
+
+def lire(fichiers, depuis=None, vue=None):
+    """
+    Entrées du journal (dictionnaires), filtrées ; les lignes illisibles sont
+    ignorées, ainsi que celles sans ``moment`` lisible quand ``depuis`` est donné
+    """
+    for nom in fichiers:
+        with open(nom, encoding='utf-8') as fichier:
+            for ligne in fichier:
+                try:
+                    entree = json.loads(ligne)
+                except ValueError:
+                    continue
+                if not isinstance(entree, dict) or not isinstance(entree.get('sql'), str):
+                    continue
+                if depuis:
+                    moment = entree.get('moment')
+                    try:
+                        moment = parse_datetime(moment) if isinstance(moment, str) else None
+                    except ValueError:
+                        moment = None
+                    if moment is not None and timezone.is_naive(moment):
+                        moment = timezone.make_aware(moment)
+                    if moment is None or moment < depuis:
+                        continue
+                if vue and (entree.get('vue') or VUE_INCONNUE) != vue:
+                    continue
+                yield entree
+
+
+def resumer(entrees, tri='total'):
+    """Regroupe les entrées par SQL normalisé ; liste triée de dictionnaires (le plus coûteux d'abord)"""
+    groupes = {}
+    for entree in entrees:
+        cle = normaliser(entree['sql'])
+        groupe = groupes.get(cle)
+        if groupe is None:
+            groupe = groupes[cle] = {'sql': cle, 'nombre': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'vues': set(), 'pire': None}
+        groupe['nombre'] += 1
+        duree = entree.get('duree_ms') or 0
+        groupe['total_ms'] += duree
+        groupe['vues'].add(entree.get('vue') or VUE_INCONNUE)
+        if duree >= groupe['max_ms']:
+            groupe['max_ms'] = duree
+            groupe['pire'] = entree
+    for groupe in groupes.values():
+        groupe['moyenne_ms'] = groupe['total_ms'] / groupe['nombre']
+        groupe['vues'] = sorted(groupe['vues'])
+    cle_tri = {'total': 'total_ms', 'max': 'max_ms', 'moyenne': 'moyenne_ms', 'nombre': 'nombre'}[tri]
+    return sorted(groupes.values(), key=lambda g: g[cle_tri], reverse=True)
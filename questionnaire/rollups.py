@@ -0,0 +1,196 @@
+"""
+Compteurs agrégés du tableau de bord.
+
+Chaque nouvelle réponse incrémente, dans la même transaction, quelques
+compteurs par jour (``StatistiqueJournaliere`` et ``CompteurJournalier``).
+Le tableau de bord lit ces compteurs au lieu de parcourir la table des
+réponses. ``manage.py rebuild_rollups`` les recalcule depuis les réponses,
+table des réponses verrouillée en écriture le temps du recalcul.
+
+Attention : ``bulk_create`` et ``QuerySet.update`` ne déclenchent pas les
+signaux ; les chemins d'insertion en masse appellent ``incrementer``
+eux-mêmes. ``QuerySet.delete()`` envoie ``post_delete`` pour chaque réponse
+supprimée : les compteurs suivent les suppressions, une requête par réponse.
+"""
+from collections import Counter
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from questionnaire import stats
+from questionnaire.models import CompteurJournalier, ReponseQuestionnaire, StatistiqueJournaliere
+
+
+def _cles_connues():
+    return {
+        (nom, stats.cle_modalite(cle))
+        for nom, _, modalites in stats.dimensions()
+        for cle, _, _ in modalites
+    }
+
+
+# Lignes par instruction INSERT (limite du nombre de paramètres SQLite)
+TAILLE_LOT_UPSERT = 500
+
+
+def _upsert(modele, cles, sommes, lignes):
+    """
+    INSERT ... ON CONFLICT DO UPDATE qui ajoute les colonnes ``sommes`` aux
+    valeurs existantes (SQLite >= 3.24 et PostgreSQL).
+    """
+    connexion = connections[router.db_for_write(modele)]
+    qn = connexion.ops.quote_name
+    table = qn(modele._meta.db_table)
+    colonnes = cles + sommes
+    mise_a_jour = ', '.join(f'{qn(c)} = {table}.{qn(c)} + excluded.{qn(c)}' for c in sommes)
+
+    with connexion.cursor() as cursor:
+        for debut in range(0, len(lignes), TAILLE_LOT_UPSERT):
+            lot = lignes[debut:debut + TAILLE_LOT_UPSERT]
+            valeurs = ', '.join(['(' + ', '.join(['%s'] * len(colonnes)) + ')'] * len(lot))
+            sql = (
+                f"INSERT INTO {table} ({', '.join(qn(c) for c in colonnes)}) VALUES {valeurs} "
+                f"ON CONFLICT ({', '.join(qn(c) for c in cles)}) DO UPDATE SET {mise_a_jour}"
+            )
+            cursor.execute(sql, [v for ligne in lot for v in ligne])
+
+
+def incrementer(reponses, signe=1):
+    """
+    Ajoute (ou retire avec ``signe=-1``) des réponses aux compteurs.
+    Deux requêtes au plus, quel que soit le nombre de réponses.
+    """
+    cles_connues = _cles_connues()
+    jours = {}
+    compteurs = Counter()
+
+    for reponse in reponses:
+        jour = timezone.localtime(reponse.created_at).date()
+        total, nb_age, somme_age = jours.get(jour, (0, 0, 0))
+        if reponse.age is not None:
+            nb_age, somme_age = nb_age + signe, somme_age + signe * reponse.age
+        jours[jour] = (total + signe, nb_age, somme_age)
+
+        for cle in stats.modalites_reponse(reponse):
+            if cle in cles_connues:
+                compteurs[(jour, *cle)] += signe
+
+    with transaction.atomic(using=router.db_for_write(StatistiqueJournaliere)):
+        _upsert(StatistiqueJournaliere, ['jour'], ['total', 'nb_age', 'somme_age'],
+                [(jour, *valeurs) for jour, valeurs in jours.items()])
+        _upsert(CompteurJournalier, ['jour', 'champ', 'modalite'], ['total'],
+                [(*cle, total) for cle, total in compteurs.items()])
+
+
+def statistiques():
+    """Mêmes statistiques que ``stats.statistiques()``, lues dans les compteurs"""
+    cumul = StatistiqueJournaliere.objects.aggregate(
+        total=Sum('total'), nb_age=Sum('nb_age'), somme_age=Sum('somme_age'),
+    )
+    comptes = {
+        (champ, modalite): total
+        for champ, modalite, total in CompteurJournalier.objects.values('champ', 'modalite')
+        .annotate(somme=Sum('total')).values_list('champ', 'modalite', 'somme')
+    }
+    return {
+        'total': cumul['total'] or 0,
+        'moyenne_age': cumul['somme_age'] / cumul['nb_age'] if cumul['nb_age'] else 0,
+        'repartitions': stats.repartitions(comptes),
+    }
+
+
+def calculer(queryset=None):
+    """
+    Recalcule les compteurs depuis les réponses, en un parcours groupé par jour.
+    Retourne ({jour: (total, nb_age, somme_age)}, {(jour, champ, modalite): total}).
+    """
+    if queryset is None:
+        queryset = ReponseQuestionnaire.objects.all()
+
+    lignes = (
+        queryset.annotate(jour=TruncDate('created_at')).order_by().values('jour')
+        .annotate(total=Count('id'), nb_age=Count('age'), somme_age=Sum('age'), **stats.agregats_conditionnels())
+    )
+
+    jours, compteurs = {}, {}
+    for ligne in lignes.iterator():
+        jour = ligne['jour']
+        jours[jour] = (ligne['total'], ligne['nb_age'], ligne['somme_age'] or 0)
+        for (champ, modalite), total in stats.comptes_depuis_agregats(ligne).items():
+            if total:
+                compteurs[(jour, champ, modalite)] = total
+    return jours, compteurs
+
+
+def _verrouiller_reponses():
+    """
+    Bloque les insertions et suppressions de réponses jusqu'à la fin de la
+    transaction en cours, sans gêner les lectures : le parcours des réponses
+    et les compteurs lus ou remplacés ensuite voient le même état. Une
+    réponse enregistrée pendant ce temps attend, puis incrémente les
+    compteurs reconstruits.
+
+    SQLite n'a qu'un écrivain à la fois : une écriture concurrente entre le
+    parcours et le remplacement fait échouer la transaction au lieu de
+    fausser les compteurs.
+    """
+    connexion = connections[router.db_for_write(ReponseQuestionnaire)]
+    if connexion.vendor == 'postgresql':
+        with connexion.cursor() as cursor:
+            cursor.execute(
+                f'LOCK TABLE {connexion.ops.quote_name(ReponseQuestionnaire._meta.db_table)} IN SHARE MODE'
+            )
+
+
+def _comparer(jours, compteurs):
+    """Différences (jour, champ, modalité, stocké, attendu) entre un recalcul et les compteurs stockés"""
+    stockes_jours = {
+        s.jour: (s.total, s.nb_age, s.somme_age) for s in StatistiqueJournaliere.objects.all()
+    }
+    stockes_compteurs = {
+        (c.jour, c.champ, c.modalite): c.total for c in CompteurJournalier.objects.exclude(total=0)
+    }
+
+    differences = []
+    for jour in sorted(set(jours) | set(stockes_jours)):
+        attendu, stocke = jours.get(jour, (0, 0, 0)), stockes_jours.get(jour, (0, 0, 0))
+        if attendu != stocke:
+            differences.append((jour, 'total/nb_age/somme_age', '', stocke, attendu))
+    for cle in sorted(set(compteurs) | set(stockes_compteurs)):
+        attendu, stocke = compteurs.get(cle, 0), stockes_compteurs.get(cle, 0)
+        if attendu != stocke:
+            differences.append((*cle, stocke, attendu))
+    return differences
+
+
+def ecarts(queryset=None):
+    """Liste des différences (jour, champ, modalité, stocké, attendu) avec un recalcul complet"""
+    with transaction.atomic(using=router.db_for_write(ReponseQuestionnaire)):
+        _verrouiller_reponses()
+        return _comparer(*calculer(queryset))
+
+
+def reconstruire(queryset=None):
+    """
+    Remplace tous les compteurs par un recalcul complet, en un seul parcours
+    des réponses et dans une seule transaction.
+    Retourne (écarts corrigés, nombre de jours, nombre de compteurs).
+    """
+    with transaction.atomic(using=router.db_for_write(ReponseQuestionnaire)):
+        _verrouiller_reponses()
+        jours, compteurs = calculer(queryset)
+        differences = _comparer(jours, compteurs)
+        StatistiqueJournaliere.objects.all().delete()
+        CompteurJournalier.objects.all().delete()
+        StatistiqueJournaliere.objects.bulk_create(
+            [StatistiqueJournaliere(jour=jour, total=t, nb_age=n, somme_age=s) for jour, (t, n, s) in jours.items()],
+            batch_size=1000,
+        )
+        CompteurJournalier.objects.bulk_create(
+            [CompteurJournalier(jour=jour, champ=champ, modalite=modalite, total=total)
+             for (jour, champ, modalite), total in compteurs.items()],
+            batch_size=1000,
+        )
+    return differences, len(jours), len(compteurs)
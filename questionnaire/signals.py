@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from questionnaire import cache, cache_pdf, options, rollups
+from questionnaire.models import ReponseQuestionnaire
+
+
+@receiver(post_save, sender=ReponseQuestionnaire)
+def compter_reponse(sender, instance, created, raw=False, **kwargs):
+    """Met à jour les compteurs du tableau de bord et les options cochées à chaque nouvelle réponse"""
+    if created and not raw:
+        rollups.incrementer([instance])
+        options.synchroniser([instance])
+        # Après validation seulement, pour ne pas remettre en cache l'état d'avant
+        transaction.on_commit(cache.invalider)
+    elif not created:
+        # Réponse modifiée (admin) : sa fiche PDF en cache n'est plus à jour
+        identifiant = instance.pk
+        transaction.on_commit(lambda: cache_pdf.supprimer(identifiant))
+
+
+@receiver(post_delete, sender=ReponseQuestionnaire)
+def decompter_reponse(sender, instance, **kwargs):
+    """Retire une réponse supprimée (via l'admin par exemple) des compteurs"""
+    rollups.incrementer([instance], signe=-1)
+    transaction.on_commit(cache.invalider)
+    identifiant = instance.pk
+    transaction.on_commit(lambda: cache_pdf.supprimer(identifiant))
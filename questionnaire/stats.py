@@ -0,0 +1,140 @@
+"""
+Statistiques du tableau de bord.
+
+Toutes les répartitions sont calculées en une seule requête (un seul
+parcours de la table) grâce à l'agrégation conditionnelle
+``Count(..., filter=Q(...))``, au lieu d'un GROUP BY par dimension.
+"""
+from django.db.models import Avg, Count, Q
+
+from questionnaire.models import ReponseQuestionnaire
+
+# Champs à choix affichés sur le tableau de bord, avec leur titre
+CHAMPS_CHOIX = {
+    'sexe': 'Répartition par sexe',
+    'utilise_plantes': 'Utilisation de plantes médicinales',
+    'frequence': "Fréquence d'utilisation",
+    'type_produit': 'Type de produit préféré',
+    'montant_pret': 'Montant prêt à payer',
+}
+
+# Tranches d'âge : (libellé, borne basse incluse, borne haute exclue)
+TRANCHES_AGE = [
+    ('< 18', None, 18),
+    ('18-24', 18, 25),
+    ('25-34', 25, 35),
+    ('35-44', 35, 45),
+    ('45-54', 45, 55),
+    ('55-64', 55, 65),
+    ('65 +', 65, None),
+]
+
+NON_RENSEIGNE = 'Non renseigné'
+
+
+def dimensions():
+    """
+    Liste des dimensions du tableau de bord : (champ, titre, [(clé, libellé, filtre Q)]).
+    La clé est la valeur stockée (ou le libellé de tranche pour l'âge).
+    """
+    meta = ReponseQuestionnaire._meta
+    resultat = []
+
+    for nom, titre in CHAMPS_CHOIX.items():
+        choix = meta.get_field(nom).choices
+        modalites = [(valeur, libelle, Q(**{nom: valeur})) for valeur, libelle in choix]
+        modalites.append((None, NON_RENSEIGNE, Q(**{f'{nom}__isnull': True})))
+        resultat.append((nom, titre, modalites))
+
+    resultat.append(('connait_med_naturelle', 'Connaissance de la médecine naturelle', [
+        (True, 'Oui', Q(connait_med_naturelle=True)),
+        (False, 'Non', Q(connait_med_naturelle=False)),
+    ]))
+
+    tranches = []
+    for libelle, bas, haut in TRANCHES_AGE:
+        filtre = Q()
+        if bas is not None:
+            filtre &= Q(age__gte=bas)
+        if haut is not None:
+            filtre &= Q(age__lt=haut)
+        tranches.append((libelle, libelle, filtre))
+    tranches.append((None, NON_RENSEIGNE, Q(age__isnull=True)))
+    resultat.append(('age', "Tranches d'âge", tranches))
+
+    return resultat
+
+
+def cle_modalite(valeur):
+    """Clé texte d'une modalité (chaîne vide pour « non renseigné »)"""
+    return '' if valeur is None else str(valeur)
+
+
+def tranche_age(age):
+    """Libellé de la tranche d'âge, ou None si l'âge n'est pas renseigné"""
+    if age is None:
+        return None
+    for libelle, bas, haut in TRANCHES_AGE:
+        if (bas is None or age >= bas) and (haut is None or age < haut):
+            return libelle
+    return None
+
+
+def modalites_reponse(reponse):
+    """Couples (champ, clé de modalité) d'une réponse, pour chaque dimension"""
+    for nom in CHAMPS_CHOIX:
+        yield nom, cle_modalite(getattr(reponse, nom))
+    yield 'connait_med_naturelle', cle_modalite(reponse.connait_med_naturelle)
+    yield 'age', cle_modalite(tranche_age(reponse.age))
+
+
+def repartitions(comptes):
+    """
+    Met en forme les répartitions pour le gabarit.
+    ``comptes`` : dict {(champ, clé de modalité): nombre de réponses}.
+    """
+    return [
+        {
+            'champ': nom,
+            'titre': titre,
+            'labels': [libelle for _, libelle, _ in modalites],
+            'data': [comptes.get((nom, cle_modalite(cle)), 0) for cle, _, _ in modalites],
+        }
+        for nom, titre, modalites in dimensions()
+    ]
+
+
+def agregats_conditionnels():
+    """Agrégats Count(filter=...) pour chaque modalité, indexés par 'champ__i'"""
+    agregats = {}
+    for nom, _, modalites in dimensions():
+        for i, (_, _, filtre) in enumerate(modalites):
+            agregats[f'{nom}__{i}'] = Count('id', filter=filtre)
+    return agregats
+
+
+def comptes_depuis_agregats(resultats):
+    """Convertit le résultat de agregats_conditionnels() en {(champ, clé): nombre}"""
+    comptes = {}
+    for nom, _, modalites in dimensions():
+        for i, (cle, _, _) in enumerate(modalites):
+            comptes[(nom, cle_modalite(cle))] = resultats[f'{nom}__{i}']
+    return comptes
+
+
+def statistiques(queryset=None):
+    """
+    Calcule le total, la moyenne d'âge et toutes les répartitions en une requête.
+    Retourne un dict : total, moyenne_age, repartitions (liste de
+    {champ, titre, labels, data}).
+    """
+    if queryset is None:
+        queryset = ReponseQuestionnaire.objects.all()
+
+    resultats = queryset.aggregate(total=Count('id'), moyenne_age=Avg('age'), **agregats_conditionnels())
+
+    return {
+        'total': resultats['total'],
+        'moyenne_age': resultats['moyenne_age'] or 0,
+        'repartitions': repartitions(comptes_depuis_agregats(resultats)),
+    }
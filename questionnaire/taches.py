@@ -0,0 +1,278 @@
+"""
+File de tâches en base de données, sans broker externe.
+
+Une vue crée une ``Tache`` (type + paramètres) ; les processus lancés par
+``manage.py run_workers`` la prennent, écrivent le résultat dans
+``TACHES_DIR/<id>/`` et tiennent à jour la progression. La prise d'une tâche
+est un UPDATE conditionnel (``statut = en_attente``) : deux workers ne peuvent
+pas prendre la même, quelle que soit la base.
+
+Un worker met à jour le « battement » de sa tâche pendant l'exécution ; une
+tâche en cours muette depuis ``TACHES_DELAI_ABANDON`` secondes (worker tué)
+est remise en attente, ou passe en échec après ``TACHES_TENTATIVES_MAX``
+tentatives. Toutes les écritures d'une exécution portent sur sa tentative
+(worker, numéro de tentative, statut en cours) : un worker qui découvre que sa
+tâche a été reprise par un autre abandonne sans toucher au statut ni au
+résultat de la nouvelle tentative, et chaque tentative écrit son propre
+fichier ``.part``.
+"""
+import logging
+import os
+import shutil
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from questionnaire import exports
+from questionnaire.models import Tache
+
+logger = logging.getLogger(__name__)
+
+# Intervalle minimal (secondes) entre deux mises à jour de la progression en base
+INTERVALLE_SUIVI = 1.0
+
+VRAI = ('1', 'true', 'oui')
+
+TRAVAUX = {}
+
+
+class TacheReprise(Exception):
+    """La tâche a été remise en attente puis prise par une autre tentative"""
+
+
+def travail(type):
+    """
+    Enregistre un type de tâche. La fonction reçoit les paramètres et retourne
+    (nom du fichier produit, queryset des réponses concernées, fabrique du flux) ;
+    elle lève ValueError si les paramètres sont invalides et ne doit rien
+    exécuter : le flux n'est produit qu'au moment où la fabrique est appelée
+    avec ``avancer``.
+    """
+    def decorateur(fonction):
+        TRAVAUX[type] = fonction
+        return fonction
+    return decorateur
+
+
+def _compter_lignes(flux, avancer):
+    """Transmet un flux CSV en comptant les lignes (hors en-tête)"""
+    entete = True
+    for morceau in flux:
+        lignes = morceau.count(b'\n')
+        if entete and lignes:
+            lignes, entete = lignes - 1, False
+        if lignes:
+            avancer(lignes)
+        yield morceau
+
+
+@travail('export_csv')
+def _export_csv(parametres):
+    champs = exports.champs_demandes(parametres.get('fields'))
+    queryset = exports.filtrer(parametres)
+    compresse = str(parametres.get('gzip', '')).lower() in VRAI
+
+    def flux(avancer):
+        donnees = _compter_lignes(exports.flux_csv(champs, queryset=queryset), avancer)
+        return exports.compresser_gzip(donnees) if compresse else donnees
+
+    return 'reponses_questionnaire.csv' + ('.gz' if compresse else ''), queryset, flux
+
+
+def _export_colonnaire(format):
+    def preparer(parametres):
+        champs = exports.champs_demandes(parametres.get('fields'))
+        queryset = exports.filtrer(parametres)
+        exports.schema_arrow(champs)  # pyarrow absent : échec dès la création
+
+        def flux(avancer):
+            return exports.flux_colonnaire(format, champs, queryset=queryset, avancer=avancer)
+
+        _, extension = exports.FORMATS_COLONNAIRES[format]
+        return f'reponses_questionnaire.{extension}', queryset, flux
+    return preparer
+
+
+for _format in exports.FORMATS_COLONNAIRES:
+    travail(f'export_{_format}')(_export_colonnaire(_format))
+
+
+@travail('export_pdf_zip')
+def _export_pdf_zip(parametres):
+    queryset = exports.filtrer(parametres)
+
+    def flux(avancer):
+        return exports.flux_zip_pdf(queryset, processus=settings.PDF_PROCESSUS, avancer=avancer)
+
+    return 'reponses_pdf.zip', queryset, flux
+
+
+def creer(type, parametres):
+    """Crée une tâche en attente après avoir validé son type et ses paramètres (ValueError sinon)"""
+    if type not in TRAVAUX:
+        raise ValueError(f"Type de tâche inconnu : {type}")
+    TRAVAUX[type](parametres)
+    return Tache.objects.create(type=type, parametres=parametres)
+
+
+def prendre(worker):
+    """Prend la plus ancienne tâche en attente, ou retourne None"""
+    for _ in range(5):
+        candidat = (
+            Tache.objects.filter(statut=Tache.EN_ATTENTE).order_by('created_at', 'id')
+            .values_list('id', flat=True).first()
+        )
+        if candidat is None:
+            return None
+        maintenant = timezone.now()
+        pris = Tache.objects.filter(id=candidat, statut=Tache.EN_ATTENTE).update(
+            statut=Tache.EN_COURS, worker=worker, debut=maintenant, battement=maintenant,
+            progression=0, tentatives=F('tentatives') + 1,
+        )
+        if pris:
+            return Tache.objects.get(id=candidat)
+    # Perdu la course cinq fois de suite : on laisse passer un tour
+    return None
+
+
+def _tentative(tache):
+    """Queryset de la tâche, restreint à cette tentative tant qu'elle est en cours"""
+    return Tache.objects.filter(
+        pk=tache.pk, worker=tache.worker, tentatives=tache.tentatives, statut=Tache.EN_COURS,
+    )
+
+
+def reprendre_abandonnees():
+    """Remet en attente (ou en échec) les tâches dont le worker ne donne plus signe de vie"""
+    maintenant = timezone.now()
+    abandonnees = Tache.objects.filter(
+        statut=Tache.EN_COURS, battement__lt=maintenant - timedelta(seconds=settings.TACHES_DELAI_ABANDON),
+    )
+    echecs = abandonnees.filter(tentatives__gte=settings.TACHES_TENTATIVES_MAX).update(
+        statut=Tache.ECHEC, fin=maintenant, erreur="Worker interrompu trop de fois",
+    )
+    reprises = abandonnees.update(statut=Tache.EN_ATTENTE, worker='')
+    return reprises, echecs
+
+
+class _Suivi:
+    """Progression et battement d'une tâche, écrits au plus une fois par INTERVALLE_SUIVI"""
+
+    def __init__(self, tache):
+        self.tache = tache
+        self.fait = 0
+        self.derniere = time.monotonic()
+
+    def avancer(self, n):
+        self.fait += n
+        self.battre()
+
+    def battre(self, forcer=False):
+        """Lève TacheReprise si la tentative n'est plus celle en cours"""
+        if not forcer and time.monotonic() - self.derniere < INTERVALLE_SUIVI:
+            return
+        self.derniere = time.monotonic()
+        try:
+            a_jour = _tentative(self.tache).update(progression=self.fait, battement=timezone.now())
+        except DatabaseError:
+            # Suivi indicatif : un échec d'écriture (base verrouillée...) n'interrompt pas la tâche
+            logger.warning("Progression de la tâche %s non enregistrée", self.tache.pk, exc_info=True)
+            return
+        if not a_jour:
+            raise TacheReprise(self.tache.pk)
+
+
+def dossier(tache):
+    return os.path.join(settings.TACHES_DIR, str(tache.pk))
+
+
+def executer(tache):
+    """Exécute une tâche prise par ce worker et enregistre son résultat ou son erreur"""
+    partiel = None
+    try:
+        nom, queryset, fabrique = TRAVAUX[tache.type](tache.parametres)
+        if not _tentative(tache).update(total=queryset.count()):
+            raise TacheReprise(tache.pk)
+
+        os.makedirs(dossier(tache), exist_ok=True)
+        chemin = os.path.join(dossier(tache), nom)
+        partiel = f'{chemin}.{tache.tentatives}.part'
+        suivi = _Suivi(tache)
+        with open(partiel, 'wb') as sortie:
+            for morceau in fabrique(suivi.avancer):
+                sortie.write(morceau)
+                suivi.battre()
+        # Dernière vérification avant de publier le fichier
+        suivi.battre(forcer=True)
+        os.replace(partiel, chemin)
+    except TacheReprise:
+        logger.warning("Tâche %s reprise par une autre tentative : %s abandonne", tache.pk, tache.worker)
+        _supprimer(partiel)
+        return False
+    except Exception as e:
+        logger.exception("Échec de la tâche %s", tache.pk)
+        _supprimer(partiel)
+        _tentative(tache).update(statut=Tache.ECHEC, erreur=str(e) or repr(e), fin=timezone.now())
+        return False
+
+    return bool(_tentative(tache).update(
+        statut=Tache.TERMINEE, progression=suivi.fait, resultat=os.path.join(str(tache.pk), nom),
+        erreur='', fin=timezone.now(),
+    ))
+
+
+def _supprimer(chemin):
+    if chemin is None:
+        return
+    try:
+        os.remove(chemin)
+    except FileNotFoundError:
+        pass
+
+
+def chemin_resultat(tache):
+    """Chemin absolu du fichier produit par une tâche terminée"""
+    return os.path.join(settings.TACHES_DIR, tache.resultat)
+
+
+def purger():
+    """Supprime les tâches finies depuis plus de TACHES_CONSERVATION_JOURS, et leurs fichiers"""
+    limite = timezone.now() - timedelta(days=settings.TACHES_CONSERVATION_JOURS)
+    anciennes = Tache.objects.filter(statut__in=[Tache.TERMINEE, Tache.ECHEC], fin__lt=limite)
+    for tache in anciennes.iterator():
+        shutil.rmtree(dossier(tache), ignore_errors=True)
+    return anciennes.delete()[0]
+
+
+def travailler(worker, arret, intervalle=None, une_fois=False):
+    """
+    Boucle d'un worker : prend et exécute les tâches jusqu'à ``arret.is_set()``.
+    Avec ``une_fois``, s'arrête dès que la file est vide.
+    """
+    if intervalle is None:
+        intervalle = settings.TACHES_INTERVALLE
+    prochaine_purge = 0
+    while not arret.is_set():
+        close_old_connections()
+        if time.monotonic() >= prochaine_purge:
+            purger()
+            prochaine_purge = time.monotonic() + 3600
+        reprendre_abandonnees()
+
+        tache = prendre(worker)
+        if tache is None:
+            if une_fois:
+                return
+            arret.wait(intervalle)
+            continue
+        logger.info("Worker %s : tâche %s (%s)", worker, tache.pk, tache.type)
+        try:
+            executer(tache)
+        except DatabaseError:
+            # Statut non enregistré : la tâche sera reprise après TACHES_DELAI_ABANDON
+            logger.exception("Worker %s : base indisponible pendant la tâche %s", worker, tache.pk)
+            arret.wait(intervalle)
@@ -1,3 +1,960 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import logging
+import operator
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+from multiprocessing.pool import ThreadPool
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from monquestionnaire import asgi
+from questionnaire import (
+    cache_pdf, ecriture_differee, exports, ingestion, journalisation, metriques, options, pagination, profiler,
+    requetes_lentes, rollups, taches, urls as questionnaire_urls, utils,
+)
+from questionnaire.cache import cle_vue
+from questionnaire.management.commands import import_reponses
+from questionnaire.management.commands.seed_reponses import Generateur
+from questionnaire.models import ReponseOption, ReponseQuestionnaire, StatistiqueJournaliere, Tache
+
+# Réponses en base pendant les tests : plus qu'une page de liste_reponses, pour qu'un N+1 se voie
+NB_REPONSES = 60
+
+
+@dataclass
+class Budget:
+    """Nombre maximal de requêtes SQL et durée SQL cumulée (ms) pour un appel d'URL"""
+    url: str
+    requetes: int
+    ms: float = 50
+    methode: str = 'GET'
+    # Valeurs : attributs du TestCase (objets créés dans setUpTestData), ex. 'reponse.pk', ou littéraux
+    kwargs: dict = field(default_factory=dict)
+    # 'formulaire' (une réponse en POST classique) ou 'lot' (JSON de l'API)
+    donnees: str = None
+    content_type: str = None
+
+
+# Une entrée au moins par URL de questionnaire/urls.py (vérifié par test_toutes_les_urls_ont_un_budget).
+# Budgets serrés : une requête de plus doit être justifiée ici, dans le même commit.
+BUDGETS = [
+    Budget('questionnaire', 0),
+    Budget('questionnaire_view', 0),
+    Budget('remplir_formulaire', 0),
+    # INSERT, compteurs (2 upserts), options (création, une lecture des id par champ à choix
+    # multiples — 5 au plus —, liens), 4 points de sauvegarde : borne indépendante du nombre de lignes
+    Budget('remplir_formulaire', 14, methode='POST', donnees='formulaire'),
+    Budget('merci', 0),
+    Budget('generate-pdf', 0),
+    Budget('formulaire_pdf_interactif', 0),
+    Budget('generate_pdf_from_response', 1, kwargs={'id': 'reponse.pk'}),
+    Budget('export_reponses_pdf_zip', 1, ms=100),
+    Budget('export_reponses_csv', 1, ms=100),
+    Budget('export_reponses_parquet', 1, ms=100),
+    Budget('export_reponses_arrow', 1, ms=100),
+    # Lecture des clés déjà reçues + même enregistrement groupé que le formulaire, quel que soit le lot
+    Budget('api_soumettre_lot', 15, methode='POST', donnees='lot', content_type='application/json'),
+    Budget('creer_tache', 1, methode='POST', kwargs={'type': 'export_csv'}),
+    Budget('statut_tache', 1, kwargs={'cle': 'tache.cle'}),
+    Budget('resultat_tache', 1, kwargs={'cle': 'tache.cle'}),
+    Budget('metriques', 0),
+    # Agrégats des compteurs journaliers : total/âge et répartitions
+    Budget('dashboard', 2),
+    Budget('liste_reponses', 1),
+    Budget('test_post', 0, methode='POST'),
+    Budget('test_post_form', 0),
+    Budget('test_db_connection', 0),
+]
+
+
+def donnees_formulaire(generateur):
+    """Champs saisissables d'une réponse du générateur, tels que les poste le formulaire"""
+    reponse = generateur.reponse()
+    return {
+        f.name: getattr(reponse, f.name) for f in ReponseQuestionnaire._meta.fields
+        if f.editable and not f.primary_key and getattr(reponse, f.name) is not None
+    }
+
+
+def dossier_temporaire(nettoyage, nom):
+    """Dossier temporaire effacé par ``nettoyage`` (addCleanup ou addClassCleanup)"""
+    chemin = tempfile.mkdtemp(prefix=f'questionnaire_tests_{nom}_')
+    nettoyage(shutil.rmtree, chemin, ignore_errors=True)
+    return chemin
+
+
+class DossiersTemporairesMixin:
+    """
+    Pointe chaque réglage de ``dossiers`` (réglage -> nom) vers un dossier
+    temporaire créé au début de la classe et effacé à sa fin.
+    """
+    dossiers = {}
+
+    @classmethod
+    def setUpClass(cls):
+        reglages = {reglage: dossier_temporaire(cls.addClassCleanup, nom) for reglage, nom in cls.dossiers.items()}
+        surcharge = override_settings(**reglages)
+        surcharge.enable()
+        cls.addClassCleanup(surcharge.disable)
+        super().setUpClass()
+
+
+@contextmanager
+def budget_sql(test, requetes, ms, libelle=''):
+    """
+    Fait échouer ``test`` si le bloc émet plus de ``requetes`` requêtes SQL ou
+    plus de ``ms`` millisecondes de SQL ; le message liste les requêtes.
+    """
+    with CaptureQueriesContext(connection) as capture:
+        yield capture
+    duree = sum(float(q['time']) for q in capture.captured_queries) * 1000
+    if len(capture) > requetes or duree > ms:
+        detail = '\n'.join(
+            f"  {i}. [{float(q['time']) * 1000:.1f} ms] {q['sql']}" for i, q in enumerate(capture.captured_queries, 1)
+        )
+        test.fail(
+            f"{libelle} : {len(capture)} requête(s) pour {requetes} autorisée(s), "
+            f"{duree:.1f} ms de SQL pour {ms} ms autorisées\n{detail}"
+        )
+
+
+@override_settings(PDF_PROCESSUS=1, API_SYNC_TOKEN=None, API_SYNC_OUVERTE=True)
+class BudgetsRequetesTests(DossiersTemporairesMixin, TestCase):
+    """Budget de requêtes SQL et de temps SQL de chaque URL du questionnaire"""
+    dossiers = {
+        'PDF_CACHE_DIR': 'pdf',
+        'FORMULAIRE_PDF_DIR': 'formulaire',
+        'TACHES_DIR': 'taches',
+        'METRIQUES_DIR': 'metriques',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.generateur = Generateur(42, timezone.now(), 30)
+        ingestion.enregistrer([cls.generateur.reponse() for _ in range(NB_REPONSES)])
+        cls.reponse = ReponseQuestionnaire.objects.order_by('id').first()
+        cls.tache = Tache.objects.create(type='export_csv')
+
+    def setUp(self):
+        # Les vues en cache doivent faire leur travail à chaque appel
+        cache.clear()
+
+    def _appeler(self, budget):
+        kwargs = {
+            cle: operator.attrgetter(valeur)(self) if hasattr(self, valeur.split('.')[0]) else valeur
+            for cle, valeur in budget.kwargs.items()
+        }
+        url = reverse(budget.url, kwargs=kwargs or None)
+
+        donnees = budget.donnees or {}
+        if donnees == 'formulaire':
+            donnees = donnees_formulaire(self.generateur)
+        elif donnees == 'lot':
+            donnees = json.dumps([
+                {'cle': f'test-{i}', 'donnees': donnees_formulaire(self.generateur)} for i in range(5)
+            ], default=str)
+
+        with budget_sql(self, budget.requetes, budget.ms, f"{budget.methode} {url} ({budget.url})"):
+            if budget.methode == 'POST':
+                options = {'content_type': budget.content_type} if budget.content_type else {}
+                response = self.client.post(url, donnees, secure=True, **options)
+            else:
+                response = self.client.get(url, secure=True)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+        return response
+
+    def test_toutes_les_urls_ont_un_budget(self):
+        noms = {motif.name for motif in questionnaire_urls.urlpatterns if isinstance(motif, URLPattern)}
+        self.assertEqual(noms - {budget.url for budget in BUDGETS}, set(), "URL sans budget de requêtes")
+
+    def test_budgets(self):
+        for budget in BUDGETS:
+            with self.subTest(url=budget.url, methode=budget.methode):
+                response = self._appeler(budget)
+                self.assertLess(response.status_code, 500, f"{budget.url} : HTTP {response.status_code}")
+
+    def test_liste_reponses_ne_depend_pas_de_la_taille_de_page(self):
+        for taille in (5, 50):
+            with self.subTest(taille=taille):
+                cache.clear()
+                with budget_sql(self, 1, 50, f"liste_reponses ?taille={taille}"):
+                    self.client.get(reverse('liste_reponses'), {'taille': taille}, secure=True)
+
+
+class PaginationTests(TestCase):
+    """Pagination par curseur de la liste des réponses, dans les deux sens"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generateur = Generateur(17, timezone.now(), 30)
+        ingestion.enregistrer([generateur.reponse() for _ in range(7)])
+        # Ex æquo sur created_at : l'id départage
+        moments = [datetime(2026, 1, jour, tzinfo=dt_timezone.utc) for jour in (1, 1, 1, 2, 2, 3, 3)]
+        for reponse, moment in zip(ReponseQuestionnaire.objects.order_by('id'), moments):
+            ReponseQuestionnaire.objects.filter(pk=reponse.pk).update(created_at=moment)
+        cls.ordre = list(ReponseQuestionnaire.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def _page(self, **curseur):
+        lignes, suivant, precedent = pagination.page_keyset(
+            ReponseQuestionnaire.objects.values('id', 'created_at'), taille=2, **curseur,
+        )
+        return [ligne['id'] for ligne in lignes], suivant, precedent
+
+    def test_pages_suivantes(self):
+        ids, suivant, precedent = self._page()
+        self.assertIsNone(precedent)
+        vus = ids
+        while suivant:
+            ids, suivant, precedent = self._page(apres=suivant)
+            self.assertIsNotNone(precedent)
+            vus += ids
+        self.assertEqual(vus, self.ordre)
+        self.assertEqual(len(ids), 1, "la dernière page contient le reste")
+
+    def test_pages_precedentes(self):
+        suivant, pages = None, []
+        while True:
+            ids, suivant, precedent = self._page(apres=suivant) if suivant else self._page()
+            pages.append(ids)
+            if not suivant:
+                break
+
+        vus = ids
+        while precedent:
+            ids, suivant, precedent = self._page(avant=precedent)
+            self.assertIsNotNone(suivant)
+            vus = ids + vus
+        self.assertEqual(vus, self.ordre)
+        self.assertEqual(ids, pages[0], "retour à la première page")
+
+    def test_vue_suit_les_curseurs(self):
+        response = self.client.get(reverse('liste_reponses'), {'taille': 3}, secure=True)
+        suivant = response.context['curseur_suivant']
+        response = self.client.get(reverse('liste_reponses'), {'taille': 3, 'apres': suivant}, secure=True)
+        self.assertEqual([r['id'] for r in response.context['reponses']], self.ordre[3:6])
+
+    def test_curseurs_invalides(self):
+        curseurs = [
+            'abc', '_5', '2026-01-01T00:00:00+00:00_', '2026-01-01T00:00:00+00:00_x',
+            '2026-13-45T00:00:00+00:00_1', '2026-01-01T00:00:00+00:00_١', f'2026-01-01T00:00:00+00:00_{2 ** 64}',
+        ]
+        for sens in ('apres', 'avant'):
+            for curseur in curseurs:
+                with self.subTest(sens=sens, curseur=curseur):
+                    response = self.client.get(reverse('liste_reponses'), {sens: curseur}, secure=True)
+                    self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('liste_reponses'), {'taille': 'x'}, secure=True).status_code, 400)
+
+    def test_curseur_sans_fuseau(self):
+        moment, identifiant = pagination.decoder_curseur('2026-01-02T00:00:00_4')
+        self.assertEqual((moment, identifiant), (datetime(2026, 1, 2, tzinfo=dt_timezone.utc), 4))
+
+
+@override_settings(PROFILER_ACTIF=True)
+class ProfilerTests(DossiersTemporairesMixin, TestCase):
+    """Un seul profil à la fois par processus, sans fuite du wrapper SQL"""
+    dossiers = {'PROFILER_DIR': 'profils'}
+
+    def _get(self):
+        return self.client.get(reverse('liste_reponses'), HTTP_X_PROFILER=profiler.jeton(), secure=True)
+
+    def test_profil_enregistre(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(profiler.EN_TETE_REPONSE, response)
+        self.assertFalse(profiler._verrou.locked())
+        self.assertEqual(connection.execute_wrappers, [])
+
+    @override_settings(PROFILER_ACTIF=False)
+    def test_desactive(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(profiler.EN_TETE_REPONSE, response)
+        self.assertEqual(os.listdir(settings.PROFILER_DIR), [])
+
+    def test_profil_deja_en_cours(self):
+        with profiler._verrou:
+            response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(profiler.EN_TETE_REPONSE, response)
+        self.assertEqual(connection.execute_wrappers, [])
+
+    def test_autre_outil_de_profilage_actif(self):
+        with mock.patch('cProfile.Profile.enable', side_effect=ValueError('Another profiling tool is already active')):
+            response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(profiler.EN_TETE_REPONSE, response)
+        self.assertFalse(profiler._verrou.locked())
+        self.assertEqual(connection.execute_wrappers, [])
+
+
+class CachePdfTests(DossiersTemporairesMixin, TestCase):
+    """Compteurs du cache des fiches PDF et nettoyage des fichiers temporaires"""
+    dossiers = {'PDF_CACHE_DIR': 'pdf', 'METRIQUES_DIR': 'metriques'}
+
+    @classmethod
+    def setUpTestData(cls):
+        ingestion.enregistrer([Generateur(7, timezone.now(), 30).reponse()])
+        cls.reponse = ReponseQuestionnaire.objects.get()
+
+    def test_compteurs_lus_dans_les_metriques_des_processus(self):
+        avant = cache_pdf.statistiques()
+        cache_pdf.obtenir(self.reponse)
+        cache_pdf.obtenir(self.reponse)
+        # Ce que lit « manage.py cache_pdf » : les fichiers des processus, pas la mémoire du worker
+        metriques.ecrire()
+        apres = cache_pdf.statistiques()
+        self.assertEqual(apres['echecs'] - avant['echecs'], 1)
+        self.assertEqual(apres['succes'] - avant['succes'], 1)
+        self.assertIn('questionnaire_cache_pdf_total{resultat="succes"}', metriques.format_prometheus(metriques.agreger()))
+
+    def test_evincer_supprime_les_temporaires_orphelins(self):
+        cache_pdf.obtenir(self.reponse)
+        ancien = os.path.join(settings.PDF_CACHE_DIR, 'orphelin.tmp')
+        recent = os.path.join(settings.PDF_CACHE_DIR, 'en-cours.tmp')
+        for chemin in (ancien, recent):
+            open(chemin, 'wb').close()
+        age = time.time() - cache_pdf.AGE_TEMPORAIRE_ORPHELIN - 1
+        os.utime(ancien, (age, age))
+
+        cache_pdf.evincer()
+        self.assertFalse(os.path.exists(ancien))
+        self.assertTrue(os.path.exists(recent))
+        self.assertTrue(os.path.exists(cache_pdf.chemin(self.reponse.pk)))
+
+
+@override_settings(PDF_PROCESSUS=1)
+class ZipPdfTests(TestCase):
+    """Archive ZIP des fiches rendue par le pool partagé du processus"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generateur = Generateur(11, timezone.now(), 30)
+        ingestion.enregistrer([generateur.reponse() for _ in range(3)])
+
+    def test_archive_et_pool_partage(self):
+        archives = [b''.join(exports.flux_zip_pdf()) for _ in range(2)]
+        for contenu in archives:
+            with zipfile.ZipFile(io.BytesIO(contenu)) as archive:
+                self.assertEqual(len(archive.namelist()), 3)
+                self.assertTrue(archive.read(archive.namelist()[0]).startswith(b'%PDF'))
+        self.assertIs(exports.pool_pdf(), exports.pool_pdf())
+
+
+@override_settings(TACHES_DELAI_ABANDON=60)
+class TachesTests(DossiersTemporairesMixin, TestCase):
+    """Prise, battement, abandon et reprise des tâches en arrière-plan"""
+    dossiers = {'TACHES_DIR': 'taches'}
+
+    @classmethod
+    def setUpTestData(cls):
+        generateur = Generateur(3, timezone.now(), 30)
+        ingestion.enregistrer([generateur.reponse() for _ in range(5)])
+
+    def _abandonner(self, tache):
+        Tache.objects.filter(pk=tache.pk).update(battement=timezone.now() - timedelta(minutes=5))
+
+    def test_prise_exclusive(self):
+        tache = taches.creer('export_csv', {})
+        prise = taches.prendre('w1')
+        self.assertEqual(prise.pk, tache.pk)
+        self.assertEqual((prise.statut, prise.worker, prise.tentatives), (Tache.EN_COURS, 'w1', 1))
+        self.assertIsNone(taches.prendre('w2'))
+
+    def test_battement(self):
+        taches.creer('export_csv', {})
+        prise = taches.prendre('w1')
+        self._abandonner(prise)
+        suivi = taches._Suivi(prise)
+        suivi.fait = 3
+        suivi.battre(forcer=True)
+        prise.refresh_from_db()
+        self.assertEqual(prise.progression, 3)
+        self.assertGreater(prise.battement, timezone.now() - timedelta(minutes=1))
+
+    def test_abandon_puis_echec_apres_tentatives_max(self):
+        tache = taches.creer('export_csv', {})
+        for tentative in range(1, settings.TACHES_TENTATIVES_MAX + 1):
+            self.assertEqual(taches.prendre(f'w{tentative}').tentatives, tentative)
+            self._abandonner(tache)
+            taches.reprendre_abandonnees()
+            tache.refresh_from_db()
+        self.assertEqual(tache.statut, Tache.ECHEC)
+        self.assertIsNone(taches.prendre('w0'))
+
+    def test_reprise_sans_ecrasement_par_l_ancienne_tentative(self):
+        taches.creer('export_csv', {})
+        ancienne = taches.prendre('w1')
+        self._abandonner(ancienne)
+        self.assertEqual(taches.reprendre_abandonnees(), (1, 0))
+        nouvelle = taches.prendre('w2')
+
+        self.assertTrue(taches.executer(nouvelle))
+        self.assertFalse(taches.executer(ancienne))
+        nouvelle.refresh_from_db()
+        self.assertEqual((nouvelle.statut, nouvelle.worker, nouvelle.progression), (Tache.TERMINEE, 'w2', 5))
+        self.assertEqual(
+            [f for f in os.listdir(taches.dossier(nouvelle)) if f.endswith('.part')], [], "fichier partiel oublié",
+        )
+
+    def test_suivi_par_cle_et_non_par_id(self):
+        response = self.client.post(reverse('creer_tache', args=['export_csv']), secure=True)
+        self.assertEqual(response.status_code, 202)
+        tache = Tache.objects.get()
+        self.assertEqual(response.json()['cle'], str(tache.cle))
+        self.assertNotIn(f'/{tache.pk}/', response.json()['url_statut'])
+
+        self.assertEqual(self.client.get(response.json()['url_statut'], secure=True).status_code, 200)
+        for url in (f'/taches/{tache.pk}/statut/', f'/taches/{tache.pk}/resultat/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, secure=True).status_code, 404)
+
+    def test_ancienne_tentative_abandonne_en_cours_de_route(self):
+        taches.creer('export_csv', {})
+        ancienne = taches.prendre('w1')
+        original = taches._Suivi.battre
+
+        def reprise_pendant_l_export(suivi, forcer=False):
+            # Une autre tentative prend la tâche pendant que l'ancienne écrit
+            if not Tache.objects.filter(worker='w2').exists():
+                self._abandonner(ancienne)
+                taches.reprendre_abandonnees()
+                taches.prendre('w2')
+            original(suivi, forcer=True)
+
+        with mock.patch.object(taches._Suivi, 'battre', reprise_pendant_l_export):
+            self.assertFalse(taches.executer(ancienne))
+        tache = Tache.objects.get()
+        self.assertEqual((tache.statut, tache.worker, tache.resultat), (Tache.EN_COURS, 'w2', ''))
+
+
+@override_settings(API_SYNC_TOKEN='jeton-test', API_SYNC_OUVERTE=False)
+class ApiSoumettreLotTests(TestCase):
+    """Authentification, idempotence et corps gzip de l'API des tablettes"""
+
+    def setUp(self):
+        self.generateur = Generateur(5, timezone.now(), 30)
+
+    def _element(self, cle):
+        return {'cle': cle, 'donnees': donnees_formulaire(self.generateur)}
+
+    def _envoyer(self, elements, jeton='jeton-test', gzip_=False):
+        corps = json.dumps(elements, default=str).encode()
+        entetes = {'HTTP_AUTHORIZATION': f'Bearer {jeton}'} if jeton else {}
+        if gzip_:
+            corps = gzip.compress(corps)
+            entetes['HTTP_CONTENT_ENCODING'] = 'gzip'
+        return self.client.post(
+            reverse('api_soumettre_lot'), corps, content_type='application/json', secure=True, **entetes,
+        )
+
+    def test_fermee_sans_jeton_configure(self):
+        with override_settings(API_SYNC_TOKEN=None):
+            response = self._envoyer([self._element('a')], jeton=None)
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(ReponseQuestionnaire.objects.exists())
+
+    def test_ouverture_explicite_en_local(self):
+        with override_settings(API_SYNC_TOKEN=None, API_SYNC_OUVERTE=True):
+            response = self._envoyer([self._element('a')], jeton=None)
+        self.assertEqual(response.json()['crees'], 1)
+
+    def test_jeton_invalide(self):
+        for jeton in (None, 'autre'):
+            with self.subTest(jeton=jeton):
+                self.assertEqual(self._envoyer([self._element('a')], jeton=jeton).status_code, 401)
+        self.assertFalse(ReponseQuestionnaire.objects.exists())
+
+    def test_renvoi_idempotent(self):
+        lot = [self._element('a'), self._element('b')]
+        premier = self._envoyer(lot).json()
+        second = self._envoyer(lot).json()
+        self.assertEqual((premier['crees'], premier['doublons']), (2, 0))
+        self.assertEqual((second['crees'], second['doublons']), (0, 2))
+        self.assertEqual([r['id'] for r in second['resultats']], [r['id'] for r in premier['resultats']])
+        self.assertEqual(ReponseQuestionnaire.objects.count(), 2)
+
+    def test_doublon_dans_le_lot(self):
+        resultat = self._envoyer([self._element('a'), self._element('a'), {'cle': 'b'}]).json()
+        self.assertEqual((resultat['crees'], resultat['doublons'], resultat['invalides']), (1, 1, 1))
+        premier, doublon, invalide = resultat['resultats']
+        self.assertEqual(doublon, {'cle': 'a', 'statut': 'doublon', 'id': premier['id']})
+        self.assertIn('donnees', invalide['erreurs'])
+        self.assertEqual(ReponseQuestionnaire.objects.count(), 1)
+
+    def test_corps_gzip(self):
+        self.assertEqual(self._envoyer([self._element('a')], gzip_=True).json()['crees'], 1)
+
+    def test_gzip_invalide_ou_trop_gros(self):
+        response = self.client.post(
+            reverse('api_soumettre_lot'), b'pas du gzip', content_type='application/json', secure=True,
+            HTTP_AUTHORIZATION='Bearer jeton-test', HTTP_CONTENT_ENCODING='gzip',
+        )
+        self.assertEqual(response.status_code, 400)
+        with override_settings(API_LOT_TAILLE_MAX=100):
+            self.assertEqual(self._envoyer([self._element('a')], gzip_=True).status_code, 413)
+
+
+@override_settings(SOUMISSION_LOT=3, SOUMISSION_DELAI_MS=20, SOUMISSION_FILE_MAX=100)
+class EcritureDiffereeTests(TransactionTestCase):
+    """File d'écriture différée : lots, arrêt, file pleine (fil d'écriture réel, d'où TransactionTestCase)"""
+
+    def setUp(self):
+        self.generateur = Generateur(21, timezone.now(), 30)
+        self.addCleanup(ecriture_differee.arreter)
+
+    def test_file_puis_vidage_avec_compteurs_et_options(self):
+        reponses = [self.generateur.reponse() for _ in range(7)]
+        for reponse in reponses:
+            self.assertTrue(ecriture_differee.soumettre(reponse))
+        ecriture_differee.arreter()
+
+        self.assertEqual(ReponseQuestionnaire.objects.count(), 7)
+        self.assertEqual(rollups.statistiques()['total'], 7)
+        self.assertEqual(rollups.ecarts(), [])
+        coches = sum(len(options.decouper(r.types_soins)) for r in reponses if r.types_soins)
+        self.assertEqual(ReponseOption.objects.filter(option__champ='types_soins').count(), coches)
+
+    def test_date_de_soumission_et_non_d_ecriture(self):
+        reponse = self.generateur.reponse()
+        reponse.created_at = None
+        with mock.patch.object(ecriture_differee, '_ecrire', wraps=ecriture_differee._ecrire) as ecrire:
+            self.assertTrue(ecriture_differee.soumettre(reponse))
+            soumise = reponse.created_at
+            ecriture_differee.arreter()
+        self.assertIsNotNone(soumise)
+        self.assertEqual(ecrire.call_count, 1)
+        self.assertEqual(ReponseQuestionnaire.objects.get().created_at, soumise)
+
+    @override_settings(SOUMISSION_LOT=1, SOUMISSION_FILE_MAX=1)
+    def test_file_pleine(self):
+        debloquer = threading.Event()
+        original = ecriture_differee._ecrire
+
+        def ecrire_apres_deblocage(lot):
+            debloquer.wait(5)
+            original(lot)
+
+        with mock.patch.object(ecriture_differee, '_ecrire', ecrire_apres_deblocage):
+            self.assertTrue(ecriture_differee.soumettre(self.generateur.reponse()))
+            # Le fil d'écriture a pris la première réponse et attend : la file est vide
+            limite = time.monotonic() + 5
+            while ecriture_differee.en_attente() and time.monotonic() < limite:
+                time.sleep(0.01)
+            self.assertTrue(ecriture_differee.soumettre(self.generateur.reponse()))
+            self.assertFalse(ecriture_differee.soumettre(self.generateur.reponse()))
+            debloquer.set()
+            ecriture_differee.arreter()
+        self.assertEqual(ReponseQuestionnaire.objects.count(), 2)
+
+    @override_settings(SOUMISSION_ASYNC=True, SOUMISSION_DELAI_MS=10000)
+    def test_arret_par_le_lifespan_asgi(self):
+        evenements = iter(['lifespan.startup', 'soumission', 'lifespan.shutdown'])
+        envoyes = []
+
+        async def recevoir():
+            evenement = next(evenements)
+            if evenement == 'soumission':
+                # Lot incomplet et délai long : seul l'arrêt peut l'écrire
+                for _ in range(2):
+                    ecriture_differee.soumettre(self.generateur.reponse())
+                evenement = next(evenements)
+            return {'type': evenement}
+
+        async def envoyer(message):
+            envoyes.append(message['type'])
+
+        async_to_sync(asgi.application)({'type': 'lifespan'}, recevoir, envoyer)
+        self.assertEqual(envoyes, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertEqual(ReponseQuestionnaire.objects.count(), 2)
+
+
+class JournalisationTests(TestCase):
+    """Un fichier de journal par processus, chacun avec ses propres rotations"""
+
+    def test_fichier_par_processus(self):
+        base = os.path.join(dossier_temporaire(self.addCleanup, 'journal'), 'lentes.log')
+        gestionnaire = journalisation.GestionnaireFile(fichier=base, console=False, format='brut')
+        journal = logging.getLogger('questionnaire.tests.journal')
+        journal.addHandler(gestionnaire)
+        try:
+            journal.warning('{"sql": "SELECT 1", "duree_ms": 1}')
+        finally:
+            journal.removeHandler(gestionnaire)
+            gestionnaire.close()
+        self.assertTrue(os.path.exists(journalisation.fichier_processus(base)))
+        self.assertFalse(os.path.exists(base))
+
+    def test_fichiers_de_tous_les_processus(self):
+        base = os.path.join(dossier_temporaire(self.addCleanup, 'journal'), 'lentes.log')
+        for suffixe in ('', '.12', '.12.1', '.12.2', '.7', '.7.1', '.ancien', '.12.1.gz'):
+            open(base + suffixe, 'w').close()
+        self.assertEqual(
+            [f[len(base):] for f in requetes_lentes.fichiers_journal(base)],
+            ['', '.7.1', '.7', '.12.2', '.12.1', '.12'],
+        )
+
+
+class RequetesLentesTests(TestCase):
+    """Lecture et résumé d'un journal de requêtes lentes incomplet"""
+
+    def test_entrees_sans_vue_ni_moment(self):
+        journal = os.path.join(dossier_temporaire(self.addCleanup, 'lentes'), 'lentes.log')
+        entrees = [
+            {'moment': '2026-01-02T10:00:00+00:00', 'vue': 'dashboard', 'sql': 'SELECT 1', 'duree_ms': 30},
+            {'moment': '2026-01-02T11:00:00+00:00', 'vue': None, 'sql': 'SELECT 2', 'duree_ms': 20},
+            {'sql': 'SELECT 3', 'duree_ms': 10},
+            {'moment': 'hier', 'sql': 'SELECT 4', 'duree_ms': 10},
+        ]
+        with open(journal, 'w', encoding='utf-8') as fichier:
+            fichier.write('\n'.join(json.dumps(e) for e in entrees) + '\npas du json\n[1]\n')
+
+        groupes = requetes_lentes.resumer(requetes_lentes.lire([journal]))
+        self.assertEqual(sum(g['nombre'] for g in groupes), 4)
+        self.assertEqual(groupes[0]['vues'], sorted(['dashboard', metriques.VUE_INCONNUE]))
+
+        depuis = exports.parse_moment('2026-01-01')
+        self.assertEqual(len(list(requetes_lentes.lire([journal], depuis=depuis))), 2)
+        self.assertEqual(len(list(requetes_lentes.lire([journal], vue=metriques.VUE_INCONNUE))), 3)
+
+
+    def test_commande_sans_duree(self):
+        journal = os.path.join(dossier_temporaire(self.addCleanup, 'lentes'), 'lentes.log')
+        with open(journal, 'w', encoding='utf-8') as fichier:
+            fichier.write(json.dumps({'moment': '2026-01-02T10:00:00+00:00', 'vue': 'dashboard', 'sql': 'SELECT 1'}) + '\n')
+        sortie = io.StringIO()
+        call_command('requetes_lentes', journal, '--plans', stdout=sortie)
+        self.assertIn('(0%)', sortie.getvalue())
+
+    def test_explain_en_echec_isole_par_un_point_de_sauvegarde(self):
+        def executer(sql, params=None):
+            if sql.startswith('EXPLAIN'):
+                raise Exception('permission refusée')
+
+        curseur = mock.MagicMock()
+        curseur.execute.side_effect = executer
+        connexion = mock.MagicMock(in_atomic_block=True)
+        connexion.connection.cursor.return_value.__enter__.return_value = curseur
+
+        plan = requetes_lentes._expliquer({'connection': connexion}, 'SELECT 1', ())
+        self.assertTrue(plan.startswith('EXPLAIN impossible'))
+        self.assertEqual([c.args[0] for c in curseur.execute.call_args_list], [
+            f'SAVEPOINT {requetes_lentes.SAVEPOINT_EXPLAIN}',
+            'EXPLAIN SELECT 1',
+            f'ROLLBACK TO SAVEPOINT {requetes_lentes.SAVEPOINT_EXPLAIN}',
+            f'RELEASE SAVEPOINT {requetes_lentes.SAVEPOINT_EXPLAIN}',
+        ])
+
+
+class ImportReponsesTests(TestCase):
+    """Validation parallèle de l'import en masse"""
+
+    def test_imap_borne_ne_lit_pas_d_avance(self):
+        lus = []
+
+        def lots():
+            for i in range(20):
+                lus.append(i)
+                yield i
+
+        with ThreadPool(2) as pool:
+            resultats = import_reponses.imap_borne(pool, lambda x: x * 2, lots(), 4)
+            for consommes, valeur in enumerate(resultats, 1):
+                self.assertEqual(valeur, (consommes - 1) * 2)
+                self.assertLessEqual(len(lus), consommes + 4)
+        self.assertEqual(len(lus), 20)
+
+    def test_validation_complete_du_modele(self):
+        donnees = donnees_formulaire(Generateur(29, timezone.now(), 30))
+        self.assertIsNone(ingestion.valider(donnees)[1])
+        refus = ValidationError({'age': ["Âge incohérent avec la profession"]})
+        with mock.patch.object(ReponseQuestionnaire, 'clean', side_effect=refus):
+            self.assertEqual(ingestion.valider(donnees), (None, {'age': ["Âge incohérent avec la profession"]}))
+
+    def test_insertion_par_copy_ou_values(self):
+        generateur = Generateur(31, timezone.now(), 30)
+        for copie_min in (1, ingestion.COPY_LIGNES_MIN):
+            with self.subTest(copie_min=copie_min), mock.patch.object(ingestion, 'COPY_LIGNES_MIN', copie_min):
+                reponses = [generateur.reponse() for _ in range(3)]
+                reponses[0].connait_med_naturelle, reponses[0].age = True, None
+                creees = ingestion.enregistrer(reponses)
+                relues = ReponseQuestionnaire.objects.in_bulk([r.pk for r in creees])
+                self.assertEqual(len(relues), 3)
+                for reponse in creees:
+                    relue = relues[reponse.pk]
+                    self.assertEqual(
+                        (relue.created_at, relue.connait_med_naturelle, relue.age, relue.types_soins),
+                        (reponse.created_at, reponse.connait_med_naturelle, reponse.age, reponse.types_soins),
+                    )
+                self.assertEqual(rollups.ecarts(), [])
+
+
+class RollupsTests(TestCase):
+    """Les compteurs du tableau de bord suivent les créations et suppressions"""
+
+    def setUp(self):
+        self.generateur = Generateur(9, timezone.now(), 30)
+
+    def assertSansEcart(self):
+        self.assertEqual(rollups.ecarts(), [])
+        call_command('rebuild_rollups', '--check', stdout=io.StringIO())
+
+    def test_creation_et_suppression(self):
+        self.generateur.reponse().save()
+        ingestion.enregistrer([self.generateur.reponse() for _ in range(10)])
+        self.assertEqual(rollups.statistiques()['total'], 11)
+        self.assertSansEcart()
+
+        ReponseQuestionnaire.objects.order_by('id').first().delete()
+        ReponseQuestionnaire.objects.filter(pk__in=ReponseQuestionnaire.objects.order_by('id').values('pk')[:3]).delete()
+        self.assertEqual(rollups.statistiques()['total'], 7)
+        self.assertSansEcart()
+
+    def test_check_signale_un_ecart(self):
+        ingestion.enregistrer([self.generateur.reponse() for _ in range(3)])
+        StatistiqueJournaliere.objects.update(total=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--check', stdout=io.StringIO())
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertSansEcart()
+
+    def test_reconstruction_en_un_parcours(self):
+        ingestion.enregistrer([self.generateur.reponse() for _ in range(3)])
+        jours = StatistiqueJournaliere.objects.update(total=0)
+        sortie = io.StringIO()
+        with mock.patch.object(rollups, 'calculer', wraps=rollups.calculer) as calculer:
+            call_command('rebuild_rollups', stdout=sortie)
+        self.assertEqual(calculer.call_count, 1)
+        self.assertIn(f'{jours} écart(s) corrigé(s)', sortie.getvalue())
+        self.assertSansEcart()
+
+
+class OptionsTests(TestCase):
+    """Options des questions à choix multiples : découpage, liens et filtres"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generateur = Generateur(19, timezone.now(), 30)
+        reponses = [generateur.reponse() for _ in range(3)]
+        choix = [
+            ('Marchés locaux, Pharmacie', 'Consultations'),
+            ('Pharmacie ; Internet', 'Consultations;Ateliers'),
+            ('Marchés locaux', None),
+        ]
+        for reponse, (lieu_achat, interet) in zip(reponses, choix):
+            reponse.lieu_achat, reponse.interet_services = lieu_achat, interet
+        cls.marches, cls.pharmacie_internet, cls.marches_seuls = ingestion.enregistrer(reponses)
+
+    def test_decouper(self):
+        self.assertEqual(options.decouper('A, B;C\nA'), ['A', 'B', 'C'])
+        self.assertEqual(options.decouper('  Marchés   locaux ,, ;'), ['Marchés locaux'])
+        self.assertEqual(options.decouper(None), [])
+        self.assertEqual(options.decouper(''), [])
+        self.assertEqual(options.decouper('x' * 500), ['x' * options.LONGUEUR_MAX])
+
+    def test_avec_options(self):
+        qs = ReponseQuestionnaire.objects.order_by('id')
+        self.assertEqual(
+            list(options.avec_options(qs, ('lieu_achat', 'Marchés locaux'))), [self.marches, self.marches_seuls],
+        )
+        self.assertEqual(
+            list(options.avec_options(qs, ('lieu_achat', 'Pharmacie'), ('interet_services', 'Ateliers'))),
+            [self.pharmacie_internet],
+        )
+        self.assertFalse(options.avec_options(qs, ('lieu_achat', 'Internet'), ('lieu_achat', 'Marchés locaux')).exists())
+        self.assertEqual(options.comptes('lieu_achat')[:2], [('Marchés locaux', 2), ('Pharmacie', 2)])
+
+    def test_resynchronisation_sans_doublon(self):
+        liens = ReponseOption.objects.count()
+        reponses = list(ReponseQuestionnaire.objects.all())
+        # Les liens existent déjà : ON CONFLICT DO NOTHING les ignore au lieu d'échouer
+        self.assertEqual(options.synchroniser(reponses), liens)
+        self.assertEqual(ReponseOption.objects.count(), liens)
+
+
+class ExportCsvTests(TestCase):
+    """Le CSV est le même, octet pour octet, par l'ORM et par COPY"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generateur = Generateur(13, timezone.now(), 30)
+        reponses = [generateur.reponse() for _ in range(5)]
+        reponses[0].nom, reponses[0].ville, reponses[0].age = '', None, None
+        reponses[1].suggestions = 'Ligne 1\r\nLigne "2", fin\rseul'
+        reponses[2].connait_med_naturelle = True
+        ingestion.enregistrer(reponses)
+        ReponseQuestionnaire.objects.filter(pk=ReponseQuestionnaire.objects.order_by('id').values('pk')[:1]).update(
+            created_at=datetime(2026, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc),
+        )
+
+    def test_format_orm(self):
+        lignes = b''.join(exports.encoder(exports.lignes_csv(exports.CHAMPS_EXPORT))).decode()
+        self.assertNotIn('\r\n', lignes.replace('\r\nLigne', ''))
+        entete, premiere = lignes.split('\n')[:2]
+        self.assertEqual(entete, ','.join(exports.CHAMPS_EXPORT))
+        valeurs = dict(zip(exports.CHAMPS_EXPORT, next(csv.reader([premiere]))))
+        self.assertEqual((valeurs['nom'], valeurs['ville'], valeurs['age']), ('', '', ''))
+        self.assertEqual(valeurs['created_at'], '2026-01-02T03:04:05.000000+00:00')
+        self.assertIn(valeurs['connait_med_naturelle'], ('True', 'False'))
+        self.assertIn('"Ligne 1\r\nLigne ""2"", fin\rseul"', lignes)
+        self.assertEqual(b''.join(exports.encoder(exports.lignes_csv(['nom']))).split(b'\n')[1], b'')
+
+    @skipUnless(exports.copie_disponible(), "COPY nécessite PostgreSQL et psycopg 3")
+    def test_copy_identique_a_l_orm(self):
+        for champs in (exports.CHAMPS_EXPORT, ['nom'], ['created_at', 'connait_med_naturelle', 'suggestions']):
+            with self.subTest(champs=champs):
+                self.assertEqual(
+                    b''.join(exports.lignes_csv_copy(champs)), b''.join(exports.encoder(exports.lignes_csv(champs))),
+                )
+
+    @skipUnless(exports.copie_disponible(), "COPY nécessite PostgreSQL et psycopg 3")
+    def test_copy_vu_par_les_wrappers(self):
+        compteur = metriques._CompteurSql()
+        connection.execute_wrappers.append(compteur)
+        try:
+            with CaptureQueriesContext(connection) as capture:
+                b''.join(exports.lignes_csv_copy(exports.CHAMPS_EXPORT))
+        finally:
+            connection.execute_wrappers.remove(compteur)
+        self.assertEqual(compteur.nombre, 1)
+        self.assertEqual(len(capture), 1)
+        self.assertTrue(capture.captured_queries[0]['sql'].startswith('COPY'))
+
+    def test_requete_hors_execute_signalee(self):
+        compteur = metriques._CompteurSql()
+        enregistreur = requetes_lentes._Enregistreur(RequestFactory().get('/'), seuil=100, expliquer=False)
+        connection.execute_wrappers.extend([compteur, enregistreur])
+        try:
+            with CaptureQueriesContext(connection) as capture, self.assertLogs(requetes_lentes.logger, 'WARNING') as journal:
+                metriques.signaler_requete(connection, 'COPY (SELECT 1) TO STDOUT', (), 10.0, 10.5, True)
+        finally:
+            connection.execute_wrappers.remove(compteur)
+            connection.execute_wrappers.remove(enregistreur)
+        self.assertEqual((compteur.nombre, compteur.duree), (1, 0.5))
+        self.assertEqual(json.loads(journal.records[0].getMessage())['duree_ms'], 500)
+        self.assertEqual(capture.captured_queries, [{'sql': 'COPY (SELECT 1) TO STDOUT', 'time': '0.500'}])
+
+
+class ExportVuesTests(TestCase):
+    """Exports servis par les vues : projection ?fields= et compression"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generateur = Generateur(23, timezone.now(), 30)
+        ingestion.enregistrer([generateur.reponse() for _ in range(4)])
+        cls.attendues = list(ReponseQuestionnaire.objects.order_by('id').values_list('nom', 'ville', 'age'))
+
+    def _telecharger(self, url, **parametres):
+        response = self.client.get(reverse(url), parametres, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_projection_et_gzip(self):
+        _, brut = self._telecharger('export_reponses_csv', fields='nom,ville,age')
+        response, compresse = self._telecharger('export_reponses_csv', fields='nom,ville,age', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(compresse), brut)
+
+        entete, *lignes = csv.reader(io.StringIO(brut.decode()))
+        self.assertEqual(entete, ['nom', 'ville', 'age'])
+        self.assertEqual(lignes, [['' if v is None else str(v) for v in ligne] for ligne in self.attendues])
+
+        self.assertEqual(self.client.get(reverse('export_reponses_csv'), {'fields': 'nom,inconnu'}, secure=True).status_code, 400)
+
+    @skipUnless(exports.pyarrow, "pyarrow n'est pas installé")
+    def test_parquet_et_arrow_relus_par_pyarrow(self):
+        pa = exports.pyarrow
+        lecteurs = {
+            'export_reponses_parquet': lambda contenu: pa.parquet.read_table(pa.BufferReader(contenu)),
+            'export_reponses_arrow': lambda contenu: pa.ipc.open_file(pa.BufferReader(contenu)).read_all(),
+        }
+        for url, lire in lecteurs.items():
+            with self.subTest(url=url):
+                _, contenu = self._telecharger(url, fields='nom,ville,age')
+                table = lire(contenu)
+                self.assertEqual(table.column_names, ['nom', 'ville', 'age'])
+                self.assertEqual([tuple(ligne.values()) for ligne in table.to_pylist()], self.attendues)
+
+
+class PdfViergeTests(TestCase):
+    """Questionnaire vierge revalidé par ETag / Last-Modified"""
+
+    def test_revalidation(self):
+        response = self.client.get(reverse('generate-pdf'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+        for entetes in (
+            {'HTTP_IF_NONE_MATCH': response['ETag']},
+            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+        ):
+            with self.subTest(entetes=entetes):
+                revalidee = self.client.get(reverse('generate-pdf'), secure=True, **entetes)
+                self.assertEqual(revalidee.status_code, 304)
+                self.assertEqual(revalidee.content, b'')
+        self.assertEqual(
+            self.client.get(reverse('generate-pdf'), secure=True, HTTP_IF_NONE_MATCH='"autre"').status_code, 200,
+        )
+
+
+class FormulairePdfTests(DossiersTemporairesMixin, TestCase):
+    """Construction du questionnaire interactif et nettoyage des versions précédentes"""
+    dossiers = {'FORMULAIRE_PDF_DIR': 'formulaire'}
+
+    def test_build_supprime_les_anciennes_versions(self):
+        anciens = [
+            os.path.join(settings.FORMULAIRE_PDF_DIR, f'{utils.NOM_FICHIER}-{version}.pdf')
+            for version in ('0123456789abcdef', 'fedcba9876543210')
+        ]
+        autre = os.path.join(settings.FORMULAIRE_PDF_DIR, 'autre.pdf')
+        for fichier in (*anciens, autre):
+            open(fichier, 'wb').close()
+
+        call_command('build_formulaire_pdf', stdout=io.StringIO())
+        self.assertEqual(sorted(os.listdir(settings.FORMULAIRE_PDF_DIR)), sorted(['autre.pdf', os.path.basename(utils.chemin())]))
+
+
+class CacheVuesTests(TestCase):
+    """Clés du cache des vues : seuls les paramètres lus par la vue comptent"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_parametres_inconnus_ignores(self):
+        url = reverse('liste_reponses')
+        self.client.get(url, {'taille': 5}, secure=True)
+        for junk in range(3):
+            with self.subTest(junk=junk), self.assertNumQueries(0):
+                self.client.get(url, {'x': junk, 'taille': 5}, secure=True)
+
+    def test_ordre_stable(self):
+        requete = RequestFactory().get('/reponses/', {'taille': '5', 'x': '1', 'apres': 'c'})
+        inverse = RequestFactory().get('/reponses/?x=2&apres=c&taille=5')
+        parametres = ('apres', 'avant', 'taille')
+        self.assertEqual(cle_vue(requete, parametres), '/reponses/?apres=c&taille=5')
+        self.assertEqual(cle_vue(inverse, parametres), cle_vue(requete, parametres))
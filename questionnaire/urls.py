@@ -1,23 +1,42 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Mode asynchrone : les formulaires valides sont écrits par lots en arrière-plan
+vue_formulaire = views.remplir_formulaire_async if settings.SOUMISSION_ASYNC else views.remplir_formulaire
+
 
 urlpatterns = [
     # Page d'accueil du questionnaire
     path('', views.home, name='questionnaire'),
 
     # Formulaire principal
-    path('questionnaire/', views.remplir_formulaire, name='questionnaire_view'),
-    path('remplir/', views.remplir_formulaire, name='remplir_formulaire'),
+    path('questionnaire/', vue_formulaire, name='questionnaire_view'),
+    path('remplir/', vue_formulaire, name='remplir_formulaire'),
 
     # Page de remerciement après soumission
     path('merci/', views.merci, name='merci'),
 
-    # PDF et export CSV
+    # PDF et exports (CSV, Parquet, Arrow)
     path('generate-pdf/', views.generate_pdf, name='generate-pdf'),
+    path('formulaire-interactif/', views.formulaire_pdf_interactif, name='formulaire_pdf_interactif'),
     path('generate-pdf/<int:id>/', views.generate_pdf_from_response, name='generate_pdf_from_response'),
+    path('export-pdf-zip/', views.export_reponses_pdf_zip, name='export_reponses_pdf_zip'),
 
     path('export-csv/', views.export_reponses_csv, name='export_reponses_csv'),
+    path('export-parquet/', views.export_reponses_colonnaire, {'format': 'parquet'}, name='export_reponses_parquet'),
+    path('export-arrow/', views.export_reponses_colonnaire, {'format': 'arrow'}, name='export_reponses_arrow'),
+
+    # Synchronisation des tablettes hors ligne
+    path('api/reponses/lot/', views.api_soumettre_lot, name='api_soumettre_lot'),
+
+    # Tâches en arrière-plan (exports lourds)
+    path('taches/<str:type>/', views.creer_tache, name='creer_tache'),
+    path('taches/<uuid:cle>/statut/', views.statut_tache, name='statut_tache'),
+    path('taches/<uuid:cle>/resultat/', views.resultat_tache, name='resultat_tache'),
+
+    # Métriques Prometheus (tous les workers)
+    path('metrics', views.metriques_prometheus, name='metriques'),
 
     # Dashboard
     path('dashboard/', views.dashboard, name='dashboard'),
@@ -1,98 +1,142 @@
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.lib import colors
-
-file_name = "Questionnaire_Medecine_Naturelle_Interactif.pdf"
-c = canvas.Canvas(file_name, pagesize=A4)
-width, height = A4
-margin = 2*cm
-y = height - margin
-
-# Fonction pour écrire un titre de section
-def add_section_title(title, y_pos):
-    c.setFillColor(colors.green)
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(margin, y_pos, title)
-    return y_pos - 1*cm
-
-# Fonction pour écrire question simple
-def add_question(question, y_pos):
-    c.setFillColor(colors.black)
-    c.setFont("Helvetica", 12)
-    c.drawString(margin, y_pos, question)
-    return y_pos - 0.7*cm
-
-# Fonction pour ajouter cases à cocher interactives
-def add_checkbox(question, options, y_pos, field_prefix):
-    y_pos = add_question(question, y_pos)
-    c.setFont("Helvetica", 12)
-    for i, option in enumerate(options):
-        field_name = f"{field_prefix}_{i}"
-        c.acroForm.checkbox(
-            name=field_name,
-            tooltip=option,
-            x=margin,
-            y=y_pos - 0.2*cm,
-            size=12,
-            borderStyle='solid',
-            borderWidth=1,
-            fillColor=colors.white,
-            textColor=colors.black,
-            buttonStyle='check'
-        )
-        c.drawString(margin + 0.6*cm, y_pos, option)
-        y_pos -= 0.7*cm
-    return y_pos
-
-# --- Création du PDF ---
-
-# Titre principal
-c.setFont("Helvetica-Bold", 16)
-c.setFillColor(colors.darkblue)
-c.drawString(margin, y, "Questionnaire Étude de Marché – Médecine Naturelle au Sénégal")
-y -= 1.5*cm
-
-# Section 1
-y = add_section_title("Section 1 : Informations générales", y)
-y = add_question("Nom (facultatif) : ___________________________", y)
-y = add_question("Âge : ____ ans", y)
-y = add_checkbox("Sexe :", ["Homme", "Femme", "Autre"], y, "gender")
-y -= 1*cm
-y = add_question("Ville/Région : ___________________________", y)
-y = add_question("Profession : ___________________________", y)
-y -= 1*cm
-
-# Section 2
-y = add_section_title("Section 2 : Connaissance et utilisation", y)
-y = add_checkbox("Connaissez-vous la médecine naturelle ?", ["Oui", "Non"], y, "know_natural")
-y = add_checkbox("Avez-vous déjà utilisé des plantes médicinales ?", ["Oui, régulièrement", "Oui, parfois", "Non, jamais"], y, "used_plants")
-y = add_checkbox("Si oui, pour quels types de soins ?", ["Digestion", "Stress / sommeil", "Vitalité / énergie", "Soins de la peau / cheveux", "Autre: __________"], y, "care_type")
-y -= 1*cm
-
-# Section 3
-y = add_section_title("Section 3 : Fréquence et préférences", y)
-y = add_checkbox("À quelle fréquence utilisez-vous des produits naturels ?", ["Quotidiennement", "Hebdomadairement", "Mensuellement", "Rarement"], y, "frequency")
-y = add_checkbox("Où achetez-vous principalement ces produits ?", ["Marchés locaux", "Pharmacies", "Boutiques spécialisées", "En ligne", "Autre: __________"], y, "purchase_place")
-y = add_checkbox("Préférez-vous :", ["Produits bruts", "Produits transformés", "Peu importe"], y, "product_type")
-y -= 1*cm
-
-# Section 4
-y = add_section_title("Section 4 : Motivations et attentes", y)
-y = add_checkbox("Quelles sont vos principales motivations ?", ["Prévention santé", "Remèdes alternatifs", "Bien-être général", "Tradition / culture", "Autre: __________"], y, "motivations")
-y = add_question("Quels critères sont importants pour l'achat de produits naturels ? ___________________________", y)
-y -= 1*cm
-
-# Section 5
-y = add_section_title("Section 5 : Intérêt pour les services", y)
-y = add_checkbox("Seriez-vous intéressé(e) par :", ["Consultations", "Formations / ateliers", "Abonnements produits naturels", "Conseils personnalisés"], y, "services")
-y = add_checkbox("Combien seriez-vous prêt(e) à payer ?", ["< 5 000 FCFA", "5 000 – 10 000 FCFA", "10 000 – 20 000 FCFA", "> 20 000 FCFA"], y, "price")
-y -= 1*cm
-
-# Section 6
-y = add_section_title("Section 6 : Suggestions", y)
-y = add_question("Quels types de produits ou services souhaiteriez-vous voir développés ? ___________________________", y)
-y = add_question("Autres commentaires : ___________________________", y)
-
-c.save()
-print(f"PDF interactif généré : {file_name}")
+"""
+Questionnaire PDF interactif (cases à cocher AcroForm).
+
+Les options des questions à choix viennent des ``choices`` du modèle
+``ReponseQuestionnaire`` (les champs à choix multiples, en texte libre dans
+le modèle, ont leur liste ici). Importer ce module ne dessine rien : le PDF
+est construit au premier besoin, ou à la construction de l'application avec
+``manage.py build_formulaire_pdf``, puis servi depuis ``FORMULAIRE_PDF_DIR``.
+Le nom du fichier contient la version (empreinte des sections) : modifier
+une question ou un choix du modèle produit un nouveau fichier.
+"""
+import glob
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.db import models
+
+from questionnaire import pdf
+from questionnaire.models import ReponseQuestionnaire
+
+NOM_FICHIER = "Questionnaire_Medecine_Naturelle_Interactif"
+
+# Questions par section : (champ du modèle, libellé). Un champ None est une ligne de texte seule.
+SECTIONS = [
+    ("Section 1 : Informations générales", [
+        ('nom', "Nom (facultatif) : ___________________________"),
+        ('age', "Âge : ____ ans"),
+        ('sexe', "Sexe :"),
+        ('ville', "Ville/Région : ___________________________"),
+        ('profession', "Profession : ___________________________"),
+    ]),
+    ("Section 2 : Connaissance et utilisation", [
+        ('connait_med_naturelle', "Connaissez-vous la médecine naturelle ?"),
+        ('utilise_plantes', "Avez-vous déjà utilisé des plantes médicinales ?"),
+        ('types_soins', "Si oui, pour quels types de soins ?"),
+    ]),
+    ("Section 3 : Fréquence et préférences", [
+        ('frequence', "À quelle fréquence utilisez-vous des produits naturels ?"),
+        ('lieu_achat', "Où achetez-vous principalement ces produits ?"),
+        ('type_produit', "Préférez-vous :"),
+    ]),
+    ("Section 4 : Motivations et attentes", [
+        ('motivations', "Quelles sont vos principales motivations ?"),
+        ('criteres_achat', "Quels critères sont importants pour l'achat de produits naturels ? ___________________________"),
+    ]),
+    ("Section 5 : Intérêt pour les services", [
+        ('interet_services', "Seriez-vous intéressé(e) par :"),
+        ('montant_pret', "Combien seriez-vous prêt(e) à payer ?"),
+    ]),
+    ("Section 6 : Suggestions", [
+        ('suggestions', "Quels types de produits ou services souhaiteriez-vous voir développés ? ___________________________"),
+        ('commentaires', "Autres commentaires : ___________________________"),
+    ]),
+]
+
+# Options proposées pour les champs à choix multiples (texte libre dans le modèle)
+OPTIONS_MULTIPLES = {
+    'types_soins': ["Digestion", "Stress / sommeil", "Vitalité / énergie", "Soins de la peau / cheveux", "Autre: __________"],
+    'lieu_achat': ["Marchés locaux", "Pharmacies", "Boutiques spécialisées", "En ligne", "Autre: __________"],
+    'motivations': ["Prévention santé", "Remèdes alternatifs", "Bien-être général", "Tradition / culture", "Autre: __________"],
+    'interet_services': ["Consultations", "Formations / ateliers", "Abonnements produits naturels", "Conseils personnalisés"],
+}
+
+_verrou = threading.Lock()
+
+
+def options(champ):
+    """Options à cocher d'un champ, ou None pour une question à réponse libre"""
+    field = ReponseQuestionnaire._meta.get_field(champ)
+    if field.choices:
+        return [str(libelle) for _, libelle in field.choices]
+    if isinstance(field, models.BooleanField):
+        return ["Oui", "Non"]
+    return OPTIONS_MULTIPLES.get(champ)
+
+
+def sections():
+    """Sections au format de ``pdf.dessiner_formulaire_interactif``"""
+    resultat = []
+    for titre, questions in SECTIONS:
+        items = []
+        for champ, libelle in questions:
+            choix = options(champ)
+            items.append((libelle, choix, champ) if choix else libelle)
+        resultat.append((titre, items))
+    return resultat
+
+
+def version():
+    """Empreinte des sections et de la mise en page"""
+    definition = json.dumps([pdf.VERSION_MISE_EN_PAGE, pdf.TITRE_QUESTIONNAIRE, sections()], ensure_ascii=False)
+    return hashlib.sha256(definition.encode()).hexdigest()[:16]
+
+
+def construire(sortie):
+    """Dessine le questionnaire interactif dans ``sortie`` (fichier ou tampon)"""
+    pdf.dessiner_formulaire_interactif(sortie, pdf.TITRE_QUESTIONNAIRE, sections())
+
+
+def chemin():
+    """Emplacement du PDF construit pour la version courante"""
+    return os.path.join(settings.FORMULAIRE_PDF_DIR, f"{NOM_FICHIER}-{version()}.pdf")
+
+
+def formulaire_interactif(forcer=False):
+    """
+    Chemin du PDF interactif, construit s'il n'existe pas encore (ou si ``forcer``).
+    """
+    fichier = chemin()
+    if os.path.exists(fichier) and not forcer:
+        return fichier
+    with _verrou:
+        if os.path.exists(fichier) and not forcer:
+            return fichier
+        tampon = io.BytesIO()
+        construire(tampon)
+        os.makedirs(settings.FORMULAIRE_PDF_DIR, exist_ok=True)
+        descripteur, temporaire = tempfile.mkstemp(dir=settings.FORMULAIRE_PDF_DIR, suffix='.tmp')
+        with os.fdopen(descripteur, 'wb') as sortie:
+            sortie.write(tampon.getvalue())
+        os.replace(temporaire, fichier)
+    return fichier
+
+
+def supprimer_anciennes_versions():
+    """Supprime les PDF des versions précédentes ; retourne les chemins supprimés"""
+    courant = chemin()
+    supprimes = []
+    for fichier in glob.glob(os.path.join(glob.escape(settings.FORMULAIRE_PDF_DIR), f"{NOM_FICHIER}-*.pdf")):
+        if fichier == courant:
+            continue
+        try:
+            os.remove(fichier)
+        except FileNotFoundError:
+            continue
+        supprimes.append(fichier)
+    return supprimes
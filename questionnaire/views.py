@@ -1,20 +1,27 @@
-import csv
-import io
+import json
 import logging
-
-from django.db import connection
-from django.db.models import Avg, Count
-from django.http import HttpResponse, JsonResponse
+import os
+import zlib
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.db import connection, transaction
+from django.http import FileResponse, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render, get_object_or_404
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_POST
 
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.pdfgen import canvas
-
+from questionnaire import (
+    cache_pdf, ecriture_differee, exports, ingestion, metriques, pagination, pdf, rollups, taches, utils,
+)
+from questionnaire.cache import cache_vue
 from questionnaire.forms import QuestionnaireForm
-from questionnaire.models import ReponseQuestionnaire
+from questionnaire.models import ReponseQuestionnaire, Tache
 
 # --------------------------------------------------------------------
 # 🧩 Configuration du logger
@@ -41,11 +48,14 @@ def remplir_formulaire(request):
 
     if request.method == "POST":
         form = QuestionnaireForm(request.POST)
-        logger.info("Méthode POST reçue, données : %s", request.POST.dict())
+        # Jamais le contenu : les réponses sont des données personnelles
+        logger.info("Méthode POST reçue (%d champs)", len(request.POST))
 
         if form.is_valid():
             try:
-                form.save()
+                # La réponse et ses compteurs du tableau de bord sont enregistrés ensemble
+                with transaction.atomic():
+                    form.save()
                 logger.info("Formulaire enregistré avec succès ✅")
                 return redirect('/merci/')
             except Exception as e:
@@ -55,7 +65,7 @@ def remplir_formulaire(request):
                     "error_message": "Erreur interne lors de l'enregistrement du formulaire."
                 })
         else:
-            logger.warning("Formulaire invalide ! Erreurs : %s", form.errors)
+            logger.warning("Formulaire invalide ! Champs en erreur : %s", list(form.errors))
             return render(request, "questionnaire/formulaire.html", {
                 "form": form,
                 "error_message": "Le formulaire contient des erreurs. Merci de vérifier vos réponses."
@@ -65,42 +75,83 @@ def remplir_formulaire(request):
         return render(request, "questionnaire/formulaire.html", {"form": form})
 
 
+async def remplir_formulaire_async(request):
+    """
+    Variante de remplir_formulaire pour le mode asynchrone (SOUMISSION_ASYNC, ASGI).
+    Le formulaire est validé sur la boucle d'événements, sans accès à la base,
+    puis la réponse part dans la file d'écriture différée. File pleine :
+    enregistrement synchrone comme dans remplir_formulaire.
+    """
+    if request.method == "POST":
+        form = QuestionnaireForm(request.POST)
+        if form.is_valid() and ecriture_differee.soumettre(form.save(commit=False)):
+            return redirect('/merci/')
+
+    # Affichage, formulaire invalide ou file pleine : chemin synchrone habituel
+    return await sync_to_async(remplir_formulaire)(request)
+
+
 def merci(request):
     """Page de remerciement après soumission"""
     return render(request, 'questionnaire/merci.html')
 
 
 # --------------------------------------------------------------------
-# ✅ 3. EXPORT CSV
+# ✅ 3. EXPORTS (CSV, Parquet, Arrow)
 # --------------------------------------------------------------------
 def export_reponses_csv(request):
-    """Exporte les réponses au questionnaire au format CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="reponses_questionnaire.csv"'
+    """
+    Exporte les réponses au questionnaire au format CSV, en flux continu.
+    Paramètres optionnels : ``?fields=nom,ville,age`` pour ne garder que
+    certaines colonnes, ``?gzip=1`` pour compresser le fichier.
+    """
+    try:
+        champs = exports.champs_demandes(request.GET.get('fields'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
 
-    writer = csv.writer(response)
-    fields = [f.name for f in ReponseQuestionnaire._meta.get_fields() if not f.many_to_many and not f.one_to_many]
-    writer.writerow(fields)
+    compresse = request.GET.get('gzip', '').lower() in ('1', 'true', 'oui')
+    if compresse:
+        content_type, nom_fichier = 'application/gzip', 'reponses_questionnaire.csv.gz'
+    else:
+        content_type, nom_fichier = 'text/csv', 'reponses_questionnaire.csv'
+
+    response = StreamingHttpResponse(exports.flux_csv(champs, compresse=compresse), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+    return response
 
-    for rep in ReponseQuestionnaire.objects.all():
-        writer.writerow([getattr(rep, field, '') for field in fields])
 
+def export_reponses_colonnaire(request, format):
+    """
+    Exporte les réponses au format Parquet ou Arrow IPC pour l'analyse (pandas, etc.).
+    Accepte la même projection ``?fields=`` que l'export CSV.
+    """
+    try:
+        champs = exports.champs_demandes(request.GET.get('fields'))
+        flux = exports.flux_colonnaire(format, champs)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    except exports.ExportIndisponible as e:
+        return HttpResponse(str(e), status=501)
+
+    content_type, extension = exports.FORMATS_COLONNAIRES[format]
+    response = StreamingHttpResponse(flux, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="reponses_questionnaire.{extension}"'
     return response
 
 
 # --------------------------------------------------------------------
 # ✅ 4. DASHBOARD
 # --------------------------------------------------------------------
+@cache_vue('dashboard')
 def dashboard(request):
-    total_reponses = ReponseQuestionnaire.objects.count()
-    moyenne_age = ReponseQuestionnaire.objects.aggregate(Avg('age'))['age__avg'] or 0
-    repartition_sexe = ReponseQuestionnaire.objects.values('sexe').annotate(total=Count('sexe'))
+    """Tableau de bord, lu dans les compteurs agrégés par jour (voir questionnaire.rollups)"""
+    stats_reponses = rollups.statistiques()
 
     context = {
-        'total_reponses': total_reponses,
-        'moyenne_age': round(moyenne_age, 1),
-        'labels': [r['sexe'] for r in repartition_sexe],
-        'data': [r['total'] for r in repartition_sexe],
+        'total_reponses': stats_reponses['total'],
+        'moyenne_age': round(stats_reponses['moyenne_age'], 1),
+        'repartitions': stats_reponses['repartitions'],
     }
     return render(request, 'questionnaire/dashboard.html', context)
 
@@ -108,127 +159,253 @@ def dashboard(request):
 # --------------------------------------------------------------------
 # ✅ 5. LISTE DES RÉPONSES
 # --------------------------------------------------------------------
+# Colonnes affichées dans liste_reponses.html : on ne charge rien d'autre
+COLONNES_LISTE = ('id', 'nom', 'ville', 'age', 'sexe', 'created_at')
+
+
+@cache_vue('liste_reponses', parametres=('apres', 'avant', 'taille'))
 def liste_reponses(request):
-    """Affiche toutes les réponses"""
-    reponses = ReponseQuestionnaire.objects.all().order_by('-created_at')
-    return render(request, 'questionnaire/liste_reponses.html', {'reponses': reponses})
+    """
+    Affiche les réponses, des plus récentes aux plus anciennes, page par page.
+    Pagination par curseur (?apres= / ?avant=) et taille de page configurable (?taille=).
+    """
+    try:
+        taille = int(request.GET.get('taille', settings.LISTE_REPONSES_TAILLE_PAGE))
+    except ValueError:
+        return HttpResponseBadRequest("Taille de page invalide")
+    taille = max(1, min(taille, settings.LISTE_REPONSES_TAILLE_MAX))
+
+    try:
+        reponses, suivant, precedent = pagination.page_keyset(
+            ReponseQuestionnaire.objects.values(*COLONNES_LISTE),
+            apres=request.GET.get('apres'),
+            avant=request.GET.get('avant'),
+            taille=taille,
+        )
+    except pagination.CurseurInvalide as e:
+        return HttpResponseBadRequest(str(e))
+
+    return render(request, 'questionnaire/liste_reponses.html', {
+        'reponses': reponses,
+        'curseur_suivant': suivant,
+        'curseur_precedent': precedent,
+        'taille': taille,
+    })
 
 
 # --------------------------------------------------------------------
-# ✅ 6. GÉNÉRATION PDF (questionnaire vierge)
+# ✅ 6. GÉNÉRATION PDF (questionnaire vierge, fiches des réponses)
 # --------------------------------------------------------------------
-def check_page_space(y, c, min_space=5 * cm):
-    """Crée une nouvelle page si la zone d'écriture est presque pleine"""
-    if y < min_space:
-        c.showPage()
-        y = 27 * cm
-    return y
+def _etag_pdf_vierge(request):
+    return pdf.version_vierge()
+
+
+def _date_pdf_vierge(request):
+    return pdf.DATE_MODIFICATION
 
 
+@condition(etag_func=_etag_pdf_vierge, last_modified_func=_date_pdf_vierge)
 def generate_pdf(request):
-    """Génère un PDF vierge du questionnaire"""
-    response = HttpResponse(content_type="application/pdf")
+    """
+    Questionnaire vierge, rendu une fois par processus (voir questionnaire.pdf).
+    Les téléchargements répétés reçoivent 304 grâce à l'ETag / Last-Modified.
+    """
+    response = HttpResponse(pdf.questionnaire_vierge(), content_type="application/pdf")
     response["Content-Disposition"] = 'attachment; filename="questionnaire.pdf"'
+    patch_cache_control(response, public=True, max_age=3600)
+    return response
+
 
-    c = canvas.Canvas(response, pagesize=A4)
-    width, height = A4
-
-    def add_title(title, y):
-        c.setFont("Helvetica-Bold", 16)
-        c.setFillColor(colors.darkblue)
-        c.drawString(2 * cm, y, title)
-        return y - 1.5 * cm
-
-    def add_section_title(title, y):
-        c.setFont("Helvetica-Bold", 14)
-        c.setFillColor(colors.green)
-        c.drawString(2 * cm, y, title)
-        return y - 1 * cm
-
-    def add_question(question, y):
-        c.setFont("Helvetica", 12)
-        c.setFillColor(colors.black)
-        c.drawString(2.5 * cm, y, f"- {question}")
-        return y - 1 * cm
-
-    def add_checkbox(question, options, y):
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(2.5 * cm, y, f"- {question}")
-        y -= 0.8 * cm
-
-        c.setFont("Helvetica", 12)
-        for opt in options:
-            c.setFillColor(colors.white)
-            c.setStrokeColor(colors.black)
-            c.rect(3 * cm, y - 0.3 * cm, 0.4 * cm, 0.4 * cm, fill=1)
-            c.setFillColor(colors.black)
-            c.drawString(3.6 * cm, y - 0.2 * cm, opt)
-            y -= 0.8 * cm
-
-        return y - 0.3 * cm
-
-    # --- Structure du PDF ---
-    y = 27 * cm
-    y = add_title("Questionnaire Étude de Marché – Médecine Naturelle au Sénégal", y)
-
-    sections = [
-        ("Section 1 : Informations générales", [
-            "Nom : ___________________________",
-            "Âge : ___________________________",
-            "Sexe : ___________________________",
-            "Profession : ___________________________"
-        ]),
-        ("Section 2 : Habitudes de consommation", [
-            ("Achetez-vous régulièrement des produits naturels ?", ["Oui", "Non"]),
-            ("Si oui, où les achetez-vous ?", ["Pharmacie", "Marché", "En ligne", "Autre"]),
-            "Quels types de produits naturels consommez-vous ? ___________________________"
-        ]),
-    ]
-
-    for title, items in sections:
-        y = check_page_space(y, c)
-        y = add_section_title(title, y)
-        for item in items:
-            if isinstance(item, tuple):
-                y = add_checkbox(item[0], item[1], y)
-            else:
-                y = add_question(item, y)
-        y -= 0.5 * cm
-
-    c.save()
+@condition(etag_func=lambda request: utils.version())
+def formulaire_pdf_interactif(request):
+    """
+    Questionnaire PDF à remplir à l'écran, construit une fois (voir questionnaire.utils
+    et manage.py build_formulaire_pdf) puis servi depuis le disque.
+    """
+    fichier = utils.formulaire_interactif()
+    response = FileResponse(open(fichier, 'rb'), as_attachment=True,
+                            filename=f"{utils.NOM_FICHIER}.pdf", content_type="application/pdf")
+    patch_cache_control(response, public=True, max_age=3600)
     return response
 
+
+def rendre_connexion():
+    """
+    Avec le pool de connexions, rend tout de suite la connexion de la requête
+    avant un long travail sans base (hors transaction ; rouverte au besoin).
+    """
+    if connection.settings_dict['OPTIONS'].get('pool') and not connection.in_atomic_block:
+        connection.close()
+
+
 def generate_pdf_from_response(request, id):
-    """Génère un PDF contenant les réponses d'une personne spécifique."""
+    """
+    PDF contenant les réponses d'une personne spécifique.
+    La fiche est rendue une fois puis servie depuis le cache disque (voir questionnaire.cache_pdf).
+    """
     reponse = get_object_or_404(ReponseQuestionnaire, id=id)
+    # Le rendu reportlab n'a plus besoin de la base : la connexion retourne au pool
+    rendre_connexion()
+    # FileResponse ferme le fichier à la fin de l'envoi
+    return FileResponse(
+        cache_pdf.ouvrir(reponse), as_attachment=True, filename=f"reponse_{id}.pdf", content_type="application/pdf",
+    )
+
 
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = f'attachment; filename="reponse_{id}.pdf"'
+def export_reponses_pdf_zip(request):
+    """
+    Archive ZIP des fiches PDF des réponses, rendues en parallèle et envoyées en flux.
+    Filtres optionnels : ``?depuis=``, ``?jusqua=``, ``?ville=``, ``?sexe=``, ``?ids=1,2,3``.
+    """
+    try:
+        queryset = exports.filtrer(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
 
-    c = canvas.Canvas(response, pagesize=A4)
-    y = 27 * cm
+    flux = exports.flux_zip_pdf(queryset, processus=settings.PDF_PROCESSUS)
+    response = StreamingHttpResponse(flux, content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="reponses_pdf.zip"'
+    return response
 
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(2 * cm, y, "Réponse au Questionnaire")
-    y -= 1 * cm
 
-    c.setFont("Helvetica", 12)
-    for field in ReponseQuestionnaire._meta.fields:
-        name = field.verbose_name
-        value = getattr(reponse, field.name)
-        c.drawString(2 * cm, y, f"{name}: {value}")
-        y -= 0.6 * cm
-        if y < 3 * cm:
-            c.showPage()
-            y = 27 * cm
+# --------------------------------------------------------------------
+# ✅ 7. API DE SYNCHRONISATION (tablettes hors ligne)
+# --------------------------------------------------------------------
+def lire_corps_json(request, taille_max):
+    """Lit le corps JSON d'une requête, éventuellement compressé (Content-Encoding: gzip)"""
+    corps = request.body
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        decompresseur = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            corps = decompresseur.decompress(corps, taille_max)
+        except zlib.error as e:
+            raise ValueError(f"Corps gzip invalide : {e}")
+        if decompresseur.unconsumed_tail:
+            raise RequestDataTooBig("Lot trop volumineux une fois décompressé")
+    if len(corps) > taille_max:
+        raise RequestDataTooBig("Lot trop volumineux")
+    return json.loads(corps)
+
+
+@csrf_exempt
+@require_POST
+def api_soumettre_lot(request):
+    """
+    Reçoit en une fois les questionnaires saisis hors ligne par une tablette.
+    Corps : tableau JSON (gzip accepté) de {"cle": "...", "donnees": {...}} ;
+    réponse : un résultat par élément (cree / doublon / invalide).
+    Exige « Authorization: Bearer <API_SYNC_TOKEN> » ; fermée si aucun jeton
+    n'est configuré, sauf ouverture explicite (API_SYNC_OUVERTE, en local).
+    """
+    jeton = settings.API_SYNC_TOKEN
+    if not jeton and not settings.API_SYNC_OUVERTE:
+        return JsonResponse({'erreur': "API de synchronisation non configurée"}, status=503)
+    if jeton and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {jeton}'):
+        return JsonResponse({'erreur': "Jeton d'accès invalide"}, status=401)
+
+    try:
+        elements = lire_corps_json(request, settings.API_LOT_TAILLE_MAX)
+    except RequestDataTooBig as e:
+        return JsonResponse({'erreur': str(e)}, status=413)
+    except ValueError as e:
+        return JsonResponse({'erreur': f"JSON invalide : {e}"}, status=400)
+
+    if not isinstance(elements, list):
+        return JsonResponse({'erreur': "Un tableau JSON est attendu"}, status=400)
+    if len(elements) > settings.API_LOT_MAX:
+        return JsonResponse({'erreur': f"{settings.API_LOT_MAX} questionnaires maximum par lot"}, status=413)
+
+    resultats = ingestion.soumettre_lot(elements)
+    statuts = Counter(r['statut'] for r in resultats)
+    logger.info("Lot reçu : %s", dict(statuts))
+    return JsonResponse({
+        'crees': statuts['cree'],
+        'doublons': statuts['doublon'],
+        'invalides': statuts['invalide'],
+        'resultats': resultats,
+    })
+
+
+# --------------------------------------------------------------------
+# ✅ 8. TÂCHES EN ARRIÈRE-PLAN (exports lourds, manage.py run_workers)
+# --------------------------------------------------------------------
+def _etat_tache(request, tache):
+    etat = {
+        'cle': str(tache.cle),
+        'type': tache.type,
+        'statut': tache.statut,
+        'progression': tache.progression,
+        'total': tache.total,
+        'erreur': tache.erreur or None,
+        'url_statut': request.build_absolute_uri(reverse('statut_tache', args=[tache.cle])),
+        'url_resultat': None,
+    }
+    if tache.statut == Tache.TERMINEE:
+        etat['url_resultat'] = request.build_absolute_uri(reverse('resultat_tache', args=[tache.cle]))
+    return etat
+
+
+@require_POST
+def creer_tache(request, type):
+    """
+    Met un export en file (export_csv, export_parquet, export_arrow, export_pdf_zip).
+    Paramètres (formulaire ou chaîne de requête) : ceux des exports synchrones
+    (fields, gzip) et les filtres depuis, jusqua, ville, sexe, ids.
+    Répond 202 avec l'URL de suivi, qui porte la clé aléatoire de la tâche
+    (jamais son id séquentiel) : seul le demandeur la connaît.
+    """
+    parametres = {**request.GET.dict(), **request.POST.dict()}
+    parametres.pop('csrfmiddlewaretoken', None)
+    try:
+        tache = taches.creer(type, parametres)
+    except ValueError as e:
+        return JsonResponse({'erreur': str(e)}, status=400)
+    except exports.ExportIndisponible as e:
+        return JsonResponse({'erreur': str(e)}, status=501)
+    return JsonResponse(_etat_tache(request, tache), status=202)
+
+
+def statut_tache(request, cle):
+    """État et progression d'une tâche (à interroger périodiquement)"""
+    return JsonResponse(_etat_tache(request, get_object_or_404(Tache, cle=cle)))
 
-    c.save()
-    return response
 
+def resultat_tache(request, cle):
+    """Télécharge le fichier produit par une tâche terminée"""
+    tache = get_object_or_404(Tache, cle=cle)
+    if tache.statut != Tache.TERMINEE:
+        return JsonResponse(_etat_tache(request, tache), status=409)
+    try:
+        fichier = open(taches.chemin_resultat(tache), 'rb')
+    except FileNotFoundError:
+        return JsonResponse({'erreur': "Résultat expiré ou supprimé"}, status=410)
+    return FileResponse(fichier, as_attachment=True, filename=os.path.basename(tache.resultat))
+
+
+# --------------------------------------------------------------------
+# ✅ 9. MÉTRIQUES (format Prometheus)
+# --------------------------------------------------------------------
+ADRESSES_LOCALES = ('127.0.0.1', '::1')
+
+
+def metriques_prometheus(request):
+    """
+    Métriques de tous les processus du serveur, pour Prometheus.
+    Accessible en local, ou avec « Authorization: Bearer <METRIQUES_TOKEN> ».
+    """
+    jeton = settings.METRIQUES_TOKEN
+    autorise = request.META.get('REMOTE_ADDR') in ADRESSES_LOCALES or (
+        jeton and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {jeton}')
+    )
+    if not autorise:
+        return HttpResponse(status=403)
+    return HttpResponse(
+        metriques.format_prometheus(metriques.agreger()), content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
 
 
 # --------------------------------------------------------------------
-# ✅ 7. TESTS ET OUTILS TECHNIQUES
+# ✅ 10. TESTS ET OUTILS TECHNIQUES
 # --------------------------------------------------------------------
 @csrf_exempt
 def test_post(request):
@@ -253,7 +430,7 @@ def test_db_connection(request):
 
 
 # --------------------------------------------------------------------
-# ✅ 8. PAGES D’ERREUR
+# ✅ 11. PAGES D’ERREUR
 # --------------------------------------------------------------------
 def custom_404(request, exception):
     return render(request, 'questionnaire/404.html', status=404)